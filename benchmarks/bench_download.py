@@ -0,0 +1,126 @@
+"""
+Download a fake course served from a local server end to end and measure the throughput, the time
+spent parsing pages and the peak memory. Save the results of a run and compare later runs against
+them to check a change without touching the real site.
+
+    python benchmarks/bench_download.py --workers 4 --output baseline.json
+    python benchmarks/bench_download.py --workers 4 --baseline baseline.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+from contextlib import nullcontext
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from requests import Session  # noqa: E402
+from benchmarks.fake_site import FakeSite, SiteConfig  # noqa: E402
+from cwm_downloader.async_backend import BACKENDS, AsyncBackend  # noqa: E402
+from cwm_downloader.retry import RetryPolicy, configure_retries, retry_stats  # noqa: E402
+from cwm_downloader.scraper._scraper import DEFAULT_PARSER, PARSERS  # noqa: E402
+from cwm_downloader.scraper.course_scraper import Course  # noqa: E402
+from cwm_downloader.scraper.lecture_scraper import EXTRACTORS  # noqa: E402
+from cwm_downloader.telemetry import get_peak_memory, telemetry  # noqa: E402
+
+# The results that are compared against a baseline and whether a bigger value is better
+COMPARED_RESULTS = {
+    'elapsed': False,
+    'megabytes_per_second': True,
+    'parse_total': False,
+    'parse_p50': False,
+    'peak_memory_mb': False
+}
+
+
+def download_course(site: FakeSite, args: argparse.Namespace) -> Dict[str, Any]:
+    """ Download the course of the site once in to a temporary directory and get the measurements of the run. """
+    telemetry.configure(True)
+    retry_stats.reset()
+    session = Session()
+    with tempfile.TemporaryDirectory() as base_dir, \
+            (AsyncBackend(session, args.workers * args.segments) if args.backend == 'async' else nullcontext()) as async_backend:
+        course = Course(site.course_url, session, parser=args.parser, lecture_extractor=args.extractor, async_backend=async_backend)
+        start_time = perf_counter()
+        course.download(Path(base_dir), workers=args.workers, segments=args.segments, on_exists='overwrite')
+        elapsed = perf_counter() - start_time
+        downloaded = sum(path.stat().st_size for path in Path(base_dir).rglob('*') if path.is_file())
+    summary = telemetry.get_summary()
+    return {
+        'elapsed': elapsed,
+        'megabytes_per_second': downloaded / 1024 ** 2 / elapsed,
+        'parse_total': summary.get('parse', {}).get('total', 0),
+        'parse_p50': summary.get('parse', {}).get('p50', 0),
+        'retries': retry_stats.retries
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """ Show the change of every compared result from the baseline. """
+    print('\nCompared to the baseline')
+    for name, bigger_is_better in COMPARED_RESULTS.items():
+        if not baseline.get(name) or name not in results:
+            continue
+        change = (results[name] - baseline[name]) / baseline[name] * 100
+        verdict = 'better' if (change > 0) == bigger_is_better else 'worse'
+        print(f'{name:>22}: {baseline[name]:.4f} -> {results[name]:.4f} ({change:+.1f}%, {verdict})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    site_group = parser.add_argument_group('fake site')
+    site_group.add_argument('--sections', type=int, default=4)
+    site_group.add_argument('--lectures', type=int, default=8, help='The number of lectures in every section')
+    site_group.add_argument('--file-size', type=float, default=2, help='The size of every video in MB')
+    site_group.add_argument('--latency', type=float, default=0, help='The number of seconds the server waits before every response')
+    site_group.add_argument('--bandwidth', type=float, default=0, help='The maximum MB/s of a single response, 0 for no limit')
+    site_group.add_argument('--failure-rate', type=float, default=0, help='The fraction of the requests that fail')
+    site_group.add_argument('--seed', type=int, default=0)
+    app_group = parser.add_argument_group('app')
+    app_group.add_argument('--workers', type=int, default=4)
+    app_group.add_argument('--segments', type=int, default=1)
+    app_group.add_argument('--backend', choices=BACKENDS, default='threads')
+    app_group.add_argument('--parser', choices=PARSERS, default=DEFAULT_PARSER)
+    app_group.add_argument('--extractor', choices=EXTRACTORS, default='soup')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of runs, the median of every result is reported')
+    parser.add_argument('--output', type=Path, help='Save the results as json to use them as a baseline later')
+    parser.add_argument('--baseline', type=Path, help='Compare the results with the results saved by an earlier run')
+    args = parser.parse_args()
+
+    config = SiteConfig(
+        sections=args.sections, lectures_per_section=args.lectures, file_size=int(args.file_size * 1024 ** 2),
+        latency=args.latency, bandwidth=int(args.bandwidth * 1024 ** 2), failure_rate=args.failure_rate, seed=args.seed
+    )
+    # Failures are injected on purpose so they are retried right away instead of backing off for seconds
+    configure_retries(RetryPolicy(max_attempts=10, base_delay=0.01, max_delay=0.1))
+    runs = []
+    with FakeSite(config) as site:
+        for _ in range(args.repeat):
+            runs.append(download_course(site, args))
+        requests = dict(site.requests)
+    telemetry.close()
+
+    results: Dict[str, Any] = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    peak_memory = get_peak_memory()
+    if peak_memory is not None:
+        results['peak_memory_mb'] = peak_memory / 1024 ** 2
+    results['requests'] = requests
+    results['arguments'] = {name: value for name, value in vars(args).items() if name not in ('output', 'baseline')}
+
+    print(f'\n{config.lecture_count} lectures, median of {args.repeat} runs')
+    for name, value in results.items():
+        if name != 'arguments':
+            print(f'{name:>22}: {value:.4f}' if isinstance(value, float) else f'{name:>22}: {value}')
+    if args.baseline is not None:
+        compare(results, json.loads(args.baseline.read_text()))
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Microbenchmarks of the scraping hot path over the recorded pages in tests/fixtures and a synthetic
+course with a long sidebar. They need pytest-benchmark and are run on their own:
+
+    python -m pytest benchmarks/bench_hot_path.py
+    python -m pytest benchmarks/bench_hot_path.py --benchmark-save=baseline
+    python -m pytest benchmarks/bench_hot_path.py --benchmark-compare=0001_baseline
+"""
+
+from pathlib import Path
+import pytest
+from requests import Session
+from benchmarks.fake_site import SiteConfig, make_lecture_page
+from cwm_downloader.scraper._scraper import DEFAULT_PARSER, PARSERS
+from cwm_downloader.scraper.course_scraper import Course
+from cwm_downloader.scraper.lecture_scraper import Lecture
+from cwm_downloader.utils import sterialize_file_or_folder
+
+pytest.importorskip('pytest_benchmark')
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / 'tests' / 'fixtures'
+
+# The pages the scrapers are benchmarked with, a recorded one and a course with 300 lectures
+PAGES = {
+    'recorded': (FIXTURES_DIR / 'video_lecture.html').read_bytes(),
+    'long_sidebar': make_lecture_page(SiteConfig(sections=10, lectures_per_section=30), 0)
+}
+FILENAMES = [
+    '5- Setting Up the Development Environment.mp4', r'a|<b>cd?.html', 'something ... zip.  .',
+    'Source Code.zip', '12- Pointers and References: Part 2/3.pdf'
+] * 20
+
+
+def make_course(page: bytes, parser: str) -> Course:
+    course = Course(f'{Course.base_url}/courses/1/lectures/1', Session(), parser=parser)
+    course.make_soup = lambda: course.parse_page(page)  # type: ignore
+    return course
+
+
+def make_lecture(page: bytes, parser: str) -> Lecture:
+    lecture = Lecture(f'{Lecture.base_url}/courses/1/lectures/1', Session(), parser=parser)
+    lecture.make_soup = lambda: lecture.parse_page(page)  # type: ignore
+    return lecture
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+@pytest.mark.parametrize('page_name', PAGES.keys())
+def test_parse_course_page(benchmark, page_name: str, parser: str):
+    course = make_course(PAGES[page_name], parser)
+    benchmark(course.parse_page, PAGES[page_name])
+
+
+@pytest.mark.parametrize('page_name', PAGES.keys())
+def test_select_element(benchmark, page_name: str):
+    course = make_course(PAGES[page_name], DEFAULT_PARSER)
+    soup = course.soup
+    benchmark(course.select_element, Course.element_selectors.lecture_anchor_tags, soup)
+
+
+@pytest.mark.parametrize('page_name', PAGES.keys())
+def test_get_all_sections(benchmark, page_name: str):
+    course = make_course(PAGES[page_name], DEFAULT_PARSER)
+    # Parse the page before so that only the selection and the lectures are measured
+    course.soup
+    sections = benchmark(course.get_all_sections)
+    assert sections
+
+
+def test_get_text_lecture(benchmark):
+    page = (FIXTURES_DIR / 'text_lecture.html').read_bytes()
+
+    def make_parsed_lecture():
+        # Extracting the text changes the soup, so every round gets a freshly parsed lecture
+        lecture = make_lecture(page, DEFAULT_PARSER)
+        lecture.soup
+        return (lecture,), {}
+    text = benchmark.pedantic(lambda lecture: lecture.get_text_lecture(), setup=make_parsed_lecture, rounds=200)
+    assert 'lecture-completion-data' not in text
+
+
+def test_sterialize_file_or_folder(benchmark):
+    benchmark(lambda: [sterialize_file_or_folder(filename) for filename in FILENAMES])
@@ -0,0 +1,68 @@
+"""
+Measure the peak memory of extracting the metadata of many lectures, with and without --low-memory.
+
+Every lecture is kept alive like Course.get_all_sections keeps them for the whole run, and each mode
+runs in its own process so that the peak RSS of one doesn't hide the other.
+
+    python benchmarks/bench_memory.py --lectures 500
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from requests import Session  # noqa: E402
+from cwm_downloader.scraper._scraper import configure_low_memory  # noqa: E402
+from cwm_downloader.scraper.lecture_scraper import Lecture  # noqa: E402
+from cwm_downloader.telemetry import get_peak_memory  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / 'tests' / 'fixtures'
+
+
+def extract_lectures(lecture_count: int, parser: str):
+    """ Extract the metadata of lecture_count lectures from the recorded pages and keep all of them. """
+    pages = [(FIXTURES_DIR / name).read_bytes() for name in ('video_lecture.html', 'text_lecture.html')]
+    session = Session()
+    lectures = []
+    for lecture_index in range(lecture_count):
+        lecture = Lecture(f'{Lecture.base_url}/courses/1/lectures/{lecture_index}', session, parser=parser)
+        page = pages[lecture_index % len(pages)]
+        lecture.make_soup = lambda lecture=lecture, page=page: lecture.parse_page(page)  # type: ignore
+        lecture.metadata
+        lectures.append(lecture)
+    return lectures
+
+
+def run_mode(lecture_count: int, parser: str, low_memory: bool):
+    configure_low_memory(low_memory)
+    baseline = get_peak_memory() or 0
+    extract_lectures(lecture_count, parser)
+    print((get_peak_memory() or 0) - baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lectures', type=int, default=500, help='The number of lectures to extract')
+    parser.add_argument('--parser', default='html.parser', help='The parser of BeautifulSoup to use')
+    parser.add_argument('--mode', choices=('default', 'low-memory'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        # A single mode measured in a fresh process
+        return run_mode(args.lectures, args.parser, args.mode == 'low-memory')
+    if get_peak_memory() is None:
+        sys.exit('The peak memory can\'t be measured on this platform')
+    print(f'{args.lectures} lectures parsed with {args.parser}')
+    for mode in ('default', 'low-memory'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--lectures', str(args.lectures), '--parser', args.parser, '--mode', mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        print(f'{mode:>12}: peak RSS grew by {int(output) / 1024 ** 2:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+A local http server that imitates a course of the site, so that the app can be benchmarked without
+touching the real site. The course and lecture pages match the selectors in ElementSelectors and the
+lectures link to binary files served from the same server. The latency, the bandwidth and the
+failures of the server can be configured to see how the app behaves on a slow or flaky connection.
+"""
+
+import random
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from cwm_downloader.scraper._scraper import Scraper
+
+# The size of the pieces the bodies are written in, the bandwidth is limited per piece
+WRITE_SIZE = 64 * 1024
+
+
+@dataclass
+class SiteConfig:
+    """ The shape of the fake course and the behavior of the server. """
+    sections: int = 4
+    lectures_per_section: int = 8
+    # Every n-th lecture of a section is a text lecture, 0 for no text lectures
+    text_every: int = 4
+    # The size of the video of a video lecture, its source code is an eighth of it
+    file_size: int = 2 * 1024 ** 2
+    # The number of bytes of markup outside of the parsed parts of the pages, like the header and footer of the real pages
+    page_padding: int = 20_000
+    # The number of seconds the server waits before every response
+    latency: float = 0
+    # The maximum number of bytes per second of a single response, 0 for no limit
+    bandwidth: int = 0
+    # The fraction of the requests that fail. Half of them get a 503 and the other half are cut in the middle of the body
+    failure_rate: float = 0
+    # The seed of the payload and of the failures so that runs can be compared
+    seed: int = 0
+
+    @property
+    def lecture_count(self) -> int:
+        return self.sections * self.lectures_per_section
+
+    def is_text_lecture(self, lecture_no: int) -> bool:
+        return self.text_every > 0 and (lecture_no + 1) % self.text_every == 0
+
+
+def get_lecture_id(section_no: int, lecture_no: int) -> int:
+    """ Get the id of a lecture in the urls of the fake course. """
+    return section_no * 1000 + lecture_no
+
+
+def make_sidebar(config: SiteConfig) -> str:
+    """ Make the sidebar of the course with all of its sections and lectures. """
+    sections = []
+    for section_no in range(config.sections):
+        items = ''.join(
+            f'<li class="section-item"><a class="item" href="/courses/1/lectures/{get_lecture_id(section_no, lecture_no)}">'
+            f'<span class="lecture-name">{lecture_no + 1}- Lecture {lecture_no + 1}</span></a></li>'
+            for lecture_no in range(config.lectures_per_section)
+        )
+        sections.append(
+            f'<div class="course-section"><div class="section-title">Section {section_no + 1}</div>'
+            f'<ul class="section-list">{items}</ul></div>'
+        )
+    return f'<div class="course-sidebar"><h2>Fake Course</h2><div class="row lecture-sidebar">{"".join(sections)}</div></div>'
+
+
+def make_lecture_page(config: SiteConfig, lecture_id: int) -> bytes:
+    """ Make the whole page of a lecture including the parts that the app doesn't parse. """
+    lecture_no = lecture_id % 1000
+    name = f'{lecture_no + 1}- Lecture {lecture_no + 1}'
+    if config.is_text_lecture(lecture_no):
+        icon = '#icon__Text'
+        content = f'<div class="lecture-text-container"><p>{"The text of the lecture. " * 40}</p></div>'
+    else:
+        icon = '#icon__Video'
+        content = (
+            f'<div class="lecture-attachment"><a class="download" data-x-origin-download-name="{name}.mp4" href="/files/{lecture_id}.mp4">Download</a></div>'
+            f'<div class="lecture-attachment"><a class="download" data-x-origin-download-name="Source Code {lecture_id}.zip" href="/files/{lecture_id}.zip">Download</a></div>'
+        )
+    padding = '<div class="nav-item">' + 'x' * 80 + '</div>'
+    return (
+        '<!DOCTYPE html><html><head><title>Fake Course</title></head><body>'
+        f'<header>{padding * (config.page_padding // len(padding) // 2)}</header>'
+        f'<section>{make_sidebar(config)}'
+        '<div class="course-mainbar lecture-content full-width-content">'
+        f'<h2 id="lecture_heading"><svg><use xlink:href="{icon}"></use></svg>{name}</h2>'
+        '<div id="lecture-completion-data" data-lecture-id="1"></div>'
+        f'{content}<a class="btn complete lecture-complete" href="#">Complete and continue</a></div></section>'
+        f'<footer>{padding * (config.page_padding // len(padding) // 2)}</footer></body></html>'
+    ).encode()
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    """ Serves the pages and the files of the FakeSite of its server. """
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeSiteServer'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond()
+
+    def respond(self, head=False):
+        site = self.server.site
+        if site.config.latency:
+            sleep(site.config.latency)
+        lecture_match = re.fullmatch(r'/courses/1/lectures/(\d+)', self.path)
+        file_match = re.fullmatch(r'/files/(\d+)\.(mp4|zip)', self.path)
+        if lecture_match is None and file_match is None:
+            site.count('not_found')
+            return self.send_body(404, b'', head)
+        failure = site.pick_failure()
+        if failure == 'error':
+            site.count('failures')
+            return self.send_body(503, b'', head)
+        if lecture_match is not None:
+            site.count('pages')
+            return self.send_body(200, site.get_lecture_page(int(lecture_match[1])), head, failure == 'cut', 'text/html; charset=utf-8')
+        site.count('files')
+        body = site.payload if file_match[2] == 'mp4' else site.payload[:len(site.payload) // 8]  # type: ignore
+        start, end = 0, len(body) - 1
+        range_header = self.headers.get('Range')
+        if range_header:
+            first, _, last = range_header.removeprefix('bytes=').partition('-')
+            start, end = int(first), int(last) if last else len(body) - 1
+            if start >= len(body):
+                return self.send_body(416, b'', head)
+        status = 206 if range_header else 200
+        extra_headers = {'Accept-Ranges': 'bytes', 'ETag': f'"{file_match[1]}-{file_match[2]}"'}  # type: ignore
+        if range_header:
+            extra_headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+        self.send_body(status, body[start:end + 1], head, failure == 'cut', 'application/octet-stream', extra_headers)
+
+    def send_body(self, status: int, body: bytes, head: bool, cut: bool = False, content_type: str = 'text/plain', extra_headers: dict | None = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if head:
+            return
+        if cut:
+            # Send half of the body and drop the connection like a flaky network would
+            self.server.site.count('failures')
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        bandwidth = self.server.site.config.bandwidth
+        for start in range(0, len(body), WRITE_SIZE):
+            piece = body[start:start + WRITE_SIZE]
+            self.wfile.write(piece)
+            if bandwidth:
+                sleep(len(piece) / bandwidth)
+
+
+class FakeSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    site: 'FakeSite'
+
+
+class FakeSite:
+    """
+    A fake course served on a random local port. Use it as a context manager to serve it and to make
+    the scrapers use it instead of the real site.
+    """
+
+    def __init__(self, config: SiteConfig | None = None):
+        """
+        Constructor
+
+        :param config: The shape of the course and the behavior of the server
+        """
+        self.config = config or SiteConfig()
+        randomizer = random.Random(self.config.seed)
+        self.payload = randomizer.randbytes(self.config.file_size)
+        self.failure_randomizer = random.Random(self.config.seed)
+        self.requests: Counter = Counter()
+        self.lock = threading.Lock()
+        self.server = FakeSiteServer(('127.0.0.1', 0), FakeSiteHandler)
+        self.server.site = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.original_base_url = Scraper.base_url
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def course_url(self) -> str:
+        """ The url of the first lecture, which is what a course is made from. """
+        return f'{self.url}/courses/1/lectures/{get_lecture_id(0, 0)}'
+
+    def __enter__(self):
+        self.thread.start()
+        Scraper.base_url = self.url
+        return self
+
+    def __exit__(self, *_):
+        Scraper.base_url = self.original_base_url
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, kind: str):
+        with self.lock:
+            self.requests[kind] += 1
+
+    def pick_failure(self) -> str | None:
+        """ Decide if the current request fails and how, 'error' for a 503 and 'cut' for a body cut in half. """
+        with self.lock:
+            if self.failure_randomizer.random() >= self.config.failure_rate:
+                return None
+            return self.failure_randomizer.choice(('error', 'cut'))
+
+    def get_lecture_page(self, lecture_id: int) -> bytes:
+        return make_lecture_page(self.config, lecture_id)
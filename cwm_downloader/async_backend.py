@@ -0,0 +1,234 @@
+"""
+This module provides an asyncio backend that makes the requests of the app on a single event loop
+using aiohttp instead of requests. The loop runs in its own thread and the rest of the app (which is
+synchronous) hands it coroutines and waits for their results, so the concurrency of the downloads is
+limited by a semaphore instead of the number of threads. aiohttp is optional and only needed when the
+backend is used.
+"""
+
+import asyncio
+import hashlib
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Thread
+from typing import Coroutine, Literal, Mapping, TypeVar
+from requests import Session, exceptions as rqexceptions
+from requests.structures import CaseInsensitiveDict
+from rich.progress import Progress, TaskID
+from cwm_downloader import rate_limit
+from cwm_downloader.retry import current_attempt, handle_network_errors
+from cwm_downloader.transfer import MIN_CHUNK_SIZE, ProgressThrottle, TransferResult, check_received, finalize_file, get_partial_path, get_range_start, hash_file
+from cwm_downloader.utils import download_cancelled, handle_keyboard_interrupt_for_partial_files
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore
+
+# The ways the requests of the app can be made. The threads backend uses requests from many
+# threads and the async backend uses aiohttp on a single event loop.
+Backend = Literal['threads', 'async']
+BACKENDS = ('threads', 'async')
+
+# Chunks are collected in memory until they reach this size and then written to the file in a
+# thread, since writing every chunk in its own thread costs more than the write itself.
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+T = TypeVar('T')
+
+
+@dataclass
+class PageResponse:
+    """ A fully read response with the parts of the requests.Response interface the app uses. """
+    url: str
+    status_code: int
+    headers: CaseInsensitiveDict = field(default_factory=CaseInsensitiveDict)
+    content: bytes = b''
+
+    def raise_for_status(self):
+        """ Raise a requests.HTTPError for error status codes just like requests does. """
+        if self.status_code >= 400:
+            raise rqexceptions.HTTPError(f'{self.status_code} Error for url: {self.url}', response=self)  # type: ignore
+
+
+@contextmanager
+def translate_errors():
+    """ Raise the aiohttp errors as the requests errors they correspond to, so that they are retried the same way. """
+    try:
+        yield
+    except asyncio.TimeoutError as error:
+        raise rqexceptions.Timeout(error)
+    except aiohttp.ClientPayloadError as error:
+        raise rqexceptions.ChunkedEncodingError(error)
+    except aiohttp.ClientConnectionError as error:
+        raise rqexceptions.ConnectionError(error)
+
+
+class AsyncBackend:
+    """
+    An event loop running in a background thread with an aiohttp session that has the same
+    headers and cookies as a requests session. Use it as a context manager to close it.
+    """
+
+    def __init__(self, session: Session, concurrency: int):
+        """
+        Constructor
+
+        :param session: The requests session whose headers and cookies are used
+        :param concurrency: The maximum number of requests made at the same time
+        """
+        if aiohttp is None:
+            raise ImportError('The async backend needs aiohttp, install it with "pip install aiohttp"')
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, name='async-backend', daemon=True)
+        self.thread.start()
+        # aiohttp manages the connection itself so hop-by-hop headers are not copied
+        headers = {name: value for name, value in session.headers.items() if name.lower() != 'connection'}
+        self.client = self.run(self.__open(headers, session.cookies.get_dict(), concurrency))
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def __open(self, headers: dict, cookies: dict, concurrency: int) -> 'aiohttp.ClientSession':
+        # The session must be created inside the loop that it is used in
+        return aiohttp.ClientSession(headers=headers, cookies=cookies, connector=aiohttp.TCPConnector(limit=concurrency))
+
+    def run(self, coroutine: Coroutine[None, None, T]) -> T:
+        """
+        Run a coroutine on the event loop and wait for its result from the calling thread.
+
+        :param coroutine: The coroutine to run
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result()
+        except (CancelledError, asyncio.CancelledError):
+            # The coroutine stopped itself because the downloads were cancelled
+            raise KeyboardInterrupt
+        except BaseException:
+            # The caller is interrupted so the coroutine shouldn't continue without it
+            future.cancel()
+            raise
+
+    def close(self):
+        """ Close the aiohttp session and stop the event loop. """
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    async def fetch(self, url: str, timeout: int, headers: Mapping[str, str] | None = None) -> PageResponse:
+        """
+        Request a url and read its whole body.
+
+        :param url: The url to request
+        :param timeout: The amount of time to wait for the server
+        :param headers: Headers added to the headers of the session
+        """
+        async with self.semaphore:
+            with translate_errors():
+                async with self.client.get(url, headers=headers, timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)) as response:
+                    content = await response.read()
+                    return PageResponse(str(response.url), response.status, CaseInsensitiveDict(response.headers), content)
+
+    def get(self, url: str, timeout: int, headers: Mapping[str, str] | None = None) -> PageResponse:
+        """
+        Request a url from a synchronous caller. This has the same signature as requests.Session.get
+        for the arguments the app uses so the backend can be used in place of a session (e.g by PageCache).
+
+        :param url: The url to request
+        :param timeout: The amount of time to wait for the server
+        :param headers: Headers added to the headers of the session
+        """
+        return self.run(self.fetch(url, timeout, headers))
+
+    async def stream_to_file(self, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, checksum: bool = False, retries: int = 0) -> TransferResult:
+        """
+        The coroutine of download_file. It works like transfer.download_file but the body is read on the
+        event loop and the writes to the partial file are done in a thread.
+
+        :param retries: The number of times the download was retried, shown in the progress bar
+        """
+        partial_path = get_partial_path(file_path)
+        downloaded = partial_path.stat().st_size if partial_path.exists() else 0
+        request_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+        async with self.semaphore:
+            with translate_errors():
+                headers = {'Range': f'bytes={downloaded}-'} if downloaded else {}
+                response = await self.client.get(url, headers=headers, timeout=request_timeout)
+                if downloaded and response.status == 416:
+                    # The partial file is stale so it's downloaded again from the start, see transfer.request_download
+                    response.release()
+                    response = await self.client.get(url, timeout=request_timeout)
+                    downloaded = 0
+                async with response:
+                    PageResponse(str(response.url), response.status).raise_for_status()
+                    if response.status != 206 or get_range_start(response.headers) != downloaded:
+                        # The server ignored the range and is sending the whole file
+                        downloaded = 0
+                    content_length = response.headers.get('content-length')
+                    progress_bar.reset(current_task_id, start=False)
+                    progress_bar.update(
+                        current_task_id,
+                        total=downloaded + int(content_length) if content_length is not None else None,
+                        completed=downloaded,
+                        retries=retries
+                    )
+                    progress_bar.start_task(current_task_id)
+
+                    hasher = await asyncio.to_thread(hash_file, partial_path, downloaded) if checksum and downloaded else hashlib.sha256()
+                    received = 0
+                    file = await asyncio.to_thread(partial_path.open, 'ab' if downloaded else 'wb')
+
+                    def write(buffer: bytearray):
+                        file.write(buffer)
+                        if checksum:
+                            hasher.update(buffer)
+                    try:
+                        with ProgressThrottle(progress_bar, current_task_id) as progress:
+                            buffer = bytearray()
+                            async for chunk in response.content.iter_chunked(max(chunk_size, MIN_CHUNK_SIZE)):
+                                if download_cancelled.is_set():
+                                    # KeyboardInterrupt would stop the event loop itself so the task is cancelled
+                                    # instead, which run turns in to a KeyboardInterrupt in the calling thread
+                                    raise asyncio.CancelledError
+                                buffer += chunk
+                                received += len(chunk)
+                                progress.advance(len(chunk))
+                                if rate_limit.bandwidth_limiter is not None:
+                                    # Wait on the loop instead of blocking it like limit_bandwidth would
+                                    await asyncio.sleep(rate_limit.bandwidth_limiter.reserve(len(chunk)))
+                                if len(buffer) >= WRITE_BUFFER_SIZE:
+                                    await asyncio.to_thread(write, buffer)
+                                    buffer = bytearray()
+                            await asyncio.to_thread(write, buffer)
+                    finally:
+                        await asyncio.to_thread(file.close)
+                    check_received(url, received, response.headers)
+                    etag, last_modified = response.headers.get('etag'), response.headers.get('last-modified')
+        await asyncio.to_thread(finalize_file, partial_path, file_path)
+        return TransferResult(file_path.stat().st_size, etag, last_modified, hasher.hexdigest() if checksum else None)
+
+    @handle_network_errors
+    @handle_keyboard_interrupt_for_partial_files
+    def download_file(self, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, checksum: bool = False) -> TransferResult:
+        """
+        Download any downloadble url on the event loop and show a progress bar. It resumes partial files and
+        handles errors just like transfer.download_file.
+
+        :param url: The downloadable url
+        :param file_path: Where to store the final file
+        :param progress_bar: A rich.Progress object used to update the current progress bar task
+        :param current_task_id: The id of the task to use when downloading
+        :param chunk_size: The size of the chunks read from the connection
+        :param timeout: The amount of time to wait for the server
+        :param checksum: If True, the SHA-256 of the file is calculated while it's downloaded
+        """
+        # The attempt is only known in this thread, the coroutine runs in the thread of the loop
+        return self.run(self.stream_to_file(url, file_path, progress_bar, current_task_id, chunk_size, timeout, checksum, current_attempt() - 1))
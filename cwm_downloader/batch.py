@@ -0,0 +1,121 @@
+"""
+This module provides the batch download of many courses. The lectures of every course are put in
+a single prioritized queue that is downloaded by one pool of workers, so that the workers stay busy
+even when one course has only a few lectures left or is made of tiny text lectures.
+"""
+
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import List, Tuple
+from rich.progress import TaskID
+from cwm_downloader.exceptions import ElementNotFoundError, IncorrectUrlError, RequestFailedError
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.scraper.course_scraper import Course
+from cwm_downloader.scraper.lecture_scraper import Lecture
+from cwm_downloader.utils import get_course_progress_bar, get_progress_bar, get_status, render_message, run_lecture_jobs
+
+
+@dataclass
+class LectureJob:
+    """ A lecture waiting in the batch queue with everything needed to download it. """
+    lecture: Lecture
+    section_dir: Path
+    manifest: Manifest
+    # The row of the course of the lecture in the course progress bar
+    course_task_id: TaskID
+    # The position of the lecture in its course, used to take turns between the courses
+    position: int
+    course_index: int
+
+    def get_priority(self) -> Tuple[int, int, int]:
+        """
+        Get the priority of the job, smaller is sooner. Video lectures go first since they take the
+        longest and text lectures fill the gaps at the end. The courses take turns so that all of
+        them make progress. Lectures whose pages weren't prefetched count as videos, since fetching
+        them here would do it one by one.
+        """
+        is_text = int(self.lecture.get_known_type() == 'text')
+        return is_text, self.position, self.course_index
+
+
+def read_course_urls(urls_file: Path) -> List[str]:
+    """
+    Read the course urls from a file with a url per line. Empty lines, lines starting with #
+    and repeated urls are ignored.
+
+    :param urls_file: The path of the file
+    """
+    urls: List[str] = []
+    for line in urls_file.read_text().splitlines():
+        url = line.strip()
+        if url and not url.startswith('#') and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def download_courses(courses: List[Course], base_dir: Path, workers: int = 4, prefetch: int = 0, **lecture_download_args):
+    """
+    Download the new or incomplete lectures of many courses like Course.sync does, using a single
+    queue and pool of workers for all of them. Courses that can't be fetched are skipped.
+
+    :param courses: The courses to download, sharing the same session
+    :param base_dir: The directory in which the course directories will live in
+    :param workers: The number of lectures downloaded at the same time across all the courses
+    :param prefetch: The number of lecture pages to fetch at the same time before downloading
+
+    The rest of the key worded arguments are used to customize Lecture.download
+    """
+    course_progress_bar = get_course_progress_bar()
+    transfers_progress_bar = get_progress_bar()
+    jobs: List[LectureJob] = []
+    course_names = set()
+    for course_index, course in enumerate(courses):
+        try:
+            with get_status(f'[bold]Initializing {course.url}'):
+                course_name = str(course)
+                if course_name in course_names:
+                    # Two urls of the same course would download every lecture twice at the same time
+                    render_message('warning', f'Skipping, {course.url} is a url of {course_name} which is already in the batch.')
+                    continue
+                course_names.add(course_name)
+                manifest, lectures_to_download, lecture_count = course.get_lectures_to_sync(base_dir)
+        except (RequestFailedError, ElementNotFoundError) as error:
+            render_message('error', f'Skipping, Couldn\'t fetch the course {course.url}. {error}')
+            continue
+        render_message('info', f'{course_name}: {len(lectures_to_download)} of {lecture_count} lectures are new or incomplete')
+        course_task_id = course_progress_bar.add_task('course', filename=course_name, total=len(lectures_to_download))
+        jobs.extend(
+            LectureJob(lecture, section_dir, manifest, course_task_id, position, course_index)
+            for position, (lecture, section_dir) in enumerate(lectures_to_download)
+        )
+    if not jobs:
+        return
+
+    if courses:
+        # Prefetching isn't tied to a course so the first one does it for all of them
+        courses[0].prefetch_lectures([job.lecture for job in jobs], prefetch)
+    # The pool runs the jobs in the order they are submitted which makes it a priority queue
+    jobs.sort(key=LectureJob.get_priority)
+
+    run_lecture_jobs(
+        [(partial(job.lecture.download, job.section_dir, manifest=job.manifest, **lecture_download_args), job.course_task_id) for job in jobs],
+        workers, course_progress_bar, transfers_progress_bar
+    )
+
+
+def make_courses(urls: List[str], *course_args) -> List[Course]:
+    """
+    Make a Course for every url, skipping the urls that are not course urls.
+
+    :param urls: The urls of the courses
+
+    The rest of the arguments are passed to every Course after the url
+    """
+    courses = []
+    for url in urls:
+        try:
+            courses.append(Course(url, *course_args))
+        except IncorrectUrlError:
+            render_message('error', f'Skipping, Incorrect Url "{url}".')
+    return courses
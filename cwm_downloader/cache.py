@@ -0,0 +1,178 @@
+"""
+This module provides the PageCache class which stores the html of the course and lecture
+pages in the app directory, so that running the app again doesn't request every page again.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock, get_ident
+from time import time
+from typing import Callable, Iterator
+from requests import Session
+from cwm_downloader.async_backend import AsyncBackend
+from cwm_downloader.rate_limit import limit_requests
+from cwm_downloader.retry import raise_for_page_status
+from cwm_downloader.utils import APP_DIR
+
+# The directory where the pages are cached in
+CACHE_DIR = APP_DIR / 'cache'
+# How long a cached page is used before it is revalidated with the server (in seconds)
+DEFAULT_CACHE_TTL = 60 * 60
+# The maximum size of all the cached pages together (in bytes)
+DEFAULT_CACHE_SIZE = 200 * 1024 * 1024
+
+
+class PageCache:
+    """
+    A cache of page bodies on the file system keyed by their urls. Pages older than the ttl are
+    revalidated with If-None-Match and If-Modified-Since requests and the least recently used pages
+    are removed when the cache grows beyond its size limit.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, ttl: int = DEFAULT_CACHE_TTL, max_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Constructor
+
+        :param cache_dir: The directory where the pages are stored
+        :param ttl: How many seconds a cached page is used without asking the server
+        :param max_size: The maximum size of the cache in bytes
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        # Pages are fetched from many threads when downloading concurrently
+        self.lock = Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # The size of all the cached bodies, kept up to date by store so that the directory is only
+        # walked when the cache is full. Other processes sharing the cache are caught up with then.
+        self.size = sum(size for _, size, _ in self.get_bodies())
+
+    def get_paths(self, url: str) -> tuple[Path, Path]:
+        """
+        Get the paths of the body and the metadata files of a url
+
+        :param url: The url of the page
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f'{key}.html', self.cache_dir / f'{key}.json'
+
+    def get(self, session: Session | AsyncBackend, url: str, timeout: int, is_valid: Callable[[bytes], bool] | None = None) -> bytes:
+        """
+        Get the body of a page from the cache, revalidate it if it's expired or request it
+        if it's not cached at all.
+
+        :param session: The session used to request the page
+        :param url: The url of the page
+        :param timeout: The amount of time to wait for the server
+        :param is_valid: Checks if a requested page is the expected page, pages that fail it are returned but not cached
+        """
+        body_path, metadata_path = self.get_paths(url)
+        metadata = self.read_metadata(metadata_path)
+        cached_body = self.read_body(body_path) if metadata is not None else None
+        if cached_body is None:
+            # The page was never cached or it was evicted
+            metadata = None
+        elif time() - metadata['stored_at'] < self.ttl:
+            return cached_body
+
+        headers = {}
+        if metadata is not None:
+            # Ask the server to only send the page if it changed since it was cached
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+        limit_requests(url)
+        response = session.get(url, timeout=timeout, headers=headers)
+        raise_for_page_status(response)
+        if response.status_code == 304 and metadata is not None and cached_body is not None:
+            metadata['stored_at'] = time()
+            self.write_file(metadata_path, json.dumps(metadata).encode())
+            return cached_body
+        # The site answers with the sign in page (sometimes after a redirect) when the session expired,
+        # caching it would serve it in place of the real page even after the credentials are fixed.
+        if response.status_code == 200 and response.url == url and (is_valid is None or is_valid(response.content)):
+            self.store(url, response.content, response.headers.get('etag'), response.headers.get('last-modified'))
+        return response.content
+
+    def store(self, url: str, body: bytes, etag: str | None = None, last_modified: str | None = None):
+        """
+        Store the body of a page and remove the least recently used pages if the cache is full.
+
+        :param url: The url of the page
+        :param body: The content of the page
+        :param etag: The ETag header of the page
+        :param last_modified: The Last-Modified header of the page
+        """
+        body_path, metadata_path = self.get_paths(url)
+        metadata = {'url': url, 'stored_at': time(), 'etag': etag, 'last_modified': last_modified}
+        try:
+            replaced_size = body_path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        self.write_file(body_path, body)
+        self.write_file(metadata_path, json.dumps(metadata).encode())
+        with self.lock:
+            self.size += len(body) - replaced_size
+            is_full = self.size > self.max_size
+        if is_full:
+            self.evict()
+
+    def get_bodies(self) -> Iterator[tuple[float, int, Path]]:
+        """ Get the modification time, the size and the path of every cached body. """
+        for body_path in self.cache_dir.glob('*.html'):
+            try:
+                body_stat = body_path.stat()
+            except FileNotFoundError:
+                continue
+            yield body_stat.st_mtime, body_stat.st_size, body_path
+
+    def evict(self):
+        """ Remove the least recently used pages until the cache fits in its size limit. """
+        with self.lock:
+            # The modification time of a body is updated every time it is read so the
+            # oldest bodies are the least recently used ones.
+            bodies = list(self.get_bodies())
+            cache_size = sum(size for _, size, _ in bodies)
+            for _, size, body_path in sorted(bodies, key=lambda body: body[0]):
+                if cache_size <= self.max_size:
+                    break
+                body_path.unlink(missing_ok=True)
+                body_path.with_suffix('.json').unlink(missing_ok=True)
+                cache_size -= size
+            self.size = cache_size
+
+    def clear(self):
+        """ Remove every cached page. """
+        with self.lock:
+            for cached_path in self.cache_dir.iterdir():
+                cached_path.unlink(missing_ok=True)
+            self.size = 0
+
+    @staticmethod
+    def read_metadata(metadata_path: Path):
+        """ Read a metadata file, returns None if it doesn't exist or is invalid. """
+        try:
+            metadata = json.loads(metadata_path.read_text())
+        except (OSError, ValueError):
+            return None
+        return metadata if isinstance(metadata, dict) and 'stored_at' in metadata else None
+
+    @staticmethod
+    def read_body(body_path: Path) -> bytes | None:
+        """ Read a cached body and mark it as recently used, returns None if it doesn't exist. """
+        try:
+            body = body_path.read_bytes()
+            os.utime(body_path)
+        except FileNotFoundError:
+            return None
+        return body
+
+    @staticmethod
+    def write_file(file_path: Path, content: bytes):
+        """ Write a file through a temporary file so that readers never see a half written file. """
+        temporary_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.{get_ident()}.tmp')
+        temporary_path.write_bytes(content)
+        os.replace(temporary_path, file_path)
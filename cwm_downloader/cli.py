@@ -2,14 +2,35 @@
 This module provides the app function that executes the cli
 """
 
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from cwm_downloader.exceptions import ElementNotFoundError, IncorrectUrlError
+from cwm_downloader.async_backend import BACKENDS, AsyncBackend, aiohttp
+from cwm_downloader.batch import download_courses, make_courses, read_course_urls
+from cwm_downloader.cache import DEFAULT_CACHE_TTL, PageCache
+from cwm_downloader.manifest import MANIFEST_NAME
+from cwm_downloader.exceptions import ElementNotFoundError, IncorrectUrlError, RequestFailedError
+from cwm_downloader.plan import Plan, PlanDownloader, make_plan
+from cwm_downloader.rate_limit import configure_rate_limits, parse_rate
+from cwm_downloader.retry import RetryPolicy, configure_retries, retry_stats
 from cwm_downloader.scraper.course_scraper import Course
-from cwm_downloader.utils import initialize_session, load_credentials, render_message
+from cwm_downloader.scraper._scraper import DEFAULT_PARSER, PARSERS, configure_low_memory
+from cwm_downloader.scraper.lecture_scraper import EXTRACTORS, ON_EXISTS_POLICIES, LectureExtractor, OnExists
+from cwm_downloader.telemetry import profiled, telemetry
+from cwm_downloader.transfer import DEFAULT_CHUNK_SIZE, configure_fsync
+from requests import Session
+from cwm_downloader.verify import verify_course
+from cwm_downloader.utils import DEFAULT_HTTP_RETRIES, DEFAULT_POOL_SIZE, handle_invalid_credentials, initialize_session, load_credentials, render_message
 from cwm_downloader import __app_name__, __version__
-from typing import Optional
+from typing import Annotated, Optional, cast
 import typer
 
+# The help of the --on-exists option shared by the download commands
+ON_EXISTS_HELP = (
+    "What to do with files that already exist. skip: keep them if they have the size of the remote file, "
+    "resume: like skip but continue files that are cut short, verify: like skip but also compare their recorded SHA-256, "
+    "ask: ask before overwriting them, overwrite: always download them again."
+)
+
 # Initialize the typer app
 app = typer.Typer(pretty_exceptions_show_locals=False, no_args_is_help=True)  # Disable showing the locals when an exception occurs.
 
@@ -37,6 +58,15 @@ def _edit_credentials_callback(value: bool):
             raise typer.Exit(1)
 
 
+def _clear_cache_callback(value: bool):
+    """ Remove every cached page so that the next run requests them from the site again. """
+    if value:
+        page_cache = PageCache()
+        page_cache.clear()
+        render_message("info", f"Cleared the page cache at {page_cache.cache_dir}")
+        raise typer.Exit()
+
+
 def check_if_less_than_zero(value: int):
     if value:
         if value <= 0:
@@ -44,7 +74,206 @@ def check_if_less_than_zero(value: int):
         return value
 
 
-def _download(course_obj: Course, section_no: Optional[int], lecture_no: Optional[int], only: bool, base_dir: Path, **download_args):
+def _check_parser(value: str):
+    if value not in PARSERS:
+        raise typer.BadParameter(f'Use one of {", ".join(PARSERS)}')
+    if value == 'lxml' and DEFAULT_PARSER != 'lxml':
+        raise typer.BadParameter('lxml is not installed. Install it with "pip install lxml"')
+    return value
+
+
+def _check_extractor(value: str):
+    if value not in EXTRACTORS:
+        raise typer.BadParameter(f'Use one of {", ".join(EXTRACTORS)}')
+    return value
+
+
+def _check_backend(value: str):
+    if value not in BACKENDS:
+        raise typer.BadParameter(f'Use one of {", ".join(BACKENDS)}')
+    if value == 'async' and aiohttp is None:
+        raise typer.BadParameter('aiohttp is not installed. Install it with "pip install aiohttp"')
+    return value
+
+
+def _check_on_exists(value: str):
+    if value not in ON_EXISTS_POLICIES:
+        raise typer.BadParameter(f'Use one of {", ".join(ON_EXISTS_POLICIES)}')
+    return value
+
+
+def _get_async_backend(backend: str, session: Session, concurrency: int):
+    """
+    Start the async backend if the user chose it. Returns a context manager which gives
+    None for the threads backend.
+
+    :param backend: The backend option given by the user
+    :param session: The session whose headers and cookies the backend uses
+    :param concurrency: The maximum number of requests the backend makes at the same time
+    """
+    if backend == 'async':
+        return AsyncBackend(session, concurrency)
+    return nullcontext()
+
+
+def _check_rate(value: Optional[str]):
+    if value is not None:
+        try:
+            parse_rate(value)
+        except ValueError as error:
+            raise typer.BadParameter(str(error))
+    return value
+
+
+# The options shared by the commands. Each is defined once here and its default is given by
+# the command, since some commands have different defaults (e.g --on-exists).
+TimeoutOption = Annotated[int, typer.Option('--timeout', '-T', help="Set the timeout for the connection and the server to respond. (Increase the number if you have a slower connection).")]
+SectionOption = Annotated[Optional[int], typer.Option('--section', '-s', help="The section from where the download starts.", callback=check_if_less_than_zero)]
+LectureOption = Annotated[Optional[int], typer.Option('--lecture', '-l', help="The lecture from where the download starts.", callback=check_if_less_than_zero)]
+ChunkSizeOption = Annotated[int, typer.Option(min=1, help="The size of the first chunk the app downloads at a time. It grows or shrinks with the speed of the connection between 64KB and 8MB.")]
+NoConfirmOption = Annotated[bool, typer.Option('--noconfirm', help="Disable the confirmation when overwriting a file. The same as --on-exists overwrite.")]
+OnExistsOption = Annotated[str, typer.Option('--on-exists', help=ON_EXISTS_HELP, callback=_check_on_exists)]
+SegmentsOption = Annotated[int, typer.Option('--segments', '-k', help="Download each file over this many connections at the same time, each fetching its own part of the file. Only used when the server supports it.", callback=check_if_less_than_zero)]
+ChecksumOption = Annotated[bool, typer.Option('--checksum', help="Calculate the SHA-256 of every downloaded file and record it in the manifest, so that the verify command can check the files later.")]
+FsyncOption = Annotated[bool, typer.Option('--fsync', help="Flush every finished file to the disk before giving it its final name. Slower, but the files survive a crash or a power loss.")]
+LowMemoryOption = Annotated[bool, typer.Option('--low-memory', help="Free every lecture page as soon as its details are read, so that the memory stays flat on courses with many lectures.")]
+StatsOption = Annotated[bool, typer.Option('--stats', help="Measure the time spent fetching pages, parsing them and downloading files and show a summary at the end.")]
+MetricsFileOption = Annotated[Optional[Path], typer.Option('--metrics-file', help="Write every measurement to this file as a line of json. Implies --stats.", dir_okay=False)]
+ProfileOption = Annotated[Optional[Path], typer.Option('--profile', help="Profile the run with cProfile and write the stats to this file (e.g run.pstats), which can be read with python -m pstats or turned in to a flamegraph.", dir_okay=False)]
+PrefetchOption = Annotated[int, typer.Option('--prefetch', min=0, help="The number of lecture pages to fetch at the same time before the downloads start, which shows the lecture names sooner and lets batch download the videos first. By default each page is fetched when its lecture is downloaded.")]
+CacheTtlOption = Annotated[int, typer.Option('--cache-ttl', min=0, help="How many seconds a cached page is used before asking the site if it changed.")]
+NoCacheOption = Annotated[bool, typer.Option('--no-cache', help="Request every page from the site instead of using the page cache.")]
+ParserOption = Annotated[str, typer.Option('--parser', help=f"The html parser used to read the pages ({' or '.join(PARSERS)}). lxml is faster and is used by default when it is installed.", callback=_check_parser)]
+ExtractorOption = Annotated[str, typer.Option('--extractor', help=f"How the lecture details are read from their pages ({' or '.join(EXTRACTORS)}). stream reads them while the page downloads and stops once they are found.", callback=_check_extractor)]
+PoolSizeOption = Annotated[Optional[int], typer.Option('--pool-size', help="The maximum number of connections kept open to the site. Defaults to enough connections for all the concurrent downloads.", callback=check_if_less_than_zero)]
+HttpRetriesOption = Annotated[int, typer.Option('--http-retries', min=0, help="How many times a connection to the site that couldn't be opened is tried again right away. Failed requests are retried according to --max-attempts and --retry-deadline.")]
+MaxAttemptsOption = Annotated[int, typer.Option('--max-attempts', min=1, help="How many times a request that keeps failing (e.g because of a lost connection) is tried before the file or lecture is skipped.")]
+RetryDeadlineOption = Annotated[Optional[float], typer.Option('--retry-deadline', min=1, help="The maximum number of seconds spent retrying a single request.")]
+BackendOption = Annotated[str, typer.Option('--backend', help=f"How the requests are made ({' or '.join(BACKENDS)}). async makes them on a single event loop with aiohttp, at most --pool-size at a time, and doesn't segment files.", callback=_check_backend)]
+LimitRateOption = Annotated[Optional[str], typer.Option('--limit-rate', help="The maximum download speed of all the downloads together in bytes per second. Use K, M or G for bigger units (e.g 5M).", callback=_check_rate)]
+RequestsPerSecondOption = Annotated[Optional[float], typer.Option('--requests-per-second', min=0.01, help="The maximum number of pages requested from the site per second. Use it if the site starts answering with \"Too Many Requests\" errors.")]
+
+
+def _get_pool_size(pool_size: Optional[int], workers: int, segments: int, prefetch: int):
+    """
+    Get the connection pool size given by the user or one that is big enough for all the
+    requests that can be made at the same time.
+
+    :param pool_size: The pool size given by the user
+    :param workers: The number of lectures downloaded at the same time
+    :param segments: The number of connections used for each file
+    :param prefetch: The number of lecture pages fetched at the same time
+    """
+    if pool_size:
+        return pool_size
+    return max(DEFAULT_POOL_SIZE, workers * segments, prefetch)
+
+
+def _configure_retries(max_attempts: int, retry_deadline: Optional[float]):
+    """
+    Set the retry policy of the requests and reset the retry counters for a new run.
+
+    :param max_attempts: The max-attempts option given by the user
+    :param retry_deadline: The retry-deadline option given by the user
+    """
+    configure_retries(RetryPolicy(max_attempts=max_attempts, deadline=retry_deadline))
+    retry_stats.reset()
+
+
+def _configure_rate_limits(limit_rate: Optional[str], requests_per_second: Optional[float]):
+    """
+    Set the bandwidth and request limits of the run.
+
+    :param limit_rate: The limit-rate option given by the user (e.g 5M)
+    :param requests_per_second: The requests-per-second option given by the user
+    """
+    configure_rate_limits(parse_rate(limit_rate) if limit_rate is not None else None, requests_per_second)
+
+
+def _finish_run():
+    """ Show the retry and performance summaries of the run and exit with an error code if some requests failed. """
+    retry_stats.render_summary()
+    telemetry.render_summary()
+    telemetry.close()
+    if retry_stats.failures:
+        raise typer.Exit(1)
+
+
+def _get_page_cache(no_cache: bool, cache_ttl: int):
+    """
+    Create the page cache according to the cache options given by the user
+
+    :param no_cache: The no-cache flag given by the user
+    :param cache_ttl: The number of seconds a cached page is used without revalidating it
+    """
+    if no_cache:
+        return None
+    return PageCache(ttl=cache_ttl)
+
+
+def _get_on_exists(on_exists: str, noconfirm: bool) -> OnExists:
+    """
+    Get the policy for existing files, --noconfirm is the same as --on-exists overwrite.
+
+    :param on_exists: The on-exists option given by the user
+    :param noconfirm: The noconfirm flag given by the user
+    """
+    return cast(OnExists, 'overwrite' if noconfirm else on_exists)
+
+
+@contextmanager
+def _exit_on_scraping_errors(url: Optional[str] = None):
+    """
+    Show the errors of scraping the site as messages and exit instead of showing their traceback.
+
+    :param url: The url given to the command, shown when it isn't a valid url
+    """
+    try:
+        yield
+    # This is an error raised by the url validator found in the base abstract class
+    # Scraper in _scraper.py
+    except IncorrectUrlError:
+        render_message('error', f'Incorrect Url "{url}".')
+        render_message('info', f'Use a url with a base of {Course.base_url}')
+        raise typer.Exit(1)
+    # This is also raised in the abstract base class Scraper and it is raised when an element selctor
+    # cannot be found.
+    except ElementNotFoundError:
+        render_message('error', f'The program could\'nt fetch resources. There might be updates to the site or your subscription has ended. Or you might have an invalid cookies')
+        raise typer.Exit(1)
+    # This is raised when a page couldn't be fetched even after retrying
+    except RequestFailedError as error:
+        render_message('error', f'Couldn\'t fetch the course. {error}')
+        raise typer.Exit(1)
+
+
+@contextmanager
+def _run_context(
+    pool_size: int, max_attempts: int = RetryPolicy.max_attempts, retry_deadline: Optional[float] = RetryPolicy.deadline,
+    requests_per_second: Optional[float] = None, limit_rate: Optional[str] = None, fsync: bool = False, low_memory: bool = False,
+    stats: bool = False, metrics_file: Optional[Path] = None, profile: Optional[Path] = None,
+    http_retries: int = DEFAULT_HTTP_RETRIES, backend: str = 'threads', summary: bool = True
+):
+    """
+    Configure a run with the options given by the user and give the session and the async backend
+    (None for the threads backend) its requests are made with. The arguments are the options of the
+    same names, except for:
+
+    :param pool_size: The number of connections kept open to the site, see _get_pool_size
+    :param summary: If True, the retry and performance summaries are shown when the run ends
+    """
+    _configure_retries(max_attempts, retry_deadline)
+    _configure_rate_limits(limit_rate, requests_per_second)
+    configure_fsync(fsync)
+    configure_low_memory(low_memory)
+    telemetry.configure(stats, metrics_file)
+    with profiled(profile), initialize_session(pool_size, http_retries) as session, _get_async_backend(backend, session, pool_size) as async_backend:
+        yield session, async_backend
+    if summary:
+        _finish_run()
+
+
+def _download(course_obj: Course, section_no: Optional[int], lecture_no: Optional[int], only: bool, base_dir: Path, workers: int = 1, prefetch: int = 0, **download_args):
     """
     Call the perfect download method based on the given section and lecture numbers
 
@@ -53,6 +282,8 @@ def _download(course_obj: Course, section_no: Optional[int], lecture_no: Optiona
     :param lecture_no: The index of the lecture given by the user
     :param only: The only flag given by the user
     :param base_dir: The base directory(path) that is given by the user
+    :param workers: The number of lectures to download at the same time
+    :param prefetch: The number of lecture pages to fetch at the same time before downloading
 
     Any other keyword argument will be passed to each download methods. 
     """
@@ -66,7 +297,7 @@ def _download(course_obj: Course, section_no: Optional[int], lecture_no: Optiona
 
         # Sample command: cwm-downloader download URL PATH --section INT --only
         elif section_no and not lecture_no:
-            course_obj.download_section(base_dir, section_no-1, 0, all_sections=None, **download_args)
+            course_obj.download_section(base_dir, section_no-1, 0, all_sections=None, workers=workers, prefetch=prefetch, **download_args)
 
         # Sample command: cwm-downloader download URL PATH --lecture 4 --only
         elif lecture_no and not section_no:
@@ -78,49 +309,250 @@ def _download(course_obj: Course, section_no: Optional[int], lecture_no: Optiona
         if not lecture_no:
             lecture_no = 1
 
-        course_obj.download(base_dir, section_no-1, lecture_no-1, **download_args)
+        course_obj.download(base_dir, section_no-1, lecture_no-1, workers=workers, prefetch=prefetch, **download_args)
+
+
+def _download_plan(plan_path: Path, base_dir: Optional[Path], session: Session, timeout: int, page_cache: Optional[PageCache], parser: str, async_backend: Optional[AsyncBackend], workers: int = 1, **download_args):
+    """
+    Download the files of a plan file
+
+    :param plan_path: The path of the plan file given by the user
+    :param base_dir: The path given by the user, the base directory of the plan is used if it's None
+    :param workers: The number of lectures to download at the same time
+
+    The rest of the arguments are used to create the PlanDownloader and the key worded arguments
+    are passed to PlanDownloader.download
+    """
+    try:
+        course_plan = Plan.load(plan_path)
+    except ValueError as error:
+        raise typer.BadParameter(f'Couldn\'t read the plan "{plan_path}". {error}')
+    plan_downloader = PlanDownloader(session, timeout, page_cache, parser, async_backend)
+    plan_downloader.download(course_plan, base_dir or Path(course_plan.base_dir), workers, **download_args)
 
 
 @app.callback()
 def main(
     version: bool = typer.Option(False, '--version', help="Show the app's version and exit.", callback=_version_callback, is_eager=True),
-    edit_credentials: bool = typer.Option(False, '--edit-credentials', help="Edit the credentials.json file and exit.", callback=_edit_credentials_callback)
+    edit_credentials: bool = typer.Option(False, '--edit-credentials', help="Edit the credentials.json file and exit.", callback=_edit_credentials_callback),
+    clear_cache: bool = typer.Option(False, '--clear-cache', help="Remove every cached page and exit.", callback=_clear_cache_callback)
 ) -> None:
     """ Download courses from https://codewithmosh.com with ease!. """
 
 
 @app.command()
+@handle_invalid_credentials
 def download(
-    url: str = typer.Argument(..., help="Any lecture url from the course you want to download."),
+    url: Optional[str] = typer.Argument(None, help="Any lecture url from the course you want to download. Not needed with --from-plan.", show_default=False),
+
+    path: Optional[Path] = typer.Argument(None, help="The path where the course gets downloaded in. The program creates its own course directory. [default: ., or the path of the plan with --from-plan]", show_default=False),
+
+    section_no: SectionOption = None,
+    lecture_no: LectureOption = None,
+    only: bool = typer.Option(False, '--only', help="Download the specified lecture and section only."),
+    workers: int = typer.Option(1, '--workers', '-w', help="The number of lectures to download at the same time. When more than 1, existing files are skipped instead of asking.", callback=check_if_less_than_zero),
+    on_exists: OnExistsOption = 'ask',
+    from_plan: Optional[Path] = typer.Option(None, '--from-plan', help="Download the files listed in a plan made by the plan command instead of scraping the course again. --section, --lecture and --only are taken from the plan.", exists=True, dir_okay=False),
+    timeout: TimeoutOption = 60,
+    chunk_size: ChunkSizeOption = DEFAULT_CHUNK_SIZE,
+    noconfirm: NoConfirmOption = False,
+    segments: SegmentsOption = 1,
+    checksum: ChecksumOption = False,
+    fsync: FsyncOption = False,
+    low_memory: LowMemoryOption = False,
+    stats: StatsOption = False,
+    metrics_file: MetricsFileOption = None,
+    profile: ProfileOption = None,
+    prefetch: PrefetchOption = 0,
+    cache_ttl: CacheTtlOption = DEFAULT_CACHE_TTL,
+    no_cache: NoCacheOption = False,
+    parser: ParserOption = DEFAULT_PARSER,
+    extractor: ExtractorOption = 'soup',
+    pool_size: PoolSizeOption = None,
+    http_retries: HttpRetriesOption = DEFAULT_HTTP_RETRIES,
+    max_attempts: MaxAttemptsOption = RetryPolicy.max_attempts,
+    retry_deadline: RetryDeadlineOption = RetryPolicy.deadline,
+    backend: BackendOption = 'threads',
+    limit_rate: LimitRateOption = None,
+    requests_per_second: RequestsPerSecondOption = None
+):
+    if from_plan is None and url is None:
+        raise typer.BadParameter('Give the url of the course or a plan with --from-plan')
+    download_args = dict(chunk_size=chunk_size, on_exists=_get_on_exists(on_exists, noconfirm), segments=segments, checksum=checksum)
+    with _exit_on_scraping_errors(url), _run_context(
+        _get_pool_size(pool_size, workers, segments, prefetch), max_attempts, retry_deadline, requests_per_second,
+        limit_rate, fsync, low_memory, stats, metrics_file, profile, http_retries, backend
+    ) as (session, async_backend):
+        if from_plan is not None:
+            _download_plan(from_plan, path, session, timeout, _get_page_cache(no_cache, cache_ttl), parser, async_backend, workers, **download_args)
+        else:
+            course_obj = Course(cast(str, url), session, timeout, _get_page_cache(no_cache, cache_ttl), parser, cast(LectureExtractor, extractor), async_backend)
+            _download(course_obj, section_no, lecture_no, only, path or Path('.'), workers, prefetch, **download_args)
+
+
+@app.command()
+@handle_invalid_credentials
+def sync(
+    url: str = typer.Argument(..., help="Any lecture url from the course you want to sync."),
 
     path: Path = typer.Argument(Path('.'), help="The path where the course gets downloaded in. The program creates its own course directory."),
 
-    section_no: Optional[int] = typer.Option(None, '--section', '-s', help="The section from where the download starts.", callback=check_if_less_than_zero),
+    workers: int = typer.Option(1, '--workers', '-w', help="The number of lectures to download at the same time.", callback=check_if_less_than_zero),
+    on_exists: OnExistsOption = 'skip',
+    timeout: TimeoutOption = 60,
+    chunk_size: ChunkSizeOption = DEFAULT_CHUNK_SIZE,
+    noconfirm: NoConfirmOption = False,
+    segments: SegmentsOption = 1,
+    checksum: ChecksumOption = False,
+    fsync: FsyncOption = False,
+    low_memory: LowMemoryOption = False,
+    stats: StatsOption = False,
+    metrics_file: MetricsFileOption = None,
+    profile: ProfileOption = None,
+    prefetch: PrefetchOption = 0,
+    cache_ttl: CacheTtlOption = DEFAULT_CACHE_TTL,
+    no_cache: NoCacheOption = False,
+    parser: ParserOption = DEFAULT_PARSER,
+    extractor: ExtractorOption = 'soup',
+    pool_size: PoolSizeOption = None,
+    http_retries: HttpRetriesOption = DEFAULT_HTTP_RETRIES,
+    max_attempts: MaxAttemptsOption = RetryPolicy.max_attempts,
+    retry_deadline: RetryDeadlineOption = RetryPolicy.deadline,
+    backend: BackendOption = 'threads',
+    limit_rate: LimitRateOption = None,
+    requests_per_second: RequestsPerSecondOption = None
+):
+    """
+    Download the lectures of a course that are new or incomplete since the last sync. The
+    synced lectures are recorded in a manifest file inside the course directory.
+    """
+    with _exit_on_scraping_errors(url), _run_context(
+        _get_pool_size(pool_size, workers, segments, prefetch), max_attempts, retry_deadline, requests_per_second,
+        limit_rate, fsync, low_memory, stats, metrics_file, profile, http_retries, backend
+    ) as (session, async_backend):
+        course_obj = Course(url, session, timeout, _get_page_cache(no_cache, cache_ttl), parser, cast(LectureExtractor, extractor), async_backend)
+        # An incomplete lecture might have some of its files already, with skip they are
+        # kept when their size matches instead of being downloaded again.
+        course_obj.sync(path, workers, prefetch, chunk_size=chunk_size, on_exists=_get_on_exists(on_exists, noconfirm), segments=segments, checksum=checksum)
 
-    lecture_no: Optional[int] = typer.Option(None, '--lecture', '-l', help="The lecture from where the download starts.", callback=check_if_less_than_zero),
 
-    only: bool = typer.Option(False, '--only', help="Download the specified lecture and section only."),
+@app.command()
+@handle_invalid_credentials
+def batch(
+    urls_file: Path = typer.Argument(..., help="A file with a lecture url of a course on each line. Empty lines and lines starting with # are ignored.", exists=True, dir_okay=False),
+
+    path: Path = typer.Argument(Path('.'), help="The path where the courses get downloaded in. The program creates a directory for every course."),
+
+    workers: int = typer.Option(4, '--workers', '-w', help="The number of lectures to download at the same time across all the courses.", callback=check_if_less_than_zero),
+    on_exists: OnExistsOption = 'skip',
+    timeout: TimeoutOption = 60,
+    chunk_size: ChunkSizeOption = DEFAULT_CHUNK_SIZE,
+    noconfirm: NoConfirmOption = False,
+    segments: SegmentsOption = 1,
+    checksum: ChecksumOption = False,
+    fsync: FsyncOption = False,
+    low_memory: LowMemoryOption = False,
+    stats: StatsOption = False,
+    metrics_file: MetricsFileOption = None,
+    profile: ProfileOption = None,
+    prefetch: PrefetchOption = 0,
+    cache_ttl: CacheTtlOption = DEFAULT_CACHE_TTL,
+    no_cache: NoCacheOption = False,
+    parser: ParserOption = DEFAULT_PARSER,
+    extractor: ExtractorOption = 'soup',
+    pool_size: PoolSizeOption = None,
+    http_retries: HttpRetriesOption = DEFAULT_HTTP_RETRIES,
+    max_attempts: MaxAttemptsOption = RetryPolicy.max_attempts,
+    retry_deadline: RetryDeadlineOption = RetryPolicy.deadline,
+    backend: BackendOption = 'threads',
+    limit_rate: LimitRateOption = None,
+    requests_per_second: RequestsPerSecondOption = None
+):
+    """
+    Download many courses at once. The new or incomplete lectures of all the courses are
+    downloaded by a single pool of workers, like the sync command does for a single course.
+    """
+    urls = read_course_urls(urls_file)
+    if not urls:
+        raise typer.BadParameter(f'There are no urls in "{urls_file}"')
+    # The courses that can't be fetched are skipped, this only stops on the failures of lecture pages
+    with _exit_on_scraping_errors(), _run_context(
+        _get_pool_size(pool_size, workers, segments, prefetch), max_attempts, retry_deadline, requests_per_second,
+        limit_rate, fsync, low_memory, stats, metrics_file, profile, http_retries, backend
+    ) as (session, async_backend):
+        # Every course shares the session, page cache and backend
+        courses = make_courses(urls, session, timeout, _get_page_cache(no_cache, cache_ttl), parser, cast(LectureExtractor, extractor), async_backend)
+        download_courses(courses, path, workers, prefetch, chunk_size=chunk_size, on_exists=_get_on_exists(on_exists, noconfirm), segments=segments, checksum=checksum)
 
-    timeout: int = typer.Option(60, '--timeout', '-T', help="Set the timeout for the connection and the server to respond. (Increase the number if you have a slower connection)."),
 
-    chunk_size: int = typer.Option(4096, help="The chunk that the app downloads at a time when downloading content."),
+@app.command()
+@handle_invalid_credentials
+def plan(
+    url: str = typer.Argument(..., help="Any lecture url from the course you want to plan the download of."),
+
+    path: Path = typer.Argument(Path('.'), help="The path where the course would be downloaded in. The paths in the plan are relative to it."),
 
-    noconfirm: bool = typer.Option(False, '--noconfirm', help="Disable the confirmation when overwriting a file.")
+    section_no: SectionOption = None,
+    lecture_no: LectureOption = None,
+    only: bool = typer.Option(False, '--only', help="Plan the specified lecture and section only."),
+    output: Optional[Path] = typer.Option(None, '--output', '-o', help="Write the plan to this file instead of printing it."),
+    workers: int = typer.Option(8, '--workers', '-w', help="The number of lecture pages and file sizes to fetch at the same time.", callback=check_if_less_than_zero),
+    timeout: TimeoutOption = 60,
+    cache_ttl: CacheTtlOption = DEFAULT_CACHE_TTL,
+    no_cache: NoCacheOption = False,
+    parser: ParserOption = DEFAULT_PARSER,
+    extractor: ExtractorOption = 'soup',
+    max_attempts: MaxAttemptsOption = RetryPolicy.max_attempts,
+    retry_deadline: RetryDeadlineOption = RetryPolicy.deadline,
+    requests_per_second: RequestsPerSecondOption = None
 ):
-    try:
-        # Initialize a request Session using initialize_session which initializes a session
-        # by setting the headers and cookies from the credentials.json file for us.
-        with initialize_session() as session:
-            course_obj = Course(url, session, timeout)
-            _download(course_obj, section_no, lecture_no, only, path, chunk_size=chunk_size, noconfirm=noconfirm)
-    # This is an error raised by the url validator found in the base abstract class
-    # Scraper in _scraper.py
-    except IncorrectUrlError:
-        render_message('error', f'Incorrect Url "{url}".')
-        render_message('info', f'Use a url with a base of {Course.base_url}')
-        raise typer.Exit(1)
-    # This is also raised in the abstract base class Scraper and it is raised when an element selctor
-    # cannot be found.
-    except ElementNotFoundError:
-        render_message('error', f'The program could\'nt fetch resources. There might be updates to the site or your subscription has ended. Or you might have an invalid cookies')
-        raise typer.Exit(1)
+    """
+    Show what the download command would download, with the paths and sizes of all the files,
+    as json without downloading anything.
+    """
+    if only and not section_no and not lecture_no:
+        raise typer.BadParameter('Cannot use --only without a section or lecture')
+    # The plan is printed alone so the summaries of the run aren't shown
+    with _exit_on_scraping_errors(url), _run_context(_get_pool_size(None, workers, 1, workers), max_attempts, retry_deadline, requests_per_second, summary=False) as (session, _):
+        course_obj = Course(url, session, timeout, _get_page_cache(no_cache, cache_ttl), parser, cast(LectureExtractor, extractor))
+        course_plan = make_plan(
+            course_obj, path,
+            section_no - 1 if section_no else None,
+            lecture_no - 1 if lecture_no else None,
+            only, workers
+        )
+
+    if output is None:
+        # Print the plan alone so that it can be piped to other programs
+        typer.echo(course_plan.to_json())
+        return
+    output.write_text(course_plan.to_json())
+    lecture_count, file_count = len(course_plan.lectures), len(course_plan.files)
+    render_message('info', f'Planned {lecture_count} lectures with {file_count} files, {course_plan.total_bytes / 1024 ** 2:.1f} MB in total.')
+    if course_plan.unknown_sizes:
+        render_message('warning', f'The size of {course_plan.unknown_sizes} files is unknown and is not counted in the total.')
+    render_message('info', f'The plan is saved in "{output}".')
+
+
+@app.command()
+def verify(
+    course_dir: Path = typer.Argument(..., help="The directory of a downloaded course, the one containing its manifest file.", exists=True, file_okay=False),
+
+    workers: int = typer.Option(4, '--workers', '-w', help="The number of files to verify at the same time.", callback=check_if_less_than_zero),
+
+    checksum: bool = typer.Option(False, '--checksum', help="Compare the SHA-256 of the files that were downloaded with --checksum too, instead of only their sizes.")
+):
+    """
+    Check that the files of a downloaded course are complete. Lectures with missing or damaged
+    files are marked incomplete so that the sync command downloads them again.
+    """
+    if not (course_dir / MANIFEST_NAME).is_file():
+        raise typer.BadParameter(f'There is no manifest in "{course_dir}". Only courses downloaded by this version of the app can be verified.')
+    problems = verify_course(course_dir, workers, checksum)
+    if not problems:
+        render_message('info', 'All the files are complete')
+        return
+    for relative_path, problem in problems:
+        render_message('error', f'{relative_path}: {problem}')
+    render_message('info', f'{len(problems)} files are damaged, run the sync command to download them again')
+    raise typer.Exit(1)
@@ -15,3 +15,11 @@ class IncorrectUrlError(Exception):
 
 class ElementNotFoundError(Exception):
     ...
+
+
+class IncompleteDownloadError(Exception):
+    ...
+
+
+class RequestFailedError(Exception):
+    ...
@@ -0,0 +1,148 @@
+"""
+This module provides the Manifest class which remembers the lectures of a course that
+were already downloaded, so that syncing a course only downloads what is new or incomplete.
+"""
+
+import json
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+from cwm_downloader.transfer import TEMPORARY_SUFFIX, finalize_file
+
+# The name of the manifest file that is stored inside the course directory
+MANIFEST_NAME = '.cwm-manifest.json'
+# Increase this when the structure of the manifest changes in an incompatible way
+MANIFEST_VERSION = 1
+
+
+class Manifest:
+    """
+    A json file inside a course directory that records every lecture url with the files
+    that were downloaded for it, their sizes, their ETag and Last-Modified headers and
+    whether the lecture was completely downloaded.
+    """
+
+    def __init__(self, course_dir: Path, lectures: Dict[str, Dict[str, Any]] | None = None):
+        """
+        Constructor
+
+        :param course_dir: The course directory where the manifest is stored
+        :param lectures: The recorded lectures mapped by their urls
+        """
+        self.course_dir = course_dir
+        self.lectures = lectures if lectures is not None else {}
+        # Lectures can be recorded from many download workers at the same time
+        self.lock = Lock()
+
+    @property
+    def path(self):
+        return self.course_dir / MANIFEST_NAME
+
+    @classmethod
+    def load(cls, course_dir: Path):
+        """
+        Load the manifest of a course directory. An empty manifest is returned if it doesn't
+        exist or if it can't be read.
+
+        :param course_dir: The course directory where the manifest is stored
+        """
+        manifest_path = course_dir / MANIFEST_NAME
+        try:
+            manifest_data = json.loads(manifest_path.read_text())
+        except (OSError, ValueError):
+            return cls(course_dir)
+        if not isinstance(manifest_data, dict) or manifest_data.get('version') != MANIFEST_VERSION:
+            return cls(course_dir)
+        return cls(course_dir, manifest_data.get('lectures', {}))
+
+    def save(self):
+        """ Write the manifest to the course directory without ever leaving a half written file. """
+        # The lock is held until the file is replaced since concurrent saves share the temporary file
+        with self.lock:
+            manifest_data = json.dumps({'version': MANIFEST_VERSION, 'lectures': self.lectures}, indent=2)
+            temporary_path = self.path.with_name(self.path.name + TEMPORARY_SUFFIX)
+            temporary_path.write_text(manifest_data)
+            finalize_file(temporary_path, self.path)
+
+    def is_complete(self, lecture_url: str) -> bool:
+        """
+        Check if a lecture was completely downloaded and all of its files still exist with their recorded sizes.
+
+        :param lecture_url: The url of the lecture
+        """
+        with self.lock:
+            lecture = self.lectures.get(lecture_url)
+            if lecture is None or not lecture.get('complete'):
+                return False
+            for relative_path, file_details in lecture.get('files', {}).items():
+                file_path = self.course_dir / relative_path
+                if not file_path.is_file() or file_path.stat().st_size != file_details.get('size'):
+                    return False
+            return True
+
+    def record_file(self, lecture_url: str, file_path: Path, url: str | None, size: int, etag: str | None = None, last_modified: str | None = None, sha256: str | None = None):
+        """
+        Record a file that was downloaded for a lecture.
+
+        :param lecture_url: The url of the lecture the file belongs to
+        :param file_path: The path of the downloaded file
+        :param url: The url the file was downloaded from, None for text lectures
+        :param size: The size of the file in bytes
+        :param etag: The ETag header of the download
+        :param last_modified: The Last-Modified header of the download
+        :param sha256: The SHA-256 of the file if it was calculated
+        """
+        relative_path = file_path.relative_to(self.course_dir).as_posix()
+        with self.lock:
+            lecture = self.lectures.setdefault(lecture_url, {'complete': False, 'files': {}})
+            lecture['files'][relative_path] = {
+                'url': url,
+                'size': size,
+                'etag': etag,
+                'last_modified': last_modified,
+                'sha256': sha256
+            }
+
+    def get_file(self, lecture_url: str, file_path: Path) -> Dict[str, Any] | None:
+        """
+        Get the details recorded for a file of a lecture, None if it wasn't recorded.
+
+        :param lecture_url: The url of the lecture the file belongs to
+        :param file_path: The path of the file
+        """
+        relative_path = file_path.relative_to(self.course_dir).as_posix()
+        with self.lock:
+            file_details = self.lectures.get(lecture_url, {}).get('files', {}).get(relative_path)
+            return dict(file_details) if file_details is not None else None
+
+    def record_lecture(self, lecture_url: str, name: str, lecture_type: str, complete: bool):
+        """
+        Record the details of a lecture and if all of its files were downloaded.
+
+        :param lecture_url: The url of the lecture
+        :param name: The name of the lecture
+        :param lecture_type: The type of the lecture (video or text)
+        :param complete: If all the files of the lecture were downloaded
+        """
+        with self.lock:
+            lecture = self.lectures.setdefault(lecture_url, {'files': {}})
+            lecture.update(name=name, type=lecture_type, complete=complete)
+
+    def mark_incomplete(self, lecture_url: str):
+        """
+        Mark a lecture as incomplete so that it's downloaded again by the next sync.
+
+        :param lecture_url: The url of the lecture
+        """
+        with self.lock:
+            if lecture_url in self.lectures:
+                self.lectures[lecture_url]['complete'] = False
+
+    def get_files(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """ Get every recorded file as the url of its lecture, its path relative to the course directory and its details. """
+        with self.lock:
+            return [
+                (lecture_url, relative_path, dict(file_details))
+                for lecture_url, lecture in self.lectures.items()
+                for relative_path, file_details in lecture.get('files', {}).items()
+            ]
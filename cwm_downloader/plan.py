@@ -0,0 +1,324 @@
+"""
+This module provides the download plan of a course, which lists every lecture and file that a
+download would fetch with the path it would be stored in and its size, without downloading anything.
+Plans are stored as json so that they can be read by other programs, and can be downloaded later
+by the PlanDownloader without scraping the course again.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import List, Tuple
+from requests import Session
+from rich.progress import Progress
+from cwm_downloader.async_backend import AsyncBackend
+from cwm_downloader.cache import PageCache
+from cwm_downloader.exceptions import ElementNotFoundError, RequestFailedError
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.retry import handle_network_errors
+from cwm_downloader.scraper._scraper import DEFAULT_PARSER
+from cwm_downloader.scraper.course_scraper import Course
+from cwm_downloader.scraper.lecture_scraper import Lecture, OnExists, check_existing_file, transfer_file
+from cwm_downloader.transfer import DEFAULT_CHUNK_SIZE, probe_download, sweep_temporary_files
+from cwm_downloader.utils import (
+    get_course_progress_bar,
+    get_progress_bar,
+    get_status,
+    handle_range_error,
+    progress_task,
+    render_message,
+    run_lecture_jobs,
+    sterialize_file_or_folder,
+)
+
+# Increase this when the format of the plan changes in a way older versions can't read
+PLAN_VERSION = 1
+
+
+@dataclass
+class PlannedFile:
+    """ A file of a lecture. The url is None for text lectures which are made from the lecture page. """
+    url: str | None
+    # The path of the file relative to the base directory of the plan
+    path: str
+    # The size of the file in bytes, None if the server didn't tell it
+    size: int | None = None
+
+
+@dataclass
+class PlannedLecture:
+    section: str
+    name: str
+    url: str
+    type: str | None
+    files: List[PlannedFile] = field(default_factory=list)
+    # Why the lecture couldn't be planned if it couldn't
+    error: str | None = None
+
+
+@dataclass
+class Plan:
+    course: str
+    url: str
+    base_dir: str
+    lectures: List[PlannedLecture] = field(default_factory=list)
+    version: int = PLAN_VERSION
+
+    @property
+    def files(self) -> List[PlannedFile]:
+        return [file for lecture in self.lectures for file in lecture.files]
+
+    @property
+    def total_bytes(self) -> int:
+        """ The size of all the files whose size is known """
+        return sum(file.size for file in self.files if file.size is not None)
+
+    @property
+    def unknown_sizes(self) -> int:
+        """ The number of files that would be downloaded but whose size is unknown """
+        return sum(1 for file in self.files if file.url is not None and file.size is None)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'total_bytes': self.total_bytes, 'unknown_sizes': self.unknown_sizes}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+    @classmethod
+    def from_dict(cls, plan_data: dict) -> 'Plan':
+        """
+        Make a plan from the dictionary of a plan file. A ValueError is raised if the plan is
+        invalid or was made by a newer version of the app.
+
+        :param plan_data: The dictionary made by Plan.to_dict
+        """
+        if not isinstance(plan_data, dict) or plan_data.get('version') != PLAN_VERSION:
+            raise ValueError('The plan was made by a different version of the app, make it again with the plan command')
+        try:
+            lectures = [
+                PlannedLecture(**{**lecture, 'files': [PlannedFile(**file) for file in lecture['files']]})
+                for lecture in plan_data['lectures']
+            ]
+            return cls(plan_data['course'], plan_data['url'], plan_data['base_dir'], lectures)
+        except (KeyError, TypeError) as error:
+            raise ValueError(f'The plan is invalid ({error})')
+
+    @classmethod
+    def load(cls, plan_path: Path) -> 'Plan':
+        """
+        Load a plan file made by the plan command.
+
+        :param plan_path: The path of the plan file
+        """
+        return cls.from_dict(json.loads(plan_path.read_text()))
+
+
+def select_lectures(all_sections: dict, section_no: int | None, lecture_no: int | None, only: bool) -> List[Tuple[str, Lecture]]:
+    """
+    Select the lectures that a download with the same section, lecture and only options would download.
+    The numbers start from 0 and None means they are not given.
+
+    :param all_sections: The sections of the course mapped to their lectures (Course.get_all_sections)
+    :param section_no: The index of the section
+    :param lecture_no: The index of the lecture
+    :param only: If True, only the given lecture or section is selected instead of everything after it
+    """
+    section_names = list(all_sections.keys())
+    if only:
+        if section_no is None and lecture_no is None:
+            raise ValueError('Cannot use --only without a section or lecture')
+        section_name = section_names[section_no or 0]
+        if lecture_no is None:
+            return [(section_name, lecture) for lecture in all_sections[section_name]]
+        return [(section_name, all_sections[section_name][lecture_no])]
+    section_no, lecture_no = section_no or 0, lecture_no or 0
+    selected: List[Tuple[str, Lecture]] = []
+    for index, section_name in enumerate(section_names[section_no:]):
+        first_lecture_no = lecture_no if index == 0 else 0
+        selected.extend((section_name, lecture) for lecture in all_sections[section_name][first_lecture_no:])
+    return selected
+
+
+def plan_lecture(lecture: Lecture, section_name: str, section_dir: Path, base_dir: Path) -> PlannedLecture:
+    """
+    List the files of a lecture without their sizes.
+
+    :param lecture: The lecture to plan
+    :param section_name: The name of the section of the lecture
+    :param section_dir: The directory the lecture would be downloaded in
+    :param base_dir: The base directory the paths are made relative to
+    """
+    try:
+        lecture_type = lecture.get_type()
+        planned_lecture = PlannedLecture(section_name, str(lecture), lecture.url, lecture_type)
+        if lecture_type == 'text':
+            file_path = section_dir / sterialize_file_or_folder(f'{lecture}.html')
+            planned_lecture.files.append(PlannedFile(None, file_path.relative_to(base_dir).as_posix()))
+        for download_url, file_path in lecture.get_download_targets(section_dir):
+            planned_lecture.files.append(PlannedFile(download_url, file_path.relative_to(base_dir).as_posix()))
+    except (RequestFailedError, ElementNotFoundError) as error:
+        return PlannedLecture(section_name, lecture.url, lecture.url, None, error=str(error))
+    return planned_lecture
+
+
+def get_file_size(course: Course, url: str) -> int | None:
+    """
+    Get the size of a downloadable url with a HEAD request, None if it's unknown or the request failed.
+
+    :param course: The course whose session and timeout are used
+    :param url: The downloadable url
+    """
+    try:
+        _, size, _ = handle_network_errors(probe_download)(course.session, url, course.timeout)
+    except RequestFailedError:
+        return None
+    return size
+
+
+@handle_range_error
+def make_plan(course: Course, base_dir: Path, section_no: int | None = None, lecture_no: int | None = None, only: bool = False, workers: int = 8) -> Plan:
+    """
+    Make the plan of downloading a course, including the sizes of all the files.
+
+    :param course: The course to plan
+    :param base_dir: The directory the course would be downloaded in
+    :param section_no: The index of the section to start from (or the only section if only is True)
+    :param lecture_no: The index of the lecture to start from (or the only lecture if only is True)
+    :param only: If True, plan only the given lecture or section
+    :param workers: The number of lecture pages and file sizes fetched at the same time
+    """
+    with get_status('[bold]Planning the download'):
+        all_sections = course.get_all_sections()
+        course_dir = base_dir / sterialize_file_or_folder(str(course))
+        selected_lectures = select_lectures(all_sections, section_no, lecture_no, only)
+    course.prefetch_lectures([lecture for _, lecture in selected_lectures], workers)
+    plan = Plan(str(course), course.url, str(base_dir.resolve()))
+    for section_name, lecture in selected_lectures:
+        section_dir = course_dir / sterialize_file_or_folder(section_name)
+        plan.lectures.append(plan_lecture(lecture, section_name, section_dir, base_dir))
+
+    remote_files = [file for file in plan.files if file.url is not None]
+    with get_status(f'[bold]Getting the size of {len(remote_files)} files'), ThreadPoolExecutor(max_workers=workers) as executor:
+        for file, size in zip(remote_files, executor.map(lambda file: get_file_size(course, file.url) if file.url else None, remote_files)):
+            file.size = size
+    return plan
+
+
+class PlanDownloader:
+    """
+    Download the files of a plan straight from their urls without scraping the course again.
+    Text lectures are made from their lecture pages so only their pages are requested.
+    """
+
+    def __init__(self, session: Session, timeout: int = 60, page_cache: PageCache | None = None, parser: str = DEFAULT_PARSER, async_backend: AsyncBackend | None = None):
+        """
+        Constructor
+
+        :param session: The session used to download the files
+        :param timeout: The amount of time to wait for the server
+        :param page_cache: The page cache used for the pages of text lectures
+        :param parser: The parser used for the pages of text lectures
+        :param async_backend: If given, the files are downloaded on its event loop
+        """
+        self.session = session
+        self.timeout = timeout
+        self.page_cache = page_cache
+        self.parser = parser
+        self.async_backend = async_backend
+
+    def download(self, plan: Plan, base_dir: Path, workers: int = 1, **lecture_download_args):
+        """
+        Download the lectures of a plan and record them in the manifest of the course so that
+        sync knows about them.
+
+        :param plan: The plan to download
+        :param base_dir: The directory the paths of the plan are relative to
+        :param workers: The number of lectures to download at the same time
+
+        The rest of the key worded arguments are used to customize download_lecture
+        """
+        course_dir = base_dir / sterialize_file_or_folder(plan.course)
+        course_dir.mkdir(parents=True, exist_ok=True)
+        sweep_temporary_files(course_dir)
+        manifest = Manifest.load(course_dir)
+        lectures = []
+        for planned_lecture in plan.lectures:
+            if planned_lecture.error is not None:
+                render_message('warning', f'Skipping, The lecture {planned_lecture.url} couldn\'t be planned. {planned_lecture.error}')
+                continue
+            lectures.append(planned_lecture)
+        render_message('info', f'Downloading Course {plan.course} from a plan')
+        render_message('info', f'{len(lectures)} lectures with {len(plan.files)} files, {plan.total_bytes / 1024 ** 2:.1f} MB in total')
+        if workers <= 1:
+            for planned_lecture in lectures:
+                self.download_lecture(planned_lecture, base_dir, manifest=manifest, **lecture_download_args)
+            return
+
+        course_progress_bar = get_course_progress_bar()
+        transfers_progress_bar = get_progress_bar()
+        course_task_id = course_progress_bar.add_task('course', filename=plan.course, total=len(lectures))
+        run_lecture_jobs(
+            [(partial(self.download_lecture, planned_lecture, base_dir, manifest=manifest, **lecture_download_args), course_task_id) for planned_lecture in lectures],
+            workers, course_progress_bar, transfers_progress_bar
+        )
+
+    def download_lecture(self, planned_lecture: PlannedLecture, base_dir: Path, chunk_size: int = DEFAULT_CHUNK_SIZE, on_exists: OnExists = 'ask', progress_bar: Progress | None = None, segments: int = 1, manifest: Manifest | None = None, checksum: bool = False):
+        """
+        Download the files of a planned lecture. Files that already exist with their planned size
+        are kept (unless on_exists is overwrite), so a plan can be run again to finish an interrupted download.
+
+        :param planned_lecture: The lecture to download
+        :param base_dir: The directory the paths of the plan are relative to
+        :param chunk_size: The size of the first chunk to download, it adapts to the speed of the connection.
+        :param on_exists: What to do with the files that already exist, see check_existing_file
+        :param progress_bar: A progress bar shared between concurrent downloads, see Lecture.download
+        :param segments: The number of concurrent connections used to download each file.
+        :param manifest: If given, the downloaded files and the completion of the lecture are recorded in it.
+        :param checksum: If True, the SHA-256 of every downloaded file is calculated and recorded in the manifest.
+        """
+        if planned_lecture.type == 'text':
+            if manifest is not None and manifest.is_complete(planned_lecture.url):
+                # Don't request the page again for a text lecture that an earlier run made
+                return
+            # The html of a text lecture is made from its page which isn't in the plan
+            lecture = Lecture(planned_lecture.url, self.session, self.timeout, self.page_cache, self.parser, async_backend=self.async_backend)
+            section_dir = (base_dir / planned_lecture.files[0].path).parent
+            section_dir.mkdir(parents=True, exist_ok=True)
+            lecture.download(section_dir, chunk_size, on_exists, progress_bar, segments, manifest, checksum)
+            return
+        interactive = progress_bar is None
+        complete = True
+        for planned_file in planned_lecture.files:
+            if planned_file.url is None:
+                continue
+            file_path = base_dir / planned_file.path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_details = manifest.get_file(planned_lecture.url, file_path) if manifest is not None else None
+            file_action = check_existing_file(
+                self.session, planned_file.url, file_path, on_exists, interactive, self.timeout, planned_file.size,
+                file_details.get('sha256') if file_details is not None else None
+            )
+            if file_action == 'keep':
+                # It was downloaded by an earlier run of the plan
+                if manifest is not None and file_details is None:
+                    manifest.record_file(planned_lecture.url, file_path, planned_file.url, file_path.stat().st_size)
+                continue
+            if file_action == 'skip':
+                complete = False
+                continue
+            try:
+                with progress_task(progress_bar, file_path.stem) as (download_progress_bar, current_task_id):
+                    transfer_result = transfer_file(self.session, planned_file.url, file_path, download_progress_bar, current_task_id, chunk_size, self.timeout, segments, self.async_backend, checksum)
+            except RequestFailedError as error:
+                render_message('error', f'Failed to download "{file_path.name}". {error}')
+                complete = False
+                continue
+            if planned_file.size is not None and transfer_result.size != planned_file.size:
+                render_message('warning', f'The size of "{file_path.name}" changed since the plan was made.')
+            if manifest is not None:
+                manifest.record_file(planned_lecture.url, file_path, planned_file.url, transfer_result.size, transfer_result.etag, transfer_result.last_modified, transfer_result.sha256)
+        if manifest is not None:
+            manifest.record_lecture(planned_lecture.url, planned_lecture.name, planned_lecture.type or 'video', complete)
+            manifest.save()
@@ -0,0 +1,139 @@
+"""
+This module provides the limits that keep the app polite on shared connections. A bandwidth limit
+shared by all the downloads caps the number of bytes read per second and a per host request limit
+spaces out the page requests so that the site doesn't start answering with 429s.
+"""
+
+import re
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlparse
+from cwm_downloader.utils import download_cancelled
+
+# Matches a rate like 500K, 5M or 1.5G
+rate_pattern = re.compile(r'^(?P<number>\d+(?:\.\d+)?)(?P<unit>[KMG]?)B?$', re.IGNORECASE)
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(rate: str) -> int:
+    """
+    Convert a human readable rate like 5M to a number of bytes per second. The units are
+    powers of 1024 like they are in curl and wget.
+
+    :param rate: The rate to convert
+    """
+    match = rate_pattern.match(rate.strip())
+    if match is None or float(match['number']) <= 0:
+        raise ValueError(f'Invalid rate "{rate}", use a number optionally followed by K, M or G (e.g 5M)')
+    return int(float(match['number']) * RATE_UNITS[match['unit'].upper()])
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket. Tokens are added at a constant rate up to the capacity of the
+    bucket and taking more tokens than there are puts the bucket in debt, which the caller waits
+    for. Since the debt is shared, concurrent callers are served one after the other at the rate.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Constructor
+
+        :param rate: The number of tokens added per second
+        :param capacity: The maximum number of tokens that can be saved up for a burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take tokens from the bucket and get the number of seconds to wait before using them.
+
+        :param amount: The number of tokens to take
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def consume(self, amount: float):
+        """
+        Take tokens from the bucket and wait until they are available. The wait ends early
+        if the downloads are cancelled.
+
+        :param amount: The number of tokens to take
+        """
+        wait = self.reserve(amount)
+        if wait:
+            download_cancelled.wait(wait)
+
+
+class HostRateLimiter:
+    """ Space out requests so that every host gets at most a number of requests per second. """
+
+    def __init__(self, requests_per_second: float):
+        """
+        Constructor
+
+        :param requests_per_second: The maximum number of requests per second to a single host
+        """
+        self.requests_per_second = requests_per_second
+        self.buckets: dict[str, TokenBucket] = {}
+        self.lock = Lock()
+
+    def wait(self, url: str):
+        """
+        Wait until a request can be made to the host of the url.
+
+        :param url: The url about to be requested
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                # A capacity of one request spaces the requests out evenly instead of allowing bursts
+                self.buckets[host] = TokenBucket(self.requests_per_second, 1)
+            bucket = self.buckets[host]
+        bucket.consume(1)
+
+
+# The limits used by the app, replaced by configure_rate_limits. None means no limit.
+bandwidth_limiter: TokenBucket | None = None
+request_limiter: HostRateLimiter | None = None
+
+
+def configure_rate_limits(limit_rate: int | None, requests_per_second: float | None):
+    """
+    Set the limits used by every download and page request of the app
+
+    :param limit_rate: The maximum number of bytes per second downloaded by all the downloads together
+    :param requests_per_second: The maximum number of page requests per second to a single host
+    """
+    global bandwidth_limiter, request_limiter
+    # Allow a burst of a quarter of a second so that the downloads don't stop and go
+    bandwidth_limiter = TokenBucket(limit_rate, limit_rate / 4) if limit_rate else None
+    request_limiter = HostRateLimiter(requests_per_second) if requests_per_second else None
+
+
+def limit_bandwidth(amount: int):
+    """
+    Wait until the downloaded amount of bytes fits in the bandwidth limit, if there is one.
+
+    :param amount: The number of bytes that were just downloaded
+    """
+    if bandwidth_limiter is not None:
+        bandwidth_limiter.consume(amount)
+
+
+def limit_requests(url: str):
+    """
+    Wait until a page request to the host of the url fits in the request limit, if there is one.
+
+    :param url: The url of the page about to be requested
+    """
+    if request_limiter is not None:
+        request_limiter.wait(url)
@@ -0,0 +1,221 @@
+"""
+This module provides the retry engine used for every request of the app. Failed requests
+are retried with an exponential backoff and jitter until a maximum number of attempts or a
+deadline is reached, and errors that won't go away by retrying (e.g 401 or 403) are not retried.
+"""
+
+import random
+from dataclasses import dataclass, field
+from functools import wraps
+from socket import gaierror
+from threading import Lock, local
+from time import monotonic
+from typing import Callable, Dict
+import typer
+from requests import exceptions as rqexceptions
+from cwm_downloader.exceptions import IncompleteDownloadError, InvalidCredentialsError, RequestFailedError
+from cwm_downloader.utils import download_cancelled, render_message
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore
+
+# Client errors that mean the request is wrong or not allowed rather than temporary.
+# 408 (Request Timeout) and 429 (Too Many Requests) are the only retried client errors.
+RETRYABLE_CLIENT_STATUS_CODES = (408, 429)
+# Status codes of pages that the site only answers with when the credentials are wrong or expired
+CREDENTIALS_STATUS_CODES = (401, 403)
+# The errors of requests that failed on the way. Anything else raised while making a request (e.g a bug,
+# a page that doesn't have an element or a full disk) isn't a network error so it's raised as it is.
+NETWORK_ERRORS: tuple = (rqexceptions.RequestException, IncompleteDownloadError, gaierror) + ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+
+@dataclass
+class RetryPolicy:
+    """ How many times and how often a failed request is retried. """
+    # The maximum number of times a request is tried including the first attempt
+    max_attempts: int = 5
+    # The maximum number of seconds spent on a request including the retries, None for no limit
+    deadline: float | None = 10 * 60
+    # The delay before the first retry which doubles with every retry
+    base_delay: float = 2
+    # The maximum delay between two attempts
+    max_delay: float = 60
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Get a random delay between half the base delay and the exponentially growing delay so
+        that concurrent requests that failed together don't retry together.
+
+        :param attempt: The number of the attempt that just failed starting from 1
+        """
+        return random.uniform(self.base_delay / 2, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclass
+class RetryStats:
+    """ Counters of the retried and failed requests which are shown at the end of a run. """
+    retries: int = 0
+    failures: int = 0
+    # The number of retries for each kind of error
+    errors: Dict[str, int] = field(default_factory=dict)
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    def record_retry(self, error: BaseException):
+        with self.lock:
+            self.retries += 1
+            error_name = describe_error(error)
+            self.errors[error_name] = self.errors.get(error_name, 0) + 1
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def reset(self):
+        with self.lock:
+            self.retries = self.failures = 0
+            self.errors.clear()
+
+    def render_summary(self):
+        """ Show how many requests were retried and failed if there were any. """
+        if self.retries:
+            error_counts = ', '.join(f'{error_name}: {count}' for error_name, count in self.errors.items())
+            render_message('info', f'Retried requests {self.retries} times ({error_counts})')
+        if self.failures:
+            render_message('error', f'{self.failures} requests failed after retrying')
+
+
+# The policy used by handle_network_errors, replaced by configure_retries
+retry_policy = RetryPolicy()
+# The counters of all the requests made by the app
+retry_stats = RetryStats()
+# The attempt number of the request that is running on the current thread and
+# the number of retries the thread made so far
+current_attempt_state = local()
+
+
+def configure_retries(policy: RetryPolicy):
+    """
+    Set the retry policy used by every request of the app
+
+    :param policy: The new retry policy
+    """
+    global retry_policy
+    retry_policy = policy
+
+
+def current_attempt() -> int:
+    """ Get the attempt number of the request that is running on the current thread, 1 for the first attempt. """
+    return getattr(current_attempt_state, 'attempt', 1)
+
+
+def thread_retries() -> int:
+    """ Get the number of times the requests of the current thread were retried, used to count the retries of a single task. """
+    return getattr(current_attempt_state, 'retries', 0)
+
+
+def describe_error(error: BaseException) -> str:
+    """ Get a short human readable name of a network error """
+    if isinstance(error, rqexceptions.HTTPError) and error.response is not None:
+        return f'HTTP {error.response.status_code}'
+    if isinstance(error, rqexceptions.SSLError):
+        return 'SSL error'
+    if isinstance(error, rqexceptions.Timeout):
+        return 'Server timed out'
+    if isinstance(error, rqexceptions.ConnectionError):
+        return 'Connection error'
+    if isinstance(error, gaierror):
+        return 'Network error'
+    return type(error).__name__
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Check if a request that failed with the error might succeed when it's tried again.
+
+    :param error: The error raised by the request
+    """
+    if isinstance(error, rqexceptions.HTTPError) and error.response is not None:
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code in RETRYABLE_CLIENT_STATUS_CODES
+    return isinstance(error, NETWORK_ERRORS)
+
+
+def get_retry_after(error: BaseException) -> float | None:
+    """
+    Get the number of seconds the Retry-After header of an error response asks to wait, None if there is no
+    such header or it's a date.
+
+    :param error: The error raised by the request
+    """
+    if not isinstance(error, rqexceptions.HTTPError) or error.response is None:
+        return None
+    retry_after = error.response.headers.get('Retry-After')
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def raise_for_page_status(response):
+    """
+    Raise an InvalidCredentialsError if the site refused to show a page and an HTTPError for a status
+    code that is retried, so that neither a sign in page nor a temporary error page is parsed like a
+    lecture page. Other error pages are left to the caller.
+
+    :param response: A requests.Response or a PageResponse of the async backend
+    """
+    if response.status_code in CREDENTIALS_STATUS_CODES:
+        raise InvalidCredentialsError(f'The site refused to show {response.url} (HTTP {response.status_code}), the credentials might be wrong or expired.')
+    if response.status_code >= 500 or response.status_code in RETRYABLE_CLIENT_STATUS_CODES:
+        response.raise_for_status()
+
+
+def handle_network_errors(func: Callable):
+    """ 
+    A decorator to handle network errors for request downloads. Failed calls are retried
+    according to the retry_policy and a RequestFailedError is raised when the error can't
+    be retried or when the attempts or the deadline of the policy run out. Errors that
+    aren't network errors are raised as they are.
+    """
+    @wraps(func)
+    def decorated_func(*args, **kwargs):
+        policy = retry_policy
+        start_time = monotonic()
+        attempt = 1
+        # Calls can be nested (e.g a segment of a download) so the outer attempt is restored at the end
+        outer_attempt = current_attempt()
+        try:
+            while True:
+                current_attempt_state.attempt = attempt
+                try:
+                    return func(*args, **kwargs)
+                except typer.Exit as err:
+                    raise typer.Exit(err.exit_code)
+                except Exception as error:
+                    if not isinstance(error, NETWORK_ERRORS):
+                        # It isn't a failed request so it's neither retried nor counted as one
+                        raise
+                    if not is_retryable(error):
+                        retry_stats.record_failure()
+                        raise RequestFailedError(f'{describe_error(error)}: {error}') from error
+                    delay = policy.get_delay(attempt)
+                    retry_after = get_retry_after(error)
+                    if retry_after is not None:
+                        # Wait as long as the site asked, within the limits of the policy
+                        delay = min(max(delay, retry_after), policy.max_delay)
+                    out_of_time = policy.deadline is not None and monotonic() - start_time + delay > policy.deadline
+                    if attempt >= policy.max_attempts or out_of_time:
+                        retry_stats.record_failure()
+                        raise RequestFailedError(f'{describe_error(error)} after {attempt} attempts: {error}') from error
+                    render_message('error', f'{describe_error(error)}, retrying in {delay:.0f}s (attempt {attempt + 1}/{policy.max_attempts})...')
+                    retry_stats.record_retry(error)
+                    current_attempt_state.retries = thread_retries() + 1
+                    # Wait for the delay unless the downloads are cancelled in the mean time
+                    if download_cancelled.wait(delay):
+                        raise KeyboardInterrupt
+                    attempt += 1
+        finally:
+            current_attempt_state.attempt = outer_attempt
+    return decorated_func
@@ -3,13 +3,118 @@ This modules provides an Abstract Base class for the Lecture and
 Course classes.
 """
 
+import re
 import requests
+import soupsieve
 from abc import ABC, abstractmethod
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Dict, Tuple
+from cwm_downloader.async_backend import AsyncBackend
+from cwm_downloader.cache import PageCache
 from cwm_downloader.exceptions import IncorrectUrlError, ElementNotFoundError
-from cwm_downloader.utils import handle_network_errors
+from cwm_downloader.rate_limit import limit_requests
+from cwm_downloader.retry import handle_network_errors, raise_for_page_status
 from cwm_downloader.scraper.element_selectors import ElementSelectors
-from functools import cached_property
+from cwm_downloader.telemetry import measured
+
+
+# lxml is a lot faster than python's html.parser but it is an optional dependency
+DEFAULT_PARSER = 'lxml' if find_spec('lxml') is not None else 'html.parser'
+
+# The parsers that can be chosen from the cli
+PARSERS = ('lxml', 'html.parser')
+
+# If True, released soups are decomposed so that their memory is freed right away instead of
+# whenever the garbage collector gets to the reference cycles between their tags. Replaced by
+# configure_low_memory.
+low_memory = False
+
+# Matches a simple selector like div.course-mainbar.lecture-content#main
+simple_selector_pattern = re.compile(r'^(?P<name>[\w-]+)?(?P<rest>(?:[.#][\w-]+)*)$')
+
+
+def configure_low_memory(enabled: bool):
+    """
+    Set whether the pages are freed as soon as their details are extracted
+
+    :param enabled: If True, the memory used by the app stays flat on courses with many lectures at the cost of a bit of CPU
+    """
+    global low_memory
+    low_memory = enabled
+
+
+def has_class(class_name: str):
+    """
+    Create a SoupStrainer attribute matcher for a single class.
+    The class attribute is passed to the matcher unsplit while parsing so it's split here.
+
+    :param class_name: The class the tag must have
+    """
+    def matches(class_value: str | list[str] | None):
+        if class_value is None:
+            return False
+        class_names = class_value.split() if isinstance(class_value, str) else class_value
+        return class_name in class_names
+    return matches
+
+
+def parse_simple_selector(selector: str) -> tuple[str | None, str | None, list[str]]:
+    """
+    Split a simple css selector (a tag name followed by classes and an id) in to its tag name, id and classes.
+
+    :param selector: A simple css selector like "div.course-mainbar"
+    """
+    selector_match = simple_selector_pattern.match(selector)
+    if selector_match is None:
+        raise ValueError(f'{selector} is not a simple selector')
+    element_id = None
+    class_names = []
+    for prefix, value in re.findall(r'([.#])([\w-]+)', selector_match.group('rest')):
+        if prefix == '#':
+            element_id = value
+        else:
+            class_names.append(value)
+    return selector_match.group('name'), element_id, class_names
+
+
+@lru_cache(maxsize=None)
+def make_strainer(selector: str) -> SoupStrainer:
+    """
+    Turn a simple css selector (a tag name followed by classes and an id) in to a SoupStrainer
+    that only lets the matching tags and their children be parsed.
+
+    :param selector: A simple css selector like "div.course-mainbar"
+    """
+    name, element_id, class_names = parse_simple_selector(selector)
+    attrs: dict = {}
+    if element_id is not None:
+        attrs['id'] = element_id
+    if class_names:
+        # SoupStrainer can only match one value per attribute so only the first class is used
+        attrs['class'] = has_class(class_names[0])
+    return SoupStrainer(name, attrs=attrs)
+
+
+@lru_cache(maxsize=None)
+def compile_selector(selector: str) -> soupsieve.SoupSieve:
+    """
+    Compile a css selector once so that it isn't parsed again every time it's used.
+
+    :param selector: A css selector
+    """
+    return soupsieve.compile(selector)
+
+
+@lru_cache(maxsize=None)
+def get_compiled_selectors(element: ElementSelectors) -> Tuple[soupsieve.SoupSieve, ...]:
+    """
+    Get the compiled selectors of an element in the order they are tried.
+
+    :param element: An enum property i.e The list with many css selectors
+    """
+    return tuple(compile_selector(selector) for selector in element.value)
 
 
 class Scraper(ABC):
@@ -22,32 +127,101 @@ class Scraper(ABC):
     # ElementSelectors is an enum containing all the css selectors needed
     # To scrape the site.
     element_selectors = ElementSelectors
+    # The parts of the page that are parsed, the whole page is parsed if it's None
+    # or if none of the roots are found in the page.
+    parse_roots: ElementSelectors | None = None
 
-    def __init__(self, url: str, request_session: requests.Session, timeout: int = 60):
+    def __init__(self, url: str, request_session: requests.Session, timeout: int = 60, page_cache: PageCache | None = None, parser: str = DEFAULT_PARSER, async_backend: AsyncBackend | None = None):
         """
         Constructor
 
         :param url: The url of the site
         :param request_session: A requests.Session object
         :timeout: The amount of time to wait for a package before terminating the request 
+        :param page_cache: If given, the page is taken from this cache instead of requesting it every time
+        :param parser: The parser BeautifulSoup uses to parse the page (lxml or html.parser)
+        :param async_backend: If given, the page is requested on its event loop instead of with the session
         """
         # Assigning some attributes to the parameters
         self.url = url
         self.timeout = timeout
         self.session = request_session
+        self.page_cache = page_cache
+        self.parser = parser
+        self.async_backend = async_backend
+        self.__soup: BeautifulSoup | None = None
+        # The index of the selector that last found each element. Every page has a single layout
+        # so it's tried first, which saves trying the fallbacks that failed before on every call.
+        self.__winning_selectors: Dict[ElementSelectors, int] = {}
 
     # This is property that uses lazy loading to load the soup. This is
     # because making a soup is expensive so once you lazy load it you can
-    # reuse it again and again without re requesting.
-    @cached_property
-    def soup(self):
-        return self.make_soup()
+    # reuse it again and again without re requesting. functools.cached_property
+    # isn't used because before python 3.12 it holds a lock shared by every instance
+    # while the soup is made, which makes fetching pages from many threads sequential.
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self.__soup is None:
+            self.__soup = self.make_soup()
+        return self.__soup
+
+    def release_soup(self):
+        """ Drop the soup once everything needed was extracted from it, it's made again if it's used after this. """
+        if low_memory and self.__soup is not None:
+            # Nothing can use the tags of the soup after this so they are destroyed
+            self.__soup.clear(decompose=True)
+        self.__soup = None
 
-    @handle_network_errors
     def make_soup(self):
         """ Makes a BeautifulSoup object using the url and timeout attributes."""
-        content = self.session.get(self.url, timeout=self.timeout)
-        return BeautifulSoup(content.content, 'html.parser')
+        return self.parse_page(self.fetch_page())
+
+    @measured('parse')
+    def parse_page(self, content: bytes) -> BeautifulSoup:
+        """
+        Parse only the part of the page that is matched by the first found parse root, which
+        is a lot faster and uses less memory than parsing the whole page.
+
+        :param content: The html of the page
+        """
+        if self.parse_roots is not None:
+            for selector in self.parse_roots.value:
+                soup = BeautifulSoup(content, self.parser, parse_only=make_strainer(selector))
+                if soup.find() is not None:
+                    return soup
+        # The layout of the page is unknown so parse all of it
+        return BeautifulSoup(content, self.parser)
+
+    # The retries are inside of the measurement so that a page that was retried is a single fetch with its retries
+    @measured('fetch', len)
+    @handle_network_errors
+    def fetch_page(self) -> bytes:
+        """ Get the content of the page from the page cache if there is one or else request it. """
+        # The async backend can request pages in place of the session
+        session = self.async_backend or self.session
+        if self.page_cache is not None:
+            # The cache waits for the request limit itself, only when the page isn't fresh in it
+            return self.page_cache.get(session, self.url, self.timeout, self.is_expected_page)
+        limit_requests(self.url)
+        response = session.get(self.url, timeout=self.timeout)
+        raise_for_page_status(response)
+        return response.content
+
+    def is_expected_page(self, content: bytes) -> bool:
+        """
+        Cheaply check if a page has the markup of one of the parse roots, which pages like the
+        sign in page don't have. The page isn't parsed for this, only its bytes are searched.
+
+        :param content: The html of the page
+        """
+        if self.parse_roots is None:
+            return True
+        for selector in self.parse_roots.value:
+            _, element_id, class_names = parse_simple_selector(selector)
+            markers = class_names + ([element_id] if element_id is not None else [])
+            if all(marker.encode() in content for marker in markers):
+                return True
+        return False
 
     def select_element(self, element: ElementSelectors, source: Tag | BeautifulSoup | None = None, single: bool = False, raise_if_not_found: bool = True):
         """
@@ -59,21 +233,43 @@ class Scraper(ABC):
         :param raise_if_not_found: If False, don't raise an ElementNotFoundError even if that element couldn't be found on the site. 
         """
 
-        # Set the source to self.soup if the source is not given
+        # Set the source to self.soup if the source is not given. This is done before
+        # the selection is measured so that making the soup isn't measured as a selection.
         source = source if source is not None else self.soup
-        # Now we are looping over the selectors that are given to us
+        tag_list_or_tag = self.select_first_match(element, source, single)
+        if tag_list_or_tag is None and raise_if_not_found:
+            raise ElementNotFoundError(f'The element with the selector ({element.value[-1]}) is invalid!, The site might be updated...')
+        return tag_list_or_tag
+
+    @measured('select')
+    def select_first_match(self, element: ElementSelectors, source: Tag | BeautifulSoup, single: bool):
+        """
+        Select an element with the first selector of the element_selector that finds it, None if none of them do.
+
+        :param element: An enum property i.e The list with many css selectors
+        :param source: The source Tag or BeautifulSoup object that is used to search the element  parameter in.
+        :param single: If True, return a single element rather than a list of element(s)
+        """
+        compiled_selectors = get_compiled_selectors(element)
+        selector_indexes = list(range(len(compiled_selectors)))
+        winning_index = self.__winning_selectors.get(element)
+        if winning_index is not None:
+            # Try the selector that worked before first and the rest in their usual order after it
+            selector_indexes.remove(winning_index)
+            selector_indexes.insert(0, winning_index)
         # We are using a list of selectors because we can go move to another one
         # If some fails
-        for selector in element.value:
-            # Select a Tag(using source.select_one) or a ResultSet(using source.select) accoring to the
+        for index in selector_indexes:
+            # Select a Tag(using select_one) or a list of Tags(using select) accoring to the
             # single parameter.
-            tag_list_or_tag = list(source.select(selector)) if not single else source.select_one(selector)
+            selector = compiled_selectors[index]
+            tag_list_or_tag = selector.select(source) if not single else selector.select_one(source)
             # only return the element(s) if it is not none i.e
             # If it is found
             if tag_list_or_tag:
+                self.__winning_selectors[element] = index
                 return tag_list_or_tag
-        if raise_if_not_found:
-            raise ElementNotFoundError(f'The element with the selector ({selector}) is invalid!, The site might be updated...')
+        return None
 
     @property
     def url(self):
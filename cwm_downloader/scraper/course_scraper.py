@@ -2,11 +2,28 @@
 Provides the Course class which can allow to easily multiple courses.
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
-from cwm_downloader.scraper.lecture_scraper import Lecture
-from cwm_downloader.scraper._scraper import Scraper
+from typing import List, Tuple
+import requests
+from cwm_downloader.async_backend import AsyncBackend
+from cwm_downloader.cache import PageCache
+from cwm_downloader.exceptions import ElementNotFoundError, RequestFailedError
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.scraper.lecture_scraper import Lecture, LectureExtractor
+from cwm_downloader.scraper._scraper import DEFAULT_PARSER, Scraper
+from cwm_downloader.transfer import sweep_temporary_files
 from urllib.parse import urljoin
-from cwm_downloader.utils import render_message, handle_range_error, get_status, sterialize_file_or_folder
+from cwm_downloader.utils import (
+    get_course_progress_bar,
+    get_progress_bar,
+    get_status,
+    handle_range_error,
+    render_message,
+    run_lecture_jobs,
+    sterialize_file_or_folder,
+)
 
 
 class Course(Scraper):
@@ -15,6 +32,23 @@ class Course(Scraper):
     and that can also download them.
     """
 
+    parse_roots = Scraper.element_selectors.course_page_roots
+
+    def __init__(self, url: str, request_session: requests.Session, timeout: int = 60, page_cache: PageCache | None = None, parser: str = DEFAULT_PARSER, lecture_extractor: LectureExtractor = 'soup', async_backend: AsyncBackend | None = None):
+        """
+        Constructor
+
+        :param url: The url of any lecture of the course
+        :param request_session: A requests.Session object
+        :timeout: The amount of time to wait for a package before terminating the request 
+        :param page_cache: If given, the pages are taken from this cache instead of requesting them every time
+        :param parser: The parser BeautifulSoup uses to parse the pages (lxml or html.parser)
+        :param lecture_extractor: How the details of the lectures are extracted from their pages (soup or stream)
+        :param async_backend: If given, the pages and files of the course are requested on its event loop
+        """
+        super().__init__(url, request_session, timeout, page_cache, parser, async_backend)
+        self.lecture_extractor = lecture_extractor
+
     @handle_range_error
     def download_lecture(self, base_dir: Path, section_no: int, lecture_no: int, all_sections=None, **lecture_download_args):
         """
@@ -42,7 +76,7 @@ class Course(Scraper):
         lecture_to_download.download(base_dir, **lecture_download_args)
 
     @handle_range_error
-    def download_section(self, base_dir: Path, section_no: int, lecture_no: int, all_sections=None, **lecture_download_args):
+    def download_section(self, base_dir: Path, section_no: int, lecture_no: int, all_sections=None, workers: int = 1, prefetch: int = 0, **lecture_download_args):
         """
         Download a section using its section number
 
@@ -50,6 +84,8 @@ class Course(Scraper):
         :param section_no: The index of the section to be downloaded
         :param lecture_no: The starting index of the lecture to be downloaded
         :param all_sections: A dictionary which maps the sections to a list of their corresponding lectures 
+        :param workers: The number of lectures to download at the same time
+        :param prefetch: The number of lecture pages to fetch at the same time before downloading
 
         Since this method uses Lecture.download under the hood the rest of the
         key worded arguments will be used to customize Lecture.download 
@@ -70,17 +106,23 @@ class Course(Scraper):
 
         # Get the lectures to download in the "section_to_download" key
         lectures_to_download: list[Lecture] = all_sections[section_to_download][lecture_no:]
+        self.prefetch_lectures(lectures_to_download, prefetch)
+        if workers > 1:
+            self.download_lectures([(lecture, section_dir) for lecture in lectures_to_download], workers, **lecture_download_args)
+            return
         for lecture in lectures_to_download:
             lecture.download(section_dir, **lecture_download_args)
 
     @handle_range_error
-    def download(self, base_dir: Path, section_no: int = 0, lecture_no: int = 0,  **section_download_args):
+    def download(self, base_dir: Path, section_no: int = 0, lecture_no: int = 0, workers: int = 1, prefetch: int = 0, **section_download_args):
         """
         Download a course starting from a given section number
 
         :param base_dir: The directory in which the course directory will live in
         :param section_no: The index of the section to start downloading from
         :param lecture_no: The starting index of the lectures found in the first section
+        :param workers: The number of lectures to download at the same time
+        :param prefetch: The number of lecture pages to fetch at the same time before downloading
 
         Since this method uses the download_section method under the hood the rest
         of the key worded arguments passed are used to customize download_section.
@@ -97,6 +139,16 @@ class Course(Scraper):
             # Sterialize the folder names to address the issue #2
             course_dir = base_dir / sterialize_file_or_folder(str(self))
             course_dir.mkdir(exist_ok=True)
+            sweep_temporary_files(course_dir)
+            # Record the downloads in the manifest too so that they can be synced and verified later
+            section_download_args.setdefault('manifest', Manifest.load(course_dir))
+
+            # Pair every selected lecture with the directory of its section
+            lectures_to_download: List[Tuple[Lecture, Path]] = []
+            for index, section_name in enumerate(sections_to_download):
+                section_dir = course_dir / sterialize_file_or_folder(section_name)
+                first_lecture_no = lecture_no if index == 0 else 0
+                lectures_to_download.extend((lecture, section_dir) for lecture in all_sections[section_name][first_lecture_no:])
 
             # Loop over the enumerations of the selected sections to get the indexes and pass the to download_section which
             # downloads an indivisual section using the seciton number.
@@ -105,14 +157,111 @@ class Course(Scraper):
         # gets printed to the user we gotta +1 to it again
         render_message('info', f'Downloading Course {self}')
         render_message('info', f'From [blue]Section {section_no+1}[/] and [blue]From Lecture {lecture_no+1}[/]')
-        for index, _ in enumerate(sections_to_download):
+        self.prefetch_lectures([lecture for lecture, _ in lectures_to_download], prefetch)
+        if workers > 1:
+            # Queue the lectures of every section in a single pool so that the workers
+            # don't sit idle at the end of each section.
+            for _, section_dir in lectures_to_download:
+                section_dir.mkdir(exist_ok=True)
+            self.download_lectures(lectures_to_download, workers, **section_download_args)
+            return
+        for index, _ in enumerate(sections_to_download, start=section_no):
             # If it is the first section then apply the lecture_no specified
-            if index == 0:
+            if index == section_no:
                 self.download_section(course_dir, index, lecture_no, all_sections, **section_download_args)
                 continue
             self.download_section(course_dir, index, 0, all_sections, **section_download_args)
             # We passed all_sections to self.download_section not to call self.get_all_sections everytime
 
+    def sync(self, base_dir: Path, workers: int = 1, prefetch: int = 0, **lecture_download_args):
+        """
+        Download only the lectures of the course that are new or were not completely downloaded
+        before. The downloaded lectures are remembered in a manifest inside the course directory
+        so that syncing an up to date course only requests the course page.
+
+        :param base_dir: The directory in which the course directory will live in
+        :param workers: The number of lectures to download at the same time
+        :param prefetch: The number of lecture pages to fetch at the same time before downloading
+
+        The rest of the key worded arguments are used to customize Lecture.download
+        """
+        with get_status('[bold]Initializing Sync'):
+            manifest, lectures_to_download, lecture_count = self.get_lectures_to_sync(base_dir)
+        render_message('info', f'Syncing Course {self}')
+        render_message('info', f'{len(lectures_to_download)} of {lecture_count} lectures are new or incomplete')
+        self.prefetch_lectures([lecture for lecture, _ in lectures_to_download], prefetch)
+        if workers > 1:
+            self.download_lectures(lectures_to_download, workers, manifest=manifest, **lecture_download_args)
+            return
+        for lecture, section_dir in lectures_to_download:
+            lecture.download(section_dir, manifest=manifest, **lecture_download_args)
+
+    def get_lectures_to_sync(self, base_dir: Path) -> Tuple[Manifest, List[Tuple[Lecture, Path]], int]:
+        """
+        Get the manifest of the course, the lectures that are new or incomplete paired with the
+        directory of their section (which is created) and the number of lectures in the course.
+
+        :param base_dir: The directory in which the course directory will live in
+        """
+        all_sections = self.get_all_sections()
+        course_dir = base_dir / sterialize_file_or_folder(str(self))
+        course_dir.mkdir(exist_ok=True)
+        sweep_temporary_files(course_dir)
+        manifest = Manifest.load(course_dir)
+
+        lectures_to_download: List[Tuple[Lecture, Path]] = []
+        for section_name, lectures in all_sections.items():
+            section_dir = course_dir / sterialize_file_or_folder(section_name)
+            lectures_to_download.extend((lecture, section_dir) for lecture in lectures if not manifest.is_complete(lecture.url))
+        for _, section_dir in lectures_to_download:
+            section_dir.mkdir(exist_ok=True)
+        lecture_count = sum(len(lectures) for lectures in all_sections.values())
+        return manifest, lectures_to_download, lecture_count
+
+    def prefetch_lectures(self, lectures: List[Lecture], workers: int):
+        """
+        Fetch the pages of lectures concurrently so that their names, types and download urls
+        are ready before the first file is downloaded. Pages that fail to be fetched are fetched
+        again when their lecture is downloaded.
+
+        :param lectures: The lectures whose pages should be fetched
+        :param workers: The maximum number of pages fetched at the same time. 0 disables prefetching.
+        """
+        if workers <= 0 or not lectures:
+            return
+
+        def fetch_page(lecture: Lecture):
+            try:
+                # Getting the type extracts all the metadata of the lecture and releases its page
+                lecture.get_type()
+            except (RequestFailedError, ElementNotFoundError) as error:
+                render_message('warning', f'Failed to prefetch {lecture.url}, it will be fetched again when it is downloaded: {error}')
+
+        with get_status(f'[bold]Fetching {len(lectures)} lecture pages') as status, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            for fetched_count, future in enumerate(as_completed([executor.submit(fetch_page, lecture) for lecture in lectures]), start=1):
+                # Anything else is a bug, which shouldn't be hidden
+                future.result()
+                status.update(f'[bold]Fetching lecture pages {fetched_count}/{len(lectures)}')
+
+    def download_lectures(self, lectures: List[Tuple[Lecture, Path]], workers: int, **lecture_download_args):
+        """
+        Download lectures concurrently using a bounded pool of worker threads.
+        Every active transfer gets a row in a shared progress bar under an overall course bar.
+
+        :param lectures: A list of lectures paired with the directory they should be downloaded in
+        :param workers: The maximum number of lectures that are downloaded at the same time
+
+        The rest of the key worded arguments are used to customize Lecture.download
+        """
+        course_progress_bar = get_course_progress_bar()
+        transfers_progress_bar = get_progress_bar()
+        course_task_id = course_progress_bar.add_task('course', filename=str(self), total=len(lectures))
+        run_lecture_jobs(
+            [(partial(lecture.download, lecture_dir, **lecture_download_args), course_task_id) for lecture, lecture_dir in lectures],
+            workers, course_progress_bar, transfers_progress_bar
+        )
+
     def get_all_sections(self):
         """
         Returns all the sections mapped with their corresponding lectures.
@@ -125,7 +274,7 @@ class Course(Scraper):
             f"{index + 1}-{self.select_element(self.element_selectors.section_names, section_container, single=True).get_text(strip=True)}": [
                 # Since we get the relative url of the lectures when using the href attribute of the anchor tags,
                 # we can use urljoin which smartly joins the base url with the relative url.
-                Lecture(urljoin(self.base_url, lecture.get('href')), self.session, self.timeout) for lecture in self.select_element(self.element_selectors.lecture_anchor_tags, section_container)
+                Lecture(urljoin(self.base_url, lecture.get('href')), self.session, self.timeout, self.page_cache, self.parser, self.lecture_extractor, self.async_backend) for lecture in self.select_element(self.element_selectors.lecture_anchor_tags, section_container)
             ] for index, section_container in enumerate(section_containers)
         }
         return section_lectures
@@ -9,6 +9,7 @@ class ElementSelectors(Enum):
     """
     course_name = [
         # "#__next div div div.jsx-1640592643.wrap h1",
+        "div.course-sidebar h2",
         "body section div.course-sidebar h2"
     ]
     section_containers = [
@@ -26,6 +27,14 @@ class ElementSelectors(Enum):
         "body section div.course-mainbar div.row div ul li a",
     ]
     download_tags = ["a.download"]
-    main_container_div = ["body section div.course-mainbar.lecture-content.full-width-content"]
+    main_container_div = [
+        "div.course-mainbar.lecture-content.full-width-content",
+        "body section div.course-mainbar.lecture-content.full-width-content"
+    ]
     decomposable_elements = ['a.btn.complete.lecture-complete', '#empty_box', 'div.attachment-data', 'div.row attachment-pdf-embed']
     attribute_cleared_meta_tag = ['#lecture-completion-data']
+    # The roots of the only parts of the pages that are parsed. These must be simple
+    # selectors made of a tag name, classes and an id since they are turned in to a
+    # SoupStrainer rather than being used with select. See _scraper.make_strainer
+    course_page_roots = ["div.course-sidebar"]
+    lecture_page_roots = ["div.course-mainbar"]
@@ -2,26 +2,243 @@
 This modules provides a Lecture class that can download a lecture
 using its url.
 """
+from dataclasses import dataclass
 from pathlib import Path
+import requests
 from bs4 import Tag
 from rich.progress import Progress, TaskID
-from typing import Dict, Iterable, Literal
-from cwm_downloader.scraper._scraper import Scraper
-from cwm_downloader.utils import get_progress_bar, handle_keyboard_interrupt_for_files, handle_network_errors, render_message, sterialize_file_or_folder
+from typing import Dict, Iterable, List, Literal, Tuple
+from cwm_downloader.async_backend import AsyncBackend
+from cwm_downloader.cache import PageCache
+from cwm_downloader.exceptions import RequestFailedError
+from cwm_downloader.scraper import _scraper
+from cwm_downloader.scraper._scraper import DEFAULT_PARSER, Scraper, compile_selector
+from cwm_downloader.scraper.stream_extractor import STREAM_CHUNK_SIZE, LectureDetails, extract_lecture_details
+from cwm_downloader.rate_limit import limit_requests
+from cwm_downloader.retry import handle_network_errors, raise_for_page_status
+from cwm_downloader.utils import progress_task, render_message, sterialize_file_or_folder
 from cwm_downloader.scraper.markup_template import create_markup
+from cwm_downloader.telemetry import measured
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.transfer import DEFAULT_CHUNK_SIZE, TransferResult, download_file, download_file_segmented, get_partial_path, hash_file, probe_download, write_file
 
 # These are two possible types of a lecture that are
 # either a video type or a text type.
 LectureType = Literal['video', 'text']
 
+# The ways the details of a lecture can be extracted from its page. The soup extractor parses
+# the page with BeautifulSoup and the stream extractor reads the details while the page is
+# downloaded and stops the download once they are found.
+LectureExtractor = Literal['soup', 'stream']
+EXTRACTORS = ('soup', 'stream')
+# What to do with a file that already exists, see check_existing_file
+OnExists = Literal['skip', 'overwrite', 'resume', 'ask', 'verify']
+ON_EXISTS_POLICIES = ('skip', 'overwrite', 'resume', 'ask', 'verify')
+# What is done with a file, download it, keep it since it's complete or skip it even though it might not be complete
+FileAction = Literal['download', 'keep', 'skip']
+
+@dataclass(frozen=True, slots=True)
+class LectureMetadata:
+    """
+    Everything the app needs from the page of a lecture. It's extracted in a single pass so
+    that the elements aren't selected again every time they are needed and the page can be released.
+    """
+    name: str
+    # The number at the start of the name, None if the name doesn't start with one
+    number: str | None
+    type: LectureType
+    # The download urls paired with their original file names, None if there is nothing to download
+    downloads: Tuple[Tuple[str | None, str], ...] | None
+    # The cleaned html of a text lecture, None for video lectures
+    text_html: str | None
+
+
+def parse_lecture_number(lecture_name: str) -> str | None:
+    """
+    Get the number at the start of the name of a lecture, None if it doesn't have one.
+
+    :param lecture_name: The name of the lecture like "1- Welcome"
+    """
+    # Split the lecture name with a "-"" since thats what the lectures separate their numbers in
+    lecture_name_number = lecture_name.split('-')
+    if len(lecture_name_number) < 1 or not lecture_name_number[0].strip().isdigit():
+        # This means that either there is no "-" sign which probably means no number
+        # or the first index is not a digit
+        return None
+    return lecture_name_number[0]
+
+
+def transfer_file(session: requests.Session, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, segments: int = 1, async_backend: AsyncBackend | None = None, checksum: bool = False) -> TransferResult:
+    """
+    Download a url with the transfer that fits the options, resuming its partial file if there is one.
+
+    :param session: The session used to make the requests
+    :param url: The downloadable url
+    :param file_path: Where to store the final file
+    :param progress_bar: A rich.Progress object used to update the current progress bar task
+    :param current_task_id: The id of the task to use when downloading
+    :param chunk_size: The size of the first chunk to download, it adapts to the speed of the connection.
+    :param timeout: The amount of time to wait for the server
+    :param segments: If more than 1, download the file in that many byte ranges at the same time.
+    :param async_backend: If given, the file is downloaded on its event loop
+    :param checksum: If True, the SHA-256 of the file is calculated while it's downloaded
+    """
+    if get_partial_path(file_path).exists():
+        render_message('info', f'Resuming the download of "{file_path.name}".')
+    if async_backend is not None:
+        # The event loop already downloads many files at the same time so the files are not segmented
+        return async_backend.download_file(url, file_path, progress_bar, current_task_id, chunk_size, timeout, checksum)
+    if segments > 1:
+        return download_file_segmented(session, url, file_path, progress_bar, current_task_id, chunk_size, timeout, segments, checksum)
+    return download_file(session, url, file_path, progress_bar, current_task_id, chunk_size, timeout, checksum)
+
+
+def check_existing_file(session: requests.Session, url: str | None, file_path: Path, on_exists: OnExists, interactive: bool, timeout: int, known_size: int | None = None, known_sha256: str | None = None) -> FileAction:
+    """
+    Decide what to do with a file according to what to do with existing files. Files that already
+    have their known size (from the manifest or a plan) are kept without making a request, otherwise
+    the size of the remote file is asked for with a HEAD request.
+
+    :param session: The session used to request the size of the remote file
+    :param url: The downloadable url of the file, None for text lectures
+    :param file_path: The path the file would be downloaded to
+    :param on_exists: What to do if the file exists.
+    skip: skip it if it has the size of the remote file, download it again otherwise.
+    resume: like skip, but continue a file that is smaller than the remote file instead of downloading it again.
+    verify: like skip, but also compare the SHA-256 of the file if it was recorded.
+    ask: ask the user, or skip the file if interactive is False.
+    overwrite: always download it again.
+    :param interactive: If the user can be asked
+    :param timeout: The amount of time to wait for the server
+    :param known_size: The size the file had when it was downloaded or planned
+    :param known_sha256: The SHA-256 of the file when it was downloaded
+    """
+    if on_exists == 'overwrite' or not file_path.is_file():
+        return 'download'
+    local_size = file_path.stat().st_size
+    if known_size is not None and local_size == known_size:
+        if on_exists == 'verify' and known_sha256 is not None and hash_file(file_path).hexdigest() != known_sha256:
+            render_message('warning', f'The checksum of "{file_path.name}" doesn\'t match, downloading it again.')
+            return 'download'
+        return 'keep'
+    if on_exists == 'ask':
+        return 'download' if Lecture.should_overwrite(file_path, False, interactive) else 'skip'
+    if url is None:
+        # A text lecture can only be compared with the manifest, and it's written atomically so it's complete if it exists
+        return 'keep' if known_size is None else 'download'
+    try:
+        _, remote_size, accepts_ranges = handle_network_errors(probe_download)(session, url, timeout)
+    except RequestFailedError:
+        remote_size, accepts_ranges = None, False
+    if remote_size is None:
+        render_message('warning', f'Skipping, "{file_path.name}" exists and the size of the remote file is unknown.')
+        return 'skip'
+    if local_size == remote_size:
+        return 'keep'
+    partial_path = get_partial_path(file_path)
+    if on_exists == 'resume' and local_size < remote_size and accepts_ranges and not partial_path.exists():
+        # The file was probably cut short by a crash of an older version, so continue it
+        file_path.replace(partial_path)
+    return 'download'
+
+
 class Lecture(Scraper):
     """
     Download any lecture with its resources (Download any thing in the lecture page that has an anchor tag
     with a download class).
     """
 
+    parse_roots = Scraper.element_selectors.lecture_page_roots
+
+    def __init__(self, url: str, request_session: requests.Session, timeout: int = 60, page_cache: PageCache | None = None, parser: str = DEFAULT_PARSER, extractor: LectureExtractor = 'soup', async_backend: AsyncBackend | None = None):
+        """
+        Constructor
+
+        :param url: The url of the lecture
+        :param request_session: A requests.Session object
+        :timeout: The amount of time to wait for a package before terminating the request 
+        :param page_cache: If given, the page is taken from this cache instead of requesting it every time
+        :param parser: The parser BeautifulSoup uses to parse the page (lxml or html.parser)
+        :param extractor: How the name, type and download urls of the lecture are extracted (soup or stream)
+        :param async_backend: If given, the page and the files of the lecture are requested on its event loop
+        """
+        super().__init__(url, request_session, timeout, page_cache, parser, async_backend)
+        self.extractor = extractor
+        self.__details: LectureDetails | None = None
+        self.__metadata: LectureMetadata | None = None
+        # The part of the page that was read by the stream extractor
+        self.__streamed_page: bytes | None = None
+
+    @property
+    def details(self) -> LectureDetails:
+        """ The details of the lecture extracted by the stream extractor. """
+        if self.__details is None:
+            self.__details = self.stream_details()
+        return self.__details
+
+    @property
+    def metadata(self) -> LectureMetadata:
+        """ The metadata of the lecture, extracted the first time it's used. """
+        if self.__metadata is None:
+            self.__metadata = self.extract_metadata()
+        return self.__metadata
+
+    def extract_metadata(self) -> LectureMetadata:
+        """ Extract all the metadata of the lecture from its page and release the page afterwards. """
+        if self.extractor == 'stream':
+            name, icon, downloads = self.details.name, self.details.icon, self.details.downloads
+        else:
+            name = self.select_element(self.element_selectors.lecture_name, single=True).get_text(strip=True)
+            icon = self.select_element(self.element_selectors.lecture_icon, single=True).get('xlink:href')
+            downloads = self.extract_download_names_and_urls()
+        lecture_type: LectureType = 'video' if icon == "#icon__Video" else 'text'
+        # The body of a text lecture is the only part of the page that is needed to save it
+        text_html = self.extract_text_lecture() if lecture_type == 'text' else None
+        self.release_soup()
+        if _scraper.low_memory:
+            # The streamed part of the page is only kept to make a soup without requesting the page again
+            self.__streamed_page = None
+        return LectureMetadata(
+            name, parse_lecture_number(name), lecture_type,
+            tuple(downloads.items()) if downloads is not None else None,
+            text_html
+        )
+
+    def stream_details(self) -> LectureDetails:
+        """ Extract the details of the lecture while its page is downloaded and stop the download once they are found. """
+        if self.page_cache is not None or self.async_backend is not None:
+            # The cache stores whole pages and the async backend reads them whole so there is nothing to gain by streaming
+            details, self.__streamed_page = extract_lecture_details([self.fetch_page()], self.base_url)
+        else:
+            details, self.__streamed_page = self.stream_page()
+        return details
+
+    @measured('fetch', lambda streamed: len(streamed[1]))
+    @handle_network_errors
+    def stream_page(self) -> Tuple[LectureDetails, bytes]:
+        """ Request the page and read it until the details of the lecture are found, returns the details and the part of the page that was read. """
+        limit_requests(self.url)
+        with self.session.get(self.url, stream=True, timeout=self.timeout) as response:
+            raise_for_page_status(response)
+            # requests assumes ISO-8859-1 for html without a charset but the pages are utf-8
+            encoding = response.encoding if 'charset' in response.headers.get('content-type', '') else None
+            return extract_lecture_details(response.iter_content(STREAM_CHUNK_SIZE), self.base_url, encoding)
+
+    def fetch_page(self) -> bytes:
+        """ Get the content of the page, reusing the part that was read by the stream extractor if there is one. """
+        if self.__streamed_page is not None:
+            # The streamed part contains the whole main content of the lecture which is all the soup needs
+            streamed_page, self.__streamed_page = self.__streamed_page, None
+            return streamed_page
+        return super().fetch_page()
+
     def get_download_names_and_urls(self) -> Dict[str|None, str] | None:
         """ Get all downloadable urls with their filenames as a dictionary. """
+        downloads = self.metadata.downloads
+        return dict(downloads) if downloads is not None else None
+
+    def extract_download_names_and_urls(self) -> Dict[str|None, str] | None:
+        """ Select all downloadable urls with their filenames from the page as a dictionary. """
         # Select all elements with the download_tags element selector
         # Recognize that raise_if_not_found is False that makes it so even if
         # There is no download link found the ElementNotFoundError error won't
@@ -49,7 +266,7 @@ class Lecture(Scraper):
         :param source: A Tag that contains the removable elements
         """
         for element_selector in element_selectors:
-            decomposable_element = source.select_one(element_selector)
+            decomposable_element = compile_selector(element_selector).select_one(source)
             # If the element is None(doesn't exist) then skip it
             if decomposable_element is not None:
                 # The decompose method will wipe out the element itself and
@@ -57,8 +274,15 @@ class Lecture(Scraper):
                 decomposable_element.decompose()
 
     def get_text_lecture(self) -> str:
+        """ Returns a string of a text lecture html with unecessary tags and attrs removed. """
+        if self.metadata.text_html is None:
+            # This isn't a text lecture but its body can be saved all the same
+            return self.extract_text_lecture()
+        return self.metadata.text_html
+
+    def extract_text_lecture(self) -> str:
         """ 
-        Returns a string of a text lecture html with unecessary tags and attrs removed. 
+        Select the html of a text lecture from the page with unecessary tags and attrs removed. 
 
         And remove the attributes found on the meta tag to clean things up.
         """
@@ -71,14 +295,7 @@ class Lecture(Scraper):
 
     def get_lecture_number(self) -> str | None:
         """ Get the lecture number if it exists if it doesn't return None"""
-        lecture_name = self.get_name()
-        # Split the lecture name with a "-"" since thats what the lectures separate their numbers in
-        lecture_name_number = lecture_name.split('-')
-        if len(lecture_name_number) < 1 or not lecture_name_number[0].strip().isdigit():
-            # This means that either there is no "-" sign which probably means no number
-            # or the first index is not a digit
-            return None
-        return lecture_name_number[0]
+        return self.metadata.number
 
     def get_resource_name(self, bare_resource_name: str) -> str:
         """
@@ -87,7 +304,7 @@ class Lecture(Scraper):
         :param bare_resource_name: The name of the resource that is returned from self.get_download_names_and_urls
         """
         # Set a lecture number only if it is not None else use an empty string
-        lecture_number = self.get_lecture_number() if self.get_lecture_number() is not None else ''
+        lecture_number = self.get_lecture_number() or ''
         # If the first element before the "-" is a digit then
         if bare_resource_name.split('-')[0].isdigit():
             # Remove every white space and also remove the number at the first of the name
@@ -104,97 +321,151 @@ class Lecture(Scraper):
             pass  # not interested, if it's not a number, keep the string as it is
         return f"{lecture_number}-resource_{resource_name}"
 
+    def get_download_targets(self, base_dir: Path) -> List[Tuple[str, Path]]:
+        """
+        Get every downloadable url of the lecture paired with the path it should be stored in.
+
+        :param base_dir: The directory where the downloaded content is stored
+        """
+        download_names_urls = self.get_download_names_and_urls()
+        if download_names_urls is None:
+            return []
+        targets = []
+        for download_name, download_url in download_names_urls.items():
+            if download_name is None:
+                # get the web page title and use it as the filename
+                download_name = self.get_name()
+                filename = sterialize_file_or_folder(
+                    self.get_resource_name(download_name)
+                )
+            else:
+                filename = sterialize_file_or_folder(download_name)
+            if filename.split('.')[-1] != 'mp4':
+                # This means that the downloadable thing is a resource so
+                # we use the self.get_resource_name to get the resource name
+                filename = self.get_resource_name(filename)
+            targets.append((download_url, base_dir / filename))
+        return targets
+
     @staticmethod
-    def should_overwrite(file_path: Path, noconfirm=False):
+    def should_overwrite(file_path: Path, noconfirm=False, interactive=True):
         """
         Ask to overwrite the file_path if it exists and noconfirm is false
 
         :param file_path: The file path to check for
         :param noconfirm: to forcibly disable to ask for the user input and just return True
+        :param interactive: If False, existing files are skipped instead of asking the user. This is
+        used by concurrent downloads since a prompt can't be shown while the shared progress bar is live.
         """
         if noconfirm:
             return True
         if file_path.exists():
+            if not interactive:
+                render_message('warning', f'Skipping, File named "{file_path.name}" exists. Use --noconfirm to overwrite it.')
+                return False
             return render_message('warning', f'File named "{file_path.name}" exists. Shall I overwrite the file', question=True)
         return True
 
-    def download(self, base_dir: Path,  chunk_size: int = 4096, noconfirm=False):
+    def check_existing_file(self, url: str | None, file_path: Path, on_exists: OnExists, interactive: bool, manifest: Manifest | None) -> FileAction:
+        """
+        Decide what to do with a file of the lecture using check_existing_file and what the manifest knows about it.
+        Kept files are recorded in the manifest.
+
+        :param url: The downloadable url of the file, None for the html of text lectures
+        :param file_path: The path the file would be downloaded to
+        :param on_exists: What to do if the file exists
+        :param interactive: If the user can be asked
+        :param manifest: If given, the size and checksum recorded for the file are used instead of requesting them
+        """
+        file_details = manifest.get_file(self.url, file_path) if manifest is not None else None
+        known_size = file_details.get('size') if file_details is not None else None
+        known_sha256 = file_details.get('sha256') if file_details is not None else None
+        file_action = check_existing_file(self.session, url, file_path, on_exists, interactive, self.timeout, known_size, known_sha256)
+        if file_action == 'keep' and file_details is None and manifest is not None:
+            # Remember the file so that the next sync doesn't ask the server about it again
+            manifest.record_file(self.url, file_path, url, file_path.stat().st_size)
+        return file_action
+
+    def download(self, base_dir: Path,  chunk_size: int = DEFAULT_CHUNK_SIZE, on_exists: OnExists = 'ask', progress_bar: Progress | None = None, segments: int = 1, manifest: Manifest | None = None, checksum: bool = False):
         """
         Downloads a lecture with all its resources and any other downloadable things
 
         :param base_dir: Where to store the downloaded content
-        :param chunk_size: How much bytes to wait before writing it to a file.
-        :param noconfirm: If the user shouldn't be asked for confirmation about overwriting a file.
+        :param chunk_size: The size of the first chunk to download, it adapts to the speed of the connection.
+        :param on_exists: What to do with the files that already exist, see check_existing_file
+        :param progress_bar: A progress bar shared between concurrent downloads. Each transfer gets
+        its own row that is removed once it finishes. If None every transfer gets its own progress bar.
+        :param segments: The number of concurrent connections used to download each file.
+        :param manifest: If given, the downloaded files and the completion of the lecture are recorded in it.
+        :param checksum: If True, the SHA-256 of every downloaded file is calculated and recorded in the manifest.
         """
-
-        lecture_type = self.get_type()
-        download_names_urls = self.get_download_names_and_urls()
+        # The user can't be prompted while a shared progress bar is being rendered
+        interactive = progress_bar is None
+        try:
+            lecture_type = self.get_type()
+            download_targets = self.get_download_targets(base_dir)
+        except RequestFailedError as error:
+            # The page couldn't be fetched even after retrying so move on to the next lecture
+            render_message('error', f'Skipping, Couldn\'t fetch the lecture {self.url}. {error}')
+            return
+        # The lecture is complete only if none of its files were skipped or failed
+        complete = True
         if lecture_type == 'text':
             filename = sterialize_file_or_folder(f"{str(self)}.html")
             file_path = base_dir / filename
-            if self.should_overwrite(file_path, noconfirm):
+            file_action = self.check_existing_file(None, file_path, on_exists, interactive, manifest)
+            if file_action == 'download':
                 # We initialize progress bars here because if it was initialized at the top level
                 # Confirm.ask(which uses live and itself is used by self.should_overwrite) will not work
                 # according to rich
-                with get_progress_bar() as progress_bar:
-                    # initializing the progress task here helps us so that when the download is retried
-                    # another thask wont be instatiated.
-                    current_task_id: TaskID = progress_bar.add_task('download', start=False, filename=str(self))
-                    self.__download_text(file_path, progress_bar, current_task_id)
-        if download_names_urls is not None:
-            for download_name, download_url in download_names_urls.items():
-                if download_name is None:
-                    # get the web page title and use it as the filename
-                    download_name = self.get_name()
-                    filename = sterialize_file_or_folder(
-                        self.get_resource_name(download_name)
-                    )
-                else:
-                    filename = sterialize_file_or_folder(download_name)
-                if filename.split('.')[-1] != 'mp4':
-                    # This means that the downloadable thing is a resource so
-                    # we use the self.get_resource_name to get the resource name
-                    filename = self.get_resource_name(filename)
-                file_path = base_dir / filename
-                if self.should_overwrite(file_path, noconfirm):
-                    with get_progress_bar() as progress_bar:
-                        # The samething as the text lecture here
-                        current_task_id = progress_bar.add_task('download', filename=file_path.stem, start=False)
-                        self.__download(download_url, file_path, progress_bar, current_task_id, chunk_size)
-        elif download_names_urls is None and lecture_type != 'text':
+                with progress_task(progress_bar, str(self)) as (text_progress_bar, current_task_id):
+                    self.__download_text(file_path, text_progress_bar, current_task_id)
+                if manifest is not None:
+                    manifest.record_file(self.url, file_path, None, file_path.stat().st_size, sha256=hash_file(file_path).hexdigest() if checksum else None)
+            elif file_action == 'skip':
+                complete = False
+        for download_url, file_path in download_targets:
+            file_action = self.check_existing_file(download_url, file_path, on_exists, interactive, manifest)
+            if file_action == 'download':
+                # initializing the progress task here helps us so that when the download is retried
+                # another thask wont be instatiated.
+                try:
+                    with progress_task(progress_bar, file_path.stem) as (download_progress_bar, current_task_id):
+                        transfer_result = self.__download(download_url, file_path, download_progress_bar, current_task_id, chunk_size, segments, checksum)
+                except RequestFailedError as error:
+                    render_message('error', f'Failed to download "{file_path.name}". {error}')
+                    complete = False
+                    continue
+                if manifest is not None:
+                    manifest.record_file(self.url, file_path, download_url, transfer_result.size, transfer_result.etag, transfer_result.last_modified, transfer_result.sha256)
+            elif file_action == 'skip':
+                complete = False
+        if not download_targets and lecture_type != 'text':
             # This means that there are no download urls and the lecture is a video
             # In this case the only option we have is to inform the user and skip this lecture.
             render_message('warning', f'Skipping, Nothing to download in lecture "{str(self)}".')
+        if manifest is not None:
+            manifest.record_lecture(self.url, str(self), lecture_type, complete)
+            manifest.save()
 
-    @handle_network_errors
-    @handle_keyboard_interrupt_for_files
-    def __download(self, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int):
+    @measured('transfer', lambda transfer_result: transfer_result.size)
+    def __download(self, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, segments: int = 1, checksum: bool = False) -> TransferResult:
         """
-        Download any downloadble url and show a progress bar while also handling network and keyboard interrupt errors
-        that occur.
+        Download any downloadble url and show a progress bar. The download goes to a partial file first
+        and is resumed from it when it is retried or when the app is run again.
 
         :param url: The downloadable url
         :param file_path: Where to store the final file
         :param progress_bar: A rich.Progress object used to update the current progress bar task
         :param current_task_id: The id of the task to use when downloading
-        :parm chunk_size: How much bytes to wait before writing it to a file.
-        """
-        # All error that happen here are hanled by the decorators so no worries 😁
-        response = self.session.get(url, stream=True, timeout=self.timeout)
-        # Reset the progress bar because the decorator will call this function again and if it
-        # is not reset the progress bar will continue from where it left of but the download resets
-        # which is wierd! right?
-        progress_bar.reset(current_task_id, start=False)
-        progress_bar.update(current_task_id, total=int(str(response.headers.get('content-length'))))
-        progress_bar.start_task(current_task_id)
-
-        with file_path.open('wb') as file:
-            for chunk in response.iter_content(chunk_size):
-                file.write(chunk)
-                progress_bar.update(current_task_id, advance=chunk_size)
+        :parm chunk_size: The size of the first chunk to download, it adapts to the speed of the connection.
+        :param segments: If more than 1, download the file in that many byte ranges at the same time.
+        :param checksum: If True, the SHA-256 of the file is calculated while it's downloaded
+        """
+        return transfer_file(self.session, url, file_path, progress_bar, current_task_id, chunk_size, self.timeout, segments, self.async_backend, checksum)
 
-    @handle_keyboard_interrupt_for_files
-    def __download_text(self, file_path: Path, progress_bar: Progress, current_task_id: TaskID):
+    @measured('text', lambda lecture_markup: len(lecture_markup.encode()))
+    def __download_text(self, file_path: Path, progress_bar: Progress, current_task_id: TaskID) -> str:
         """
         Download(modify and save to storage) any text lecture. This method doesn't really download
         anything since everything it needs is already download when the soup is made so we use that instead
@@ -203,25 +474,26 @@ class Lecture(Scraper):
         :param file_path: Where to store the final file
         :param progress_bar: A rich.Progress object used to update the current progress bar task
         :param current_task_id: The id of the task to use when saving
+
+        Returns the html that was written
         """
         progress_bar.start_task(current_task_id)
         # Get all the html necessary for creating the file
         lecture_main_container = self.get_text_lecture()
         # Inject styles and make a proper html document using create_markup
         lecture_markup = create_markup(str(self), lecture_main_container)
-        with file_path.open('w') as html_file:
-            html_file.write(lecture_markup)
+        write_file(file_path, lecture_markup)
         progress_bar.update(current_task_id, completed=100)
+        return lecture_markup
 
     def get_name(self) -> str:
         """ Get the name of the lecture"""
-        lecture_name = self.select_element(self.element_selectors.lecture_name, single=True)
-        return lecture_name.get_text(strip=True)
+        return self.metadata.name
 
     def get_type(self) -> LectureType:
         """ Get the type of the lecture which is a type of LectureType"""
-        lecture_icon = self.select_element(self.element_selectors.lecture_icon, single=True).get('xlink:href')
-        if lecture_icon == "#icon__Video":
-            return 'video'
-        else:
-            return 'text'
+        return self.metadata.type
+
+    def get_known_type(self) -> LectureType | None:
+        """ Get the type of the lecture if its page was already fetched, None otherwise. Never makes a request. """
+        return self.__metadata.type if self.__metadata is not None else None
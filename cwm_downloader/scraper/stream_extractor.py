@@ -0,0 +1,148 @@
+"""
+This module provides an extractor that reads the details of a lecture (its name, icon and
+download links) while the page is still being downloaded, without building a BeautifulSoup
+tree. The download of the page is stopped as soon as the main content of the lecture ends.
+"""
+
+import codecs
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Tuple
+from cwm_downloader.exceptions import ElementNotFoundError
+from cwm_downloader.scraper._scraper import parse_simple_selector
+from cwm_downloader.scraper.element_selectors import ElementSelectors
+
+# The number of bytes to read from the response at a time
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+@dataclass
+class LectureDetails:
+    """ The details of a lecture that are extracted from its page. """
+    name: str
+    icon: str | None
+    downloads: Dict[str | None, str] | None
+
+
+class SimpleSelectorMatcher:
+    """ Matches the tags of an HTMLParser against a simple css selector (a tag name followed by classes and an id). """
+
+    def __init__(self, selector: str):
+        self.name, self.element_id, self.class_names = parse_simple_selector(selector)
+
+    def matches(self, tag: str, attrs: Dict[str, str | None]) -> bool:
+        if self.name is not None and tag != self.name:
+            return False
+        if self.element_id is not None and attrs.get('id') != self.element_id:
+            return False
+        tag_classes = (attrs.get('class') or '').split()
+        return all(class_name in tag_classes for class_name in self.class_names)
+
+
+class LectureDetailsParser(HTMLParser):
+    """
+    An event based html parser that collects the details of a lecture as the page is fed to it.
+    The done attribute is set once the main content of the lecture is closed, which means everything
+    needed was seen and the rest of the page can be ignored.
+    """
+
+    def __init__(self, element_selectors=ElementSelectors):
+        super().__init__(convert_charrefs=True)
+        # Only the first selector of each element is used since these can't be tried one by one
+        # like Scraper.select_element does. When the first selectors stop working the soup
+        # extractor should be used instead.
+        self.root_matcher = SimpleSelectorMatcher(element_selectors.lecture_page_roots.value[0])
+        self.heading_matcher = SimpleSelectorMatcher(element_selectors.lecture_name.value[0])
+        self.download_matcher = SimpleSelectorMatcher(element_selectors.download_tags.value[0])
+        # The icon is the last simple selector of the lecture_icon selector (#lecture_heading svg use)
+        self.icon_tag = element_selectors.lecture_icon.value[0].split()[-1]
+
+        self.name_parts: List[str] = []
+        self.icon: str | None = None
+        self.downloads: List[Tuple[str | None, str]] = []
+        self.found_heading = False
+        self.done = False
+        # The root and heading tags with their depth among the open tags that have the same
+        # name. This is used to know when they are closed.
+        self.root: Optional[Tuple[str, int]] = None
+        self.heading: Optional[Tuple[str, int]] = None
+        self.open_tags: Dict[str, int] = {}
+
+    def handle_starttag(self, tag: str, attrs_list: List[Tuple[str, str | None]]):
+        if self.done:
+            return
+        attrs = dict(attrs_list)
+        depth = self.open_tags[tag] = self.open_tags.get(tag, 0) + 1
+        if self.root is None and self.root_matcher.matches(tag, attrs):
+            self.root = (tag, depth)
+        if not self.found_heading and self.heading_matcher.matches(tag, attrs):
+            self.heading = (tag, depth)
+            self.found_heading = True
+        elif self.heading is not None and tag == self.icon_tag and self.icon is None:
+            self.icon = attrs.get('xlink:href')
+        if self.download_matcher.matches(tag, attrs) and attrs.get('href') is not None:
+            self.downloads.append((attrs.get('data-x-origin-download-name'), str(attrs['href'])))
+
+    def handle_startendtag(self, tag: str, attrs_list: List[Tuple[str, str | None]]):
+        # Self closing tags like <use ... /> don't open anything
+        self.handle_starttag(tag, attrs_list)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str):
+        if self.done or not self.open_tags.get(tag):
+            return
+        closed_tag = (tag, self.open_tags[tag])
+        self.open_tags[tag] -= 1
+        if closed_tag == self.heading:
+            self.heading = None
+        if closed_tag == self.root:
+            self.done = True
+
+    def handle_data(self, data: str):
+        if self.heading is not None:
+            # Every piece of text is stripped and joined the same way Tag.get_text(strip=True) does
+            stripped_data = data.strip()
+            if stripped_data:
+                self.name_parts.append(stripped_data)
+
+    def get_details(self, base_url: str) -> LectureDetails:
+        """
+        Get the collected details and raise an ElementNotFoundError if the name of the lecture wasn't found.
+
+        :param base_url: The url that relative download urls are joined with
+        """
+        if not self.found_heading:
+            raise ElementNotFoundError('The lecture heading could not be found while streaming the page, The site might be updated...')
+        downloads: Dict[str | None, str] | None = None
+        if self.downloads:
+            downloads = {}
+            for download_name, url in self.downloads:
+                if "://" not in url:
+                    # This means that the url is a relative url so we need to join it with the base url
+                    url = base_url + url
+                downloads[download_name] = url
+        return LectureDetails(''.join(self.name_parts), self.icon, downloads)
+
+
+def extract_lecture_details(chunks: Iterable[bytes], base_url: str, encoding: str | None = None) -> tuple[LectureDetails, bytes]:
+    """
+    Feed the chunks of a lecture page to a LectureDetailsParser until the main content of the lecture
+    is closed. Returns the details and all the bytes that were consumed, which contain the main content
+    of the lecture and can be parsed with BeautifulSoup later if needed (e.g for text lectures).
+
+    :param chunks: The chunks of the page, usually from Response.iter_content
+    :param base_url: The url that relative download urls are joined with
+    :param encoding: The encoding of the page, utf-8 is used if it's None
+    """
+    parser = LectureDetailsParser()
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    consumed_chunks = []
+    for chunk in chunks:
+        consumed_chunks.append(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    else:
+        parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser.get_details(base_url), b''.join(consumed_chunks)
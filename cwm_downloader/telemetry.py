@@ -0,0 +1,236 @@
+"""
+This module provides the performance telemetry of the app. When it's enabled, the time spent
+fetching pages, parsing them, selecting elements, transferring files and writing text lectures
+is measured, summarized at the end of a run and optionally written to a JSON lines file, which
+helps to tune the number of workers and to notice when a change of the site slows the app down.
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import IO, Any, Callable, Dict, List, Literal
+from rich import print as rprint
+from rich.table import Table
+from cwm_downloader.retry import describe_error, thread_retries
+from cwm_downloader.utils import render_message
+
+try:
+    import resource
+except ImportError:
+    # The resource module only exists on unix
+    resource = None  # type: ignore
+
+# The measured parts of a run. fetch is getting a page from the site or the cache, parse is
+# making a soup out of it, select is finding elements in a soup, transfer is downloading a
+# file and text is writing a text lecture.
+Stage = Literal['fetch', 'parse', 'select', 'transfer', 'text']
+STAGES = ('fetch', 'parse', 'select', 'transfer', 'text')
+
+# Before python 3.12 every thread can run its own cProfile profiler. From 3.12 cProfile is built on
+# sys.monitoring which allows a single profiler at a time, so only the main thread is profiled.
+PROFILE_THREADS = sys.version_info < (3, 12)
+
+
+@dataclass
+class Measurement:
+    """ A single measured call. """
+    stage: Stage
+    # The url of the page or lecture the call was made for
+    url: str
+    # The number of seconds the call took
+    duration: float
+    # The number of bytes fetched, transferred or written
+    size: int = 0
+    # The number of times the requests of the call were retried
+    retries: int = 0
+    # The kind of error the call failed with
+    error: str | None = None
+
+
+def get_percentile(durations: List[float], percentile: float) -> float:
+    """
+    Get a percentile of durations using the nearest rank method.
+
+    :param durations: The durations sorted from the shortest
+    :param percentile: The percentile to get between 0 and 100
+    """
+    rank = max(1, -(-len(durations) * percentile // 100))  # ceil division
+    return durations[int(rank) - 1]
+
+
+def get_peak_memory() -> int | None:
+    """ Get the peak resident memory of the process in bytes, None if it can't be measured (e.g on windows). """
+    if resource is None:
+        return None
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes while linux reports kilobytes
+    return peak_memory if sys.platform == 'darwin' else peak_memory * 1024
+
+
+class Telemetry:
+    """ Collects the measurements of a run from many threads. It doesn't measure anything until it's enabled. """
+
+    def __init__(self):
+        self.enabled = False
+        self.measurements: List[Measurement] = []
+        self.metrics_file: IO[str] | None = None
+        self.started_at = monotonic()
+        self.lock = Lock()
+
+    def configure(self, enabled: bool, metrics_path: Path | None = None):
+        """
+        Start a new run of measurements
+
+        :param enabled: If the calls should be measured
+        :param metrics_path: If given, every measurement is also written to this file as a line of json
+        """
+        self.close()
+        with self.lock:
+            self.enabled = enabled or metrics_path is not None
+            self.measurements = []
+            self.started_at = monotonic()
+            self.metrics_file = metrics_path.open('w') if metrics_path is not None else None
+
+    def record(self, measurement: Measurement):
+        with self.lock:
+            self.measurements.append(measurement)
+            if self.metrics_file is not None:
+                self.metrics_file.write(json.dumps(asdict(measurement)) + '\n')
+
+    def close(self):
+        """ Close the metrics file if there is one. """
+        with self.lock:
+            if self.metrics_file is not None:
+                self.metrics_file.close()
+                self.metrics_file = None
+
+    def get_summary(self) -> Dict[str, Dict[str, Any]]:
+        """ Get the number of calls, the p50 and p95 durations, the total duration, size, retries and errors of every measured stage. """
+        with self.lock:
+            measurements = list(self.measurements)
+        summary = {}
+        for stage in STAGES:
+            stage_measurements = [measurement for measurement in measurements if measurement.stage == stage]
+            if not stage_measurements:
+                continue
+            durations = sorted(measurement.duration for measurement in stage_measurements)
+            summary[stage] = {
+                'count': len(stage_measurements),
+                'p50': get_percentile(durations, 50),
+                'p95': get_percentile(durations, 95),
+                'total': sum(durations),
+                'size': sum(measurement.size for measurement in stage_measurements),
+                'retries': sum(measurement.retries for measurement in stage_measurements),
+                'errors': sum(measurement.error is not None for measurement in stage_measurements)
+            }
+        return summary
+
+    def render_summary(self):
+        """ Show a table of the measured stages and the throughput of the run. """
+        summary = self.get_summary()
+        if not summary:
+            return
+        table = Table(title='Performance', title_justify='left')
+        for column in ('Stage', 'Calls', 'p50', 'p95', 'Total time', 'MB', 'MB/s', 'Retries', 'Errors'):
+            table.add_column(column, justify='left' if column == 'Stage' else 'right')
+        for stage, stats in summary.items():
+            megabytes = stats['size'] / 1024 ** 2
+            table.add_row(
+                stage, str(stats['count']),
+                f'{stats["p50"] * 1000:.1f}ms', f'{stats["p95"] * 1000:.1f}ms', f'{stats["total"]:.2f}s',
+                f'{megabytes:.1f}' if stats['size'] else '-',
+                # Transfers run at the same time so this is the average speed of a single transfer
+                f'{megabytes / stats["total"]:.2f}' if stats['size'] and stats['total'] else '-',
+                str(stats['retries']), str(stats['errors'])
+            )
+        rprint(table)
+        if 'transfer' in summary:
+            elapsed = monotonic() - self.started_at
+            megabytes = summary['transfer']['size'] / 1024 ** 2
+            rprint(f'Downloaded {megabytes:.1f} MB in {elapsed:.1f}s ({megabytes / elapsed:.2f} MB/s over the whole run)')
+        peak_memory = get_peak_memory()
+        if peak_memory is not None:
+            rprint(f'Peak memory {peak_memory / 1024 ** 2:.1f} MB')
+
+
+# The telemetry of the app, configured by the cli
+telemetry = Telemetry()
+
+
+def measured(stage: Stage, get_size: Callable[[Any], int] | None = None):
+    """
+    A decorator for the methods of the scrapers that measures them when telemetry is enabled.
+    The url of the measurement is the url of the scraper.
+
+    :param stage: The stage the method is part of
+    :param get_size: A function that gets the number of bytes from the result of the method
+    """
+    def decorator(func: Callable):
+        @wraps(func)
+        def decorated_func(self, *args, **kwargs):
+            if not telemetry.enabled:
+                return func(self, *args, **kwargs)
+            retries_before = thread_retries()
+            start_time = perf_counter()
+            try:
+                result = func(self, *args, **kwargs)
+            except Exception as error:
+                telemetry.record(Measurement(stage, self.url, perf_counter() - start_time, retries=thread_retries() - retries_before, error=describe_error(error)))
+                raise
+            size = get_size(result) if get_size is not None and result is not None else 0
+            telemetry.record(Measurement(stage, self.url, perf_counter() - start_time, size, thread_retries() - retries_before))
+            return result
+        return decorated_func
+    return decorator
+
+
+@contextmanager
+def profiled(profile_path: Path | None):
+    """
+    Profile everything that runs inside the context with cProfile, including the threads started in
+    it (e.g the workers) before python 3.12, and write the stats of all of them to a file when it ends.
+
+    :param profile_path: The file the stats are written to, nothing is profiled if it's None
+    """
+    if profile_path is None:
+        yield
+        return
+    profilers: List[cProfile.Profile] = []
+    profilers_lock = Lock()
+
+    def profile_thread(*_):
+        # Called by the first event of every new thread, enabling a profiler replaces this hook
+        profiler = cProfile.Profile()
+        with profilers_lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    main_profiler = cProfile.Profile()
+    if PROFILE_THREADS:
+        threading.setprofile(profile_thread)
+    main_profiler.enable()
+    try:
+        yield
+    finally:
+        main_profiler.disable()
+        if PROFILE_THREADS:
+            threading.setprofile(None)  # type: ignore
+        stats = pstats.Stats(main_profiler)
+        with profilers_lock:
+            for profiler in profilers:
+                profiler.create_stats()
+                # Threads that ended before making a single call have nothing to add
+                if profiler.stats:  # type: ignore
+                    stats.add(profiler)
+        stats.dump_stats(profile_path)
+        render_message('info', f'Wrote the profile of the run to "{profile_path}", read it with "python -m pstats {profile_path}" or a viewer like snakeviz')
+        if not PROFILE_THREADS:
+            render_message('warning', 'Only the main thread was profiled, python 3.12 and later allow a single profiler at a time')
@@ -0,0 +1,528 @@
+"""
+This module provides the functions that stream downloadable urls to the file system.
+Downloads are first written to a partial file next to the final path so that an
+interrupted download can be resumed using an HTTP Range request. Finished files are moved
+to their final path with an atomic rename so a file with a final name is always complete.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event
+from time import monotonic
+from typing import Iterator, Mapping
+from requests import Response, Session, exceptions as rqexceptions
+from rich.progress import Progress, TaskID
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from cwm_downloader import rate_limit
+from cwm_downloader.exceptions import IncompleteDownloadError
+from cwm_downloader.utils import (
+    download_cancelled,
+    handle_keyboard_interrupt_for_files,
+    handle_keyboard_interrupt_for_partial_files,
+    render_message,
+)
+from cwm_downloader.retry import current_attempt, handle_network_errors
+
+# The suffix added to the name of a file that is still being downloaded
+PARTIAL_SUFFIX = '.part'
+# The suffix of a file that is being downloaded in segments. It is different from
+# PARTIAL_SUFFIX because its bytes are not written in order so it can't be resumed
+# with a single range request.
+SEGMENTED_PARTIAL_SUFFIX = '.segments.part'
+# The suffix of a file that is written in one go (e.g a text lecture) before it's moved to its final path
+TEMPORARY_SUFFIX = '.tmp'
+# Files smaller than this are not worth to be split in to more than one segment
+MIN_SEGMENT_SIZE = 1024 * 1024
+# The bounds of the chunk size, which grows on fast connections and shrinks on slow ones
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = MIN_CHUNK_SIZE
+# How long reading a single chunk should take. Reading much faster than this means the chunk
+# size is too small and the time is spent in the python loop instead of the network.
+TARGET_READ_TIME = 0.25
+# The minimum number of seconds between two updates of the progress bar of a download
+PROGRESS_REFRESH_INTERVAL = 0.1
+# The size of the blocks a file is read in when it's hashed
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# If True, finished files are flushed to the disk before they are moved to their final path.
+# Replaced by configure_fsync.
+fsync_files = False
+
+
+@dataclass
+class TransferResult:
+    """ The details of a finished download that are worth remembering. """
+    size: int
+    etag: str | None = None
+    last_modified: str | None = None
+    # The SHA-256 of the file if it was asked for
+    sha256: str | None = None
+
+
+@dataclass
+class Segment:
+    """ A byte range of a file that is downloaded by its own connection. """
+    start: int
+    end: int
+    # The next byte to download, a retried segment continues from here
+    position: int
+
+    @property
+    def remaining(self):
+        return self.end - self.position + 1
+
+
+class ProgressThrottle:
+    """
+    Collect the progress of a download and update the progress bar at most once every
+    PROGRESS_REFRESH_INTERVAL seconds, since updating it for every chunk costs more than
+    the chunk itself on fast connections. Use it as a context manager so that the last
+    progress is shown when the download stops.
+    """
+
+    def __init__(self, progress_bar: Progress, task_id: TaskID, interval: float = PROGRESS_REFRESH_INTERVAL):
+        self.progress_bar = progress_bar
+        self.task_id = task_id
+        self.interval = interval
+        self.pending = 0
+        self.last_update = monotonic()
+
+    def advance(self, amount: int):
+        self.pending += amount
+        if monotonic() - self.last_update >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.progress_bar.update(self.task_id, advance=self.pending)
+            self.pending = 0
+        self.last_update = monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.flush()
+
+
+def adapt_chunk_size(chunk_size: int, elapsed: float, max_chunk_size: int = MAX_CHUNK_SIZE) -> int:
+    """
+    Get the size of the next chunk from how long reading a full chunk of chunk_size took.
+
+    :param chunk_size: The size of the chunk that was read
+    :param elapsed: The number of seconds it took to read it
+    :param max_chunk_size: The size the chunk can't grow beyond
+    """
+    if elapsed < TARGET_READ_TIME / 2:
+        return min(chunk_size * 2, max_chunk_size)
+    if elapsed > TARGET_READ_TIME * 2:
+        return max(chunk_size // 2, MIN_CHUNK_SIZE)
+    return chunk_size
+
+
+def iter_chunks(response: Response, chunk_size: int) -> Iterator[memoryview]:
+    """
+    Iterate over the body of a streamed response by reading it in to a reusable buffer. The
+    chunk size starts at chunk_size and adapts to the speed of the connection. A yielded chunk
+    is only valid until the next one is requested since the buffer is overwritten.
+
+    :param response: A response made with stream=True
+    :param chunk_size: The size of the first chunk, kept between MIN_CHUNK_SIZE and MAX_CHUNK_SIZE
+    """
+    max_chunk_size = MAX_CHUNK_SIZE
+    if rate_limit.bandwidth_limiter is not None:
+        # Chunks bigger than the burst of the bandwidth limit would be read in bursts followed by long waits
+        max_chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, int(rate_limit.bandwidth_limiter.capacity)))
+    chunk_size = min(max(chunk_size, MIN_CHUNK_SIZE), max_chunk_size)
+    if response.headers.get('content-encoding', 'identity').lower() != 'identity':
+        # The body must be decompressed so the raw bytes can't be read in to the buffer directly
+        for chunk in response.iter_content(chunk_size):
+            rate_limit.limit_bandwidth(len(chunk))
+            yield memoryview(chunk)
+        return
+    buffer = bytearray(chunk_size)
+    while True:
+        started = monotonic()
+        try:
+            read = response.raw.readinto(memoryview(buffer)[:chunk_size])
+        # Raise the same errors as Response.iter_content so that they are retried the same way
+        except ProtocolError as error:
+            raise rqexceptions.ChunkedEncodingError(error)
+        except ReadTimeoutError as error:
+            raise rqexceptions.ConnectionError(error)
+        if not read:
+            return
+        elapsed = monotonic() - started
+        # The wait for the bandwidth limit is not part of the read time that the chunk size adapts to
+        rate_limit.limit_bandwidth(read)
+        yield memoryview(buffer)[:read]
+        if read == chunk_size:
+            chunk_size = adapt_chunk_size(chunk_size, elapsed, max_chunk_size)
+            if chunk_size > len(buffer):
+                # A new buffer instead of resizing since the last chunk might still be referenced
+                buffer = bytearray(chunk_size)
+
+
+def hash_file(file_path: Path, size: int | None = None):
+    """
+    Get a SHA-256 hash object of a file, which can be updated with more bytes afterwards.
+
+    :param file_path: The file to hash
+    :param size: If given, only the first size bytes of the file are hashed
+    """
+    hasher = hashlib.sha256()
+    remaining = size if size is not None else float('inf')
+    with file_path.open('rb') as file:
+        while remaining > 0:
+            block = file.read(int(min(HASH_BLOCK_SIZE, remaining)))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def check_received(url: str, received: int, headers: Mapping[str, str]):
+    """
+    Raise an IncompleteDownloadError if the connection closed before the whole body of a response
+    was received, so that the download is retried from where it stopped.
+
+    :param url: The downloadable url
+    :param received: The number of bytes that were received
+    :param headers: The headers of the response
+    """
+    content_length = headers.get('content-length', '')
+    if headers.get('content-encoding', 'identity').lower() != 'identity':
+        # The Content-Length is the size of the compressed body, not the received bytes
+        return
+    if content_length.isdigit() and received != int(content_length):
+        raise IncompleteDownloadError(f'Only {received} of {content_length} bytes of {url} were received')
+
+
+def configure_fsync(enabled: bool):
+    """
+    Set whether the finished files are flushed to the disk before they are moved to their final path
+
+    :param enabled: If True, the files survive a crash of the whole system at the cost of slower downloads
+    """
+    global fsync_files
+    fsync_files = enabled
+
+
+def finalize_file(temporary_path: Path, file_path: Path):
+    """
+    Move a complete file to its final path. The move is atomic so the final path either has its
+    old content or the complete new file, even if the app is killed in the middle.
+
+    :param temporary_path: The complete partial or temporary file
+    :param file_path: The final path of the file
+    """
+    if fsync_files:
+        # Without this the rename might reach the disk before the content of the file does
+        with temporary_path.open('r+b') as file:
+            os.fsync(file.fileno())
+    os.replace(temporary_path, file_path)
+    if fsync_files and os.name == 'posix':
+        # The rename itself is only durable once the directory is flushed too
+        directory_fd = os.open(file_path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+def write_file(file_path: Path, content: str):
+    """
+    Write a text file through a temporary file next to it, so that an interrupted write never
+    leaves a half written file at file_path.
+
+    :param file_path: The final path of the file
+    :param content: The text to write
+    """
+    temporary_path = file_path.with_name(file_path.name + TEMPORARY_SUFFIX)
+    try:
+        temporary_path.write_text(content)
+        finalize_file(temporary_path, file_path)
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+
+
+def sweep_temporary_files(directory: Path):
+    """
+    Clean up the files a killed run left behind in a directory. Temporary files and segmented
+    partial files can't be continued so they are removed, while partial files are kept since
+    their downloads are resumed.
+
+    :param directory: The directory to clean up, usually a course directory
+    """
+    removed_count = resumable_count = 0
+    for file_path in directory.rglob('*'):
+        if not file_path.is_file():
+            continue
+        if file_path.name.endswith((TEMPORARY_SUFFIX, SEGMENTED_PARTIAL_SUFFIX)):
+            file_path.unlink(missing_ok=True)
+            removed_count += 1
+        elif file_path.name.endswith(PARTIAL_SUFFIX):
+            resumable_count += 1
+    if removed_count:
+        render_message('info', f'Removed {removed_count} unfinished files of a previous run')
+    if resumable_count:
+        render_message('info', f'{resumable_count} partial downloads of a previous run will be resumed')
+
+
+def get_partial_path(file_path: Path) -> Path:
+    """
+    Get the path of the partial file that is used while downloading file_path
+
+    :param file_path: The final path of the download
+    """
+    return file_path.with_name(file_path.name + PARTIAL_SUFFIX)
+
+
+def get_range_start(headers: Mapping[str, str]) -> int | None:
+    """
+    Get the first byte of a partial content response from its Content-Range header.
+    Returns None if the header is missing or malformed.
+
+    :param headers: The headers of a response with a 206 status code
+    """
+    content_range = headers.get('content-range', '')
+    # The header has a form of "bytes START-END/TOTAL"
+    unit, _, byte_range = content_range.partition(' ')
+    start = byte_range.split('-')[0]
+    if unit != 'bytes' or not start.isdigit():
+        return None
+    return int(start)
+
+
+def request_download(session: Session, url: str, downloaded: int, timeout: int) -> tuple[Response, int]:
+    """
+    Request a url continuing from the downloaded byte. Returns the response and the number
+    of bytes that are already on disk and continued by the response, which is 0 when the
+    server ignores the range.
+
+    :param session: The session used to make the request
+    :param url: The downloadable url
+    :param downloaded: The number of bytes already in the partial file
+    :param timeout: The amount of time to wait for the server
+    """
+    headers = {'Range': f'bytes={downloaded}-'} if downloaded else {}
+    response = session.get(url, stream=True, timeout=timeout, headers=headers)
+    if downloaded and response.status_code == 416:
+        # The partial file is not smaller than the remote file. It is probably a stale partial file
+        # of an older version of the file so it must be downloaded again from the start.
+        response.close()
+        response = session.get(url, stream=True, timeout=timeout)
+        downloaded = 0
+    response.raise_for_status()
+    if response.status_code != 206 or get_range_start(response.headers) != downloaded:
+        # The server ignored the range and is sending the whole file
+        downloaded = 0
+    return response, downloaded
+
+
+@handle_network_errors
+@handle_keyboard_interrupt_for_partial_files
+def download_file(session: Session, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, checksum: bool = False) -> TransferResult:
+    """
+    Download any downloadble url and show a progress bar while also handling network and keyboard interrupt errors
+    that occur. If a partial file of a previous attempt exists the download continues from where it stopped. The
+    download is retried if fewer bytes than the Content-Length of the response are received.
+
+    :param session: The session used to make the request
+    :param url: The downloadable url
+    :param file_path: Where to store the final file
+    :param progress_bar: A rich.Progress object used to update the current progress bar task
+    :param current_task_id: The id of the task to use when downloading
+    :param chunk_size: The size of the first chunk to read, it adapts to the speed of the connection
+    :param timeout: The amount of time to wait for the server
+    :param checksum: If True, the SHA-256 of the file is calculated while it's downloaded
+    """
+    partial_path = get_partial_path(file_path)
+    downloaded = partial_path.stat().st_size if partial_path.exists() else 0
+    # All error that happen here are hanled by the decorators so no worries 😁
+    response, downloaded = request_download(session, url, downloaded, timeout)
+    content_length = response.headers.get('content-length')
+    # Reset the progress bar because the decorator will call this function again. When retrying
+    # the progress continues from the bytes that are already in the partial file.
+    progress_bar.reset(current_task_id, start=False)
+    progress_bar.update(
+        current_task_id,
+        total=downloaded + int(content_length) if content_length is not None else None,
+        completed=downloaded,
+        retries=current_attempt() - 1
+    )
+    progress_bar.start_task(current_task_id)
+
+    # Only the part that was downloaded before is read again, the rest is hashed as it arrives
+    hasher = hash_file(partial_path, downloaded) if checksum and downloaded else hashlib.sha256()
+    received = 0
+    # Append to the partial file only when the server continues it, otherwise start over
+    with partial_path.open('ab' if downloaded else 'wb') as file, ProgressThrottle(progress_bar, current_task_id) as progress:
+        for chunk in iter_chunks(response, chunk_size):
+            if download_cancelled.is_set():
+                # A concurrent download was interrupted, so stop like the user pressed Ctrl-C here
+                raise KeyboardInterrupt
+            file.write(chunk)
+            if checksum:
+                hasher.update(chunk)
+            received += len(chunk)
+            progress.advance(len(chunk))
+    check_received(url, received, response.headers)
+    # The download is complete so move it to its final path
+    finalize_file(partial_path, file_path)
+    return TransferResult(
+        file_path.stat().st_size,
+        response.headers.get('etag'),
+        response.headers.get('last-modified'),
+        hasher.hexdigest() if checksum else None
+    )
+
+
+def probe_download(session: Session, url: str, timeout: int) -> tuple[Response, int | None, bool]:
+    """
+    Get the response, size of a downloadable url and whether its server accepts range
+    requests using a HEAD request.
+
+    :param session: The session used to make the request
+    :param url: The downloadable url
+    :param timeout: The amount of time to wait for the server
+    """
+    response = session.head(url, timeout=timeout, allow_redirects=True)
+    response.raise_for_status()
+    content_length = response.headers.get('content-length')
+    size = int(content_length) if content_length is not None and content_length.isdigit() else None
+    return response, size, response.headers.get('accept-ranges', '').lower() == 'bytes'
+
+
+def split_segments(size: int, segments: int) -> list[Segment]:
+    """
+    Split a file of the given size in to at most the given number of equal byte ranges.
+
+    :param size: The size of the file in bytes
+    :param segments: The number of segments wanted
+    """
+    segments = max(1, min(segments, size // MIN_SEGMENT_SIZE))
+    segment_size = -(-size // segments)  # ceil division
+    return [
+        Segment(start, min(start + segment_size, size) - 1, start)
+        for start in range(0, size, segment_size)
+    ]
+
+
+@handle_network_errors
+def download_segment(session: Session, url: str, partial_path: Path, segment: Segment, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, stop: Event):
+    """
+    Download a segment of a url in to its offset of a preallocated file. When the download is retried
+    it continues from the position of the segment.
+
+    :param session: The session used to make the request
+    :param url: The downloadable url
+    :param partial_path: The preallocated file where the segment is written in
+    :param segment: The segment to download
+    :param progress_bar: A rich.Progress object shared by all the segments of the file
+    :param current_task_id: The id of the task of the file
+    :param chunk_size: The size of the first chunk to read, it adapts to the speed of the connection
+    :param timeout: The amount of time to wait for the server
+    :param stop: An event that is set when the other segments failed or were interrupted
+    """
+    if segment.remaining <= 0:
+        return
+    if current_attempt() > 1:
+        progress_bar.update(current_task_id, retries=current_attempt() - 1)
+    headers = {'Range': f'bytes={segment.position}-{segment.end}'}
+    response = session.get(url, stream=True, timeout=timeout, headers=headers)
+    response.raise_for_status()
+    if response.status_code != 206 or get_range_start(response.headers) != segment.position:
+        raise IncompleteDownloadError(f'The server ignored the range of a segment of {url}')
+    # Every segment uses its own file object so that seeking doesn't affect the others
+    with partial_path.open('r+b') as file, ProgressThrottle(progress_bar, current_task_id) as progress:
+        file.seek(segment.position)
+        for chunk in iter_chunks(response, chunk_size):
+            if stop.is_set() or download_cancelled.is_set():
+                raise KeyboardInterrupt
+            # Never write past the segment even if the server sends more than asked for
+            chunk = chunk[:segment.remaining]
+            file.write(chunk)
+            segment.position += len(chunk)
+            progress.advance(len(chunk))
+            if segment.remaining <= 0:
+                break
+    if segment.remaining > 0:
+        raise IncompleteDownloadError(f'The connection closed before a segment of {url} was downloaded')
+
+
+@handle_keyboard_interrupt_for_files
+def download_segments(session: Session, url: str, partial_path: Path, size: int, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, segments: int):
+    """
+    Download a url in concurrent segments in to a preallocated partial file and verify its final size.
+
+    :param session: The session shared by all the segments
+    :param url: The downloadable url
+    :param partial_path: The file to preallocate and write the segments in
+    :param size: The size of the url in bytes
+    :param progress_bar: A rich.Progress object used to update the current progress bar task
+    :param current_task_id: The id of the task to use when downloading
+    :param chunk_size: The size of the first chunk to read, it adapts to the speed of the connection
+    :param timeout: The amount of time to wait for the server
+    :param segments: The number of segments to split the file in to
+    """
+    # Preallocate the file so that every segment can write at its own offset
+    with partial_path.open('wb') as file:
+        file.truncate(size)
+    progress_bar.reset(current_task_id, start=False)
+    progress_bar.update(current_task_id, total=size)
+    progress_bar.start_task(current_task_id)
+
+    stop = Event()
+    file_segments = split_segments(size, segments)
+    with ThreadPoolExecutor(max_workers=len(file_segments)) as executor:
+        futures = [
+            executor.submit(download_segment, session, url, partial_path, segment, progress_bar, current_task_id, chunk_size, timeout, stop)
+            for segment in file_segments
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            # Stop the other segments before cleaning up the partial file
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+    if partial_path.stat().st_size != size or any(segment.remaining > 0 for segment in file_segments):
+        raise IncompleteDownloadError(f'The size of {partial_path.name} does not match the size of the remote file')
+
+
+def download_file_segmented(session: Session, url: str, file_path: Path, progress_bar: Progress, current_task_id: TaskID, chunk_size: int, timeout: int, segments: int, checksum: bool = False) -> TransferResult:
+    """
+    Download a url over several concurrent connections, each fetching its own byte range.
+    Falls back to download_file when the server doesn't accept ranges, the size of the url
+    is unknown or a resumable partial file already exists.
+
+    :param session: The session shared by all the segments
+    :param url: The downloadable url
+    :param file_path: Where to store the final file
+    :param progress_bar: A rich.Progress object used to update the current progress bar task
+    :param current_task_id: The id of the task to use when downloading
+    :param chunk_size: The size of the first chunk to read, it adapts to the speed of the connection
+    :param timeout: The amount of time to wait for the server
+    :param segments: The number of segments to split the file in to
+    :param checksum: If True, the SHA-256 of the file is calculated. The segments arrive out of order
+    so unlike download_file the file is read again once it's complete.
+    """
+    if not get_partial_path(file_path).exists():
+        response, size, accepts_ranges = handle_network_errors(probe_download)(session, url, timeout)
+        if size is not None and accepts_ranges and size >= 2 * MIN_SEGMENT_SIZE:
+            partial_path = file_path.with_name(file_path.name + SEGMENTED_PARTIAL_SUFFIX)
+            # Retrying continues the segments that are not finished yet since the
+            # segments are retried individually inside download_segments.
+            download_segments(session, url, partial_path, size, progress_bar, current_task_id, chunk_size, timeout, segments)
+            sha256 = hash_file(partial_path).hexdigest() if checksum else None
+            finalize_file(partial_path, file_path)
+            return TransferResult(size, response.headers.get('etag'), response.headers.get('last-modified'), sha256)
+    return download_file(session, url, file_path, progress_bar, current_task_id, chunk_size, timeout, checksum)
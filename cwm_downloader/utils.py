@@ -4,25 +4,36 @@ for the scrapers and the cli
 """
 
 import json
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from threading import Event
 import typer
-from typing import Callable, Dict, Literal, Optional
+from typing import Callable, Dict, Iterable, Iterator, Literal, Optional, Tuple
 from cwm_downloader.exceptions import InvalidCredentialsError
 from cwm_downloader import __app_name__
 from requests.structures import CaseInsensitiveDict
 from requests.utils import cookiejar_from_dict
-from requests import Session, exceptions as rqexceptions
-from socket import gaierror
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path, PurePath
 from functools import wraps
 from rich import print as rprint
+from rich.console import Group
+from rich.live import Live
 from rich.prompt import Confirm
 from rich.status import Status
+from rich.text import Text
 from rich.progress import (
     BarColumn,
     DownloadColumn,
+    MofNCompleteColumn,
     Progress,
+    ProgressColumn,
+    Task,
+    TaskID,
     TextColumn,
+    TimeElapsedColumn,
     TimeRemainingColumn,
     TransferSpeedColumn,
 )
@@ -65,6 +76,19 @@ APP_DIR = get_safe_base_app_dir()
 # we are going to validate that in load_credentials
 CREDENTIALS_FILE = APP_DIR / 'credentials.json'
 
+# The default number of connections kept alive per host by the session. It should be
+# at least the number of requests that are made at the same time.
+DEFAULT_POOL_SIZE = 10
+# The default number of times the session tries again to open a connection that couldn't be
+# opened. Everything else (error statuses, lost connections and the backoff between them) is
+# retried by retry.handle_network_errors, so that it's counted and follows its policy.
+DEFAULT_HTTP_RETRIES = 3
+
+# This event is set when the user interrupts a concurrent download. Only the main
+# thread receives the KeyboardInterrupt so the worker threads check this event
+# inside their download loops to stop early.
+download_cancelled = Event()
+
 # Forbidden file and foldre name characters
 # mainly for windows but also for linux.
 FORBIDDEN_CHARACTERS = r'<>:"/\|?*'
@@ -113,6 +137,14 @@ def get_credentials() -> credentials_type:
     return credentials_dict
 
 
+class RetriesColumn(ProgressColumn):
+    """ A progress bar column that shows how many times the download of a task was retried. """
+
+    def render(self, task: Task) -> Text:
+        retries = task.fields.get('retries', 0)
+        return Text(f'retry {retries}' if retries else '', style='yellow')
+
+
 def get_progress_bar():
     """ Generate a progress bar with a predefined config """
     return Progress(
@@ -125,9 +157,74 @@ def get_progress_bar():
         TransferSpeedColumn(),
         "•",
         TimeRemainingColumn(),
+        RetriesColumn(),
     )
 
 
+def get_course_progress_bar():
+    """ Generate the overall progress bar of a course which counts lectures rather than bytes """
+    return Progress(
+        TextColumn("[bold green]{task.fields[filename]}", justify="right"),
+        BarColumn(bar_width=None),
+        MofNCompleteColumn(),
+        "lectures",
+        "•",
+        TimeElapsedColumn(),
+    )
+
+
+@contextmanager
+def progress_task(progress_bar: Optional[Progress], filename: str) -> Iterator[Tuple[Progress, TaskID]]:
+    """
+    Yield a progress bar and a fresh task to report a single transfer on.
+
+    :param progress_bar: A shared progress bar to add the task to, the task is removed once
+    the transfer finishes. If None a standalone progress bar is created for the task.
+    :param filename: The name to display next to the task
+    """
+    if progress_bar is None:
+        with get_progress_bar() as standalone_progress_bar:
+            yield standalone_progress_bar, standalone_progress_bar.add_task('download', filename=filename, start=False)
+        return
+    task_id = progress_bar.add_task('download', filename=filename, start=False)
+    try:
+        yield progress_bar, task_id
+    finally:
+        # Only the active transfers should have a row in a shared progress bar
+        progress_bar.remove_task(task_id)
+
+
+def run_lecture_jobs(jobs: Iterable[Tuple[Callable[..., object], TaskID]], workers: int, course_progress_bar: Progress, transfers_progress_bar: Progress):
+    """
+    Run lecture downloads on a bounded pool of worker threads while showing the course progress bar
+    above the active transfers. If anything goes wrong, including an interrupt, the queued downloads
+    are cancelled and the running ones are told to stop before the error propagates.
+
+    :param jobs: The downloads paired with the task of the course progress bar they advance when they finish.
+    Every download is called with the transfers progress bar as its progress_bar argument.
+    :param workers: The maximum number of downloads that run at the same time
+    :param course_progress_bar: The progress bar counting the downloaded lectures
+    :param transfers_progress_bar: The progress bar shared by the active transfers
+    """
+    download_cancelled.clear()
+    with Live(Group(course_progress_bar, transfers_progress_bar), refresh_per_second=10), \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(download, progress_bar=transfers_progress_bar): course_task_id
+            for download, course_task_id in jobs
+        }
+        try:
+            for future in as_completed(futures):
+                future.result()
+                course_progress_bar.advance(futures[future])
+        except BaseException:
+            # Stop the queued downloads and tell the running ones to finish up
+            # before the error propagates, see download_cancelled.
+            download_cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
 def get_status(message: str):
     return Status(message)
 
@@ -213,39 +310,19 @@ def handle_keyboard_interrupt_for_files(func: Callable):
     return decorated_func
 
 
-def handle_network_errors(func: Callable):
+def handle_keyboard_interrupt_for_partial_files(func: Callable):
     """ 
-    A decorator to handle network errors for request downloads.
-    if any error occurs it is going to recurse the inner decorated_func
-    until the it finishes. And it is going to log the errors when doing so.
+    A decorator for handling the KeyboardInterrupt error for resumable downloads. Unlike 
+    handle_keyboard_interrupt_for_files the partial file is kept so that the next run can
+    continue the download from where it stopped.
     """
     @wraps(func)
     def decorated_func(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except rqexceptions.SSLError:
-            render_message('error', 'SSL error occured retrying...')
-            return decorated_func(*args, **kwargs)
-        except rqexceptions.Timeout:
-            render_message('error', 'Server timed out retrying...')
-            sleep(5)
-            return decorated_func(*args, **kwargs)
-        except rqexceptions.ConnectionError:
-            render_message('error', 'Connection error. [green]Try Checking your internet connection.')
-            sleep(5)
-            return decorated_func(*args, **kwargs)
-        except gaierror as error:
-            render_message('error', f'Network error retrying...')
-            render_message('error', str(error))
-            sleep(5)
-            return decorated_func(*args, **kwargs)
-        except typer.Exit as err:
-            raise typer.Exit(err.exit_code)
-        except Exception as error:
-            render_message('error', 'Unknown error occured retrying...')
-            render_message('error', str(error))
-            sleep(5)
-            return decorated_func(*args, **kwargs)
+        except KeyboardInterrupt:
+            render_message('warning', 'Process interupted. The partial download is kept and will be resumed on the next run.')
+            raise typer.Exit(0)
     return decorated_func
 
 
@@ -265,16 +342,49 @@ def sterialize_file_or_folder(file_name: str):
     return '.'.join(file_name_list)
 
 
+def get_http_adapter(pool_size: int = DEFAULT_POOL_SIZE, http_retries: int = DEFAULT_HTTP_RETRIES, backoff_factor: float = 0.5):
+    """
+    Create an HTTPAdapter that keeps enough connections alive for concurrent downloads and
+    retries connections that couldn't be opened. Nothing reached the server when a connection
+    fails so these retries don't add attempts to a request.
+
+    :param pool_size: The maximum number of connections kept alive per host
+    :param http_retries: How many times a connection that failed to open is tried again
+    :param backoff_factor: The base of the exponential delay between the retries in seconds
+    """
+    retry = Retry(
+        total=http_retries,
+        connect=http_retries,
+        # Reads and error statuses are left to retry.handle_network_errors
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=backoff_factor,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        # Return the response rather than raising so the caller can decide what to do with it
+        raise_on_status=False
+    )
+    # pool_connections is the number of hosts whose pools are kept, the default is plenty for the
+    # site and its cdn. pool_maxsize is the number of connections kept alive per host.
+    return HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+
+
 @handle_invalid_credentials
-def initialize_session():
+def initialize_session(pool_size: int = DEFAULT_POOL_SIZE, http_retries: int = DEFAULT_HTTP_RETRIES):
     """
     Initialize a session with the headers and cookies that are found
     from the credentials_file.
 
-    :param credentials_file: The file to read the headers and cookies.
+    :param pool_size: The maximum number of connections kept alive per host
+    :param http_retries: How many times the session tries again to open a connection that failed to open
     """
     session = Session()
     credentials = get_credentials()
     session.cookies = cookiejar_from_dict(credentials['cookies'])
     session.headers = CaseInsensitiveDict(credentials['headers'])
+    # The default headers of requests are replaced by the credentials so keep alive is added back
+    session.headers.setdefault('Connection', 'keep-alive')
+    http_adapter = get_http_adapter(pool_size, http_retries)
+    session.mount('https://', http_adapter)
+    session.mount('http://', http_adapter)
     return session
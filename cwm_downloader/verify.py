@@ -0,0 +1,59 @@
+"""
+This module provides the verification of a downloaded course. The files recorded in the manifest
+of the course directory are checked against their recorded sizes and SHA-256 checksums, and the
+lectures with missing or damaged files are marked incomplete so that the next sync downloads them again.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.transfer import hash_file
+from cwm_downloader.utils import get_status
+
+
+def verify_file(file_path: Path, file_details: Dict[str, Any], checksum: bool = False) -> str | None:
+    """
+    Check a downloaded file against the details recorded for it in the manifest and get what's
+    wrong with it, or None if nothing is.
+
+    :param file_path: The path of the file
+    :param file_details: The details of the file recorded in the manifest
+    :param checksum: If True, the SHA-256 of the file is compared too when it was recorded
+    """
+    if not file_path.is_file():
+        return 'missing'
+    size = file_path.stat().st_size
+    if size != file_details.get('size'):
+        return f'expected {file_details.get("size")} bytes but found {size}'
+    # Files downloaded without --checksum only have their size recorded
+    if checksum and file_details.get('sha256') and hash_file(file_path).hexdigest() != file_details['sha256']:
+        return 'checksum mismatch'
+    return None
+
+
+def verify_course(course_dir: Path, workers: int = 4, checksum: bool = False) -> List[Tuple[str, str]]:
+    """
+    Verify every file recorded in the manifest of a course directory and mark the lectures of the
+    damaged files as incomplete. The files are hashed in parallel since hashing big videos takes a while.
+
+    :param course_dir: The course directory containing the manifest
+    :param workers: The number of files verified at the same time
+    :param checksum: If True, the recorded SHA-256 checksums are compared too and not just the sizes
+
+    Returns the path (relative to the course directory) and the problem of every damaged file.
+    """
+    manifest = Manifest.load(course_dir)
+    recorded_files = manifest.get_files()
+    problems: List[Tuple[str, str]] = []
+    with get_status(f'[bold]Verifying {len(recorded_files)} files') as status, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda recorded_file: verify_file(course_dir / recorded_file[1], recorded_file[2], checksum), recorded_files)
+        for verified_count, ((lecture_url, relative_path, _), problem) in enumerate(zip(recorded_files, results), start=1):
+            status.update(f'[bold]Verifying files {verified_count}/{len(recorded_files)}')
+            if problem is not None:
+                problems.append((relative_path, problem))
+                manifest.mark_incomplete(lecture_url)
+    if problems:
+        manifest.save()
+    return problems
@@ -1,6 +1,16 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 import pytest
+from requests import Session
+from rich.progress import Progress
+from cwm_downloader.transfer import download_file, download_file_segmented
 from cwm_downloader.utils import initialize_session
 
+# Recorded pages of the site that are used to test the scrapers without a network connection
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
 
 def pytest_configure(config):
     plugin = config.pluginmanager.getplugin('mypy')
@@ -11,3 +21,95 @@ def pytest_configure(config):
 def request_session():
     session = initialize_session()
     return session
+
+
+def read_fixture(name: str) -> bytes:
+    return (FIXTURES_DIR / name).read_bytes()
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    """ Serves the payload of its server at any path and honors Range requests if the server supports them. """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_payload(head=True)
+
+    def do_GET(self):
+        self.send_payload()
+
+    def send_payload(self, head=False):
+        payload: bytes = self.server.payload  # type: ignore
+        self.server.requests.append(dict(self.headers))  # type: ignore
+        if self.path == '/unavailable':
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/redirect':
+            # Like the site sending an expired session to the sign in page
+            self.send_response(302)
+            self.send_header('Location', '/file.mp4')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"payload"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.server.accept_ranges:  # type: ignore
+            first, _, last = range_header.removeprefix('bytes=').partition('-')
+            start = int(first)
+            end = int(last) if last else len(payload) - 1
+            body = payload[start:end + 1]
+            self.send_response(206)
+            self.server.responses.append(206)  # type: ignore
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        else:
+            body = payload
+            self.send_response(200)
+            self.server.responses.append(200)  # type: ignore
+        if self.server.accept_ranges:  # type: ignore
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"payload"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def file_server(request):
+    """
+    A local http server that serves a random payload. Use indirect parametrization with
+    False to make the server ignore Range requests.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileRequestHandler)
+    server.payload = os.urandom(256 * 1024)  # type: ignore
+    server.accept_ranges = getattr(request, 'param', True)  # type: ignore
+    server.requests = []  # type: ignore
+    # The status codes of the responses with a body
+    server.responses = []  # type: ignore
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def file_url(file_server):
+    return f'http://127.0.0.1:{file_server.server_port}/file.mp4'
+
+
+def download(url: str, file_path: Path, segments: int = 1, checksum: bool = False):
+    """ Download a url of the file server without showing a progress bar. """
+    with Progress(disable=True) as progress_bar:
+        task_id = progress_bar.add_task('download', start=False)
+        if segments > 1:
+            return download_file_segmented(Session(), url, file_path, progress_bar, task_id, 4096, 10, segments, checksum)
+        return download_file(Session(), url, file_path, progress_bar, task_id, 4096, 10, checksum)
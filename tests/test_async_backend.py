@@ -0,0 +1,47 @@
+from pathlib import Path
+import pytest
+from requests import Session, exceptions as rqexceptions
+from rich.progress import Progress
+from cwm_downloader.retry import is_retryable
+from cwm_downloader.transfer import get_partial_path
+
+pytest.importorskip('aiohttp')
+from cwm_downloader.async_backend import AsyncBackend, PageResponse  # noqa: E402
+
+
+@pytest.fixture
+def async_backend():
+    with AsyncBackend(Session(), concurrency=4) as backend:
+        yield backend
+
+
+def download(backend: AsyncBackend, url: str, file_path: Path):
+    with Progress(disable=True) as progress_bar:
+        task_id = progress_bar.add_task('download', start=False)
+        return backend.download_file(url, file_path, progress_bar, task_id, 4096, 10)
+
+
+def test_download_file(async_backend, file_server, file_url: str, tmp_path: Path):
+    file_path = tmp_path / 'lecture.mp4'
+    transfer_result = download(async_backend, file_url, file_path)
+    assert file_path.read_bytes() == file_server.payload
+    assert transfer_result.size == len(file_server.payload) and transfer_result.etag == '"payload"'
+
+
+def test_download_file_resumes_partial_file(async_backend, file_server, file_url: str, tmp_path: Path):
+    file_path = tmp_path / 'lecture.mp4'
+    get_partial_path(file_path).write_bytes(file_server.payload[:1000])
+    download(async_backend, file_url, file_path)
+    assert file_path.read_bytes() == file_server.payload
+    assert file_server.requests[0]['Range'] == 'bytes=1000-'
+
+
+def test_get_works_like_a_session(async_backend, file_url: str):
+    response = async_backend.get(file_url, timeout=10, headers={'If-None-Match': '"payload"'})
+    assert response.status_code == 304
+
+
+def test_page_response_raises_retryable_http_errors():
+    with pytest.raises(rqexceptions.HTTPError) as error:
+        PageResponse('https://example.com', 503).raise_for_status()
+    assert is_retryable(error.value)
@@ -0,0 +1,52 @@
+from pathlib import Path
+from cwm_downloader.batch import LectureJob, read_course_urls
+from cwm_downloader.manifest import Manifest
+
+
+class FakeLecture:
+    def __init__(self, lecture_type: str, fetched: bool = True):
+        self.lecture_type = lecture_type
+        self.fetched = fetched
+
+    def get_type(self):
+        raise AssertionError('The page of the lecture was fetched to prioritize it')
+
+    def get_known_type(self):
+        return self.lecture_type if self.fetched else None
+
+
+def test_read_course_urls(tmp_path: Path):
+    urls_file = tmp_path / 'courses.txt'
+    urls_file.write_text('''
+# My courses
+https://codewithmosh.com/courses/1/lectures/1
+  https://codewithmosh.com/courses/2/lectures/5  
+
+https://codewithmosh.com/courses/1/lectures/1
+''')
+    assert read_course_urls(urls_file) == [
+        'https://codewithmosh.com/courses/1/lectures/1',
+        'https://codewithmosh.com/courses/2/lectures/5'
+    ]
+
+
+def test_jobs_are_prioritized_across_courses(tmp_path: Path):
+    manifest = Manifest(tmp_path)
+    lectures = [
+        ('course 1 text', 'text', 0, 0),
+        ('course 1 video', 'video', 1, 0),
+        ('course 2 video', 'video', 0, 1),
+        ('course 2 video 2', 'video', 1, 1),
+    ]
+    jobs = {
+        name: LectureJob(FakeLecture(lecture_type), tmp_path, manifest, 0, position, course_index)  # type: ignore
+        for name, lecture_type, position, course_index in lectures
+    }
+    ordered = sorted(jobs, key=lambda name: jobs[name].get_priority())
+    # Videos go first taking turns between the courses and text lectures fill the gaps at the end
+    assert ordered == ['course 2 video', 'course 1 video', 'course 2 video 2', 'course 1 text']
+    # Without prefetched pages the courses only take turns
+    for job in jobs.values():
+        job.lecture.fetched = False  # type: ignore
+    ordered = sorted(jobs, key=lambda name: jobs[name].get_priority())
+    assert ordered == ['course 1 text', 'course 2 video', 'course 1 video', 'course 2 video 2']
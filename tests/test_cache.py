@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+from requests import Session
+from cwm_downloader.cache import PageCache
+import pytest
+
+
+@pytest.fixture
+def page_cache(request, tmp_path: Path):
+    return PageCache(tmp_path, ttl=getattr(request, 'param', 60))
+
+
+def test_cache_serves_fresh_pages_without_requests(page_cache: PageCache, file_server, file_url: str):
+    session = Session()
+    assert page_cache.get(session, file_url, 10) == file_server.payload
+    assert page_cache.get(session, file_url, 10) == file_server.payload
+    assert len(file_server.requests) == 1
+
+
+@pytest.mark.parametrize('page_cache', [0], indirect=True)
+def test_cache_revalidates_expired_pages(page_cache: PageCache, file_server, file_url: str):
+    session = Session()
+    page_cache.get(session, file_url, 10)
+    assert page_cache.get(session, file_url, 10) == file_server.payload
+    assert file_server.requests[1]['If-None-Match'] == '"payload"'
+
+
+def test_cache_evicts_least_recently_used_pages(tmp_path: Path):
+    page_cache = PageCache(tmp_path, max_size=10)
+    page_cache.store('https://members.codewithmosh.com/1', b'12345')
+    page_cache.store('https://members.codewithmosh.com/2', b'12345')
+    # Make the second page the least recently used one
+    older_body_path, _ = page_cache.get_paths('https://members.codewithmosh.com/2')
+    os.utime(older_body_path, (0, 0))
+    page_cache.store('https://members.codewithmosh.com/3', b'12345')
+    assert not older_body_path.exists()
+    assert page_cache.get_paths('https://members.codewithmosh.com/1')[0].exists()
+    assert page_cache.get_paths('https://members.codewithmosh.com/3')[0].exists()
+
+
+def test_cache_only_walks_the_directory_when_full(tmp_path: Path, monkeypatch):
+    PageCache(tmp_path).store('https://members.codewithmosh.com/1', b'12345')
+    # The size of the pages stored before is found when the cache is opened
+    page_cache = PageCache(tmp_path, max_size=12)
+    assert page_cache.size == 5
+    evictions = []
+    original_evict = page_cache.evict
+
+    def evict():
+        evictions.append(1)
+        original_evict()
+    monkeypatch.setattr(page_cache, 'evict', evict)
+    page_cache.store('https://members.codewithmosh.com/2', b'12345')
+    # Storing a page again only counts the difference of its sizes
+    page_cache.store('https://members.codewithmosh.com/2', b'123456')
+    assert page_cache.size == 11 and evictions == []
+    page_cache.store('https://members.codewithmosh.com/3', b'12345')
+    assert evictions == [1]
+    assert page_cache.size <= 12
+
+
+def test_cache_skips_pages_that_are_not_valid(page_cache: PageCache, file_server, file_url: str):
+    session = Session()
+    assert page_cache.get(session, file_url, 10, lambda content: False) == file_server.payload
+    page_cache.get(session, file_url, 10, lambda content: False)
+    assert len(file_server.requests) == 2
+
+
+def test_cache_skips_redirected_pages(page_cache: PageCache, file_server):
+    session = Session()
+    redirect_url = f'http://127.0.0.1:{file_server.server_port}/redirect'
+    assert page_cache.get(session, redirect_url, 10) == file_server.payload
+    assert not page_cache.get_paths(redirect_url)[0].exists()
+
+
+def test_cache_clear(page_cache: PageCache):
+    page_cache.store('https://members.codewithmosh.com/1', b'12345')
+    page_cache.clear()
+    assert list(page_cache.cache_dir.iterdir()) == []
+    assert page_cache.size == 0
@@ -0,0 +1,33 @@
+from pathlib import Path
+from typer.testing import CliRunner
+from cwm_downloader import cli, retry, utils
+from cwm_downloader.cli import app
+from cwm_downloader.exceptions import ElementNotFoundError
+from cwm_downloader.scraper._scraper import Scraper
+
+
+def test_max_attempts_makes_a_single_request(file_server, tmp_path: Path, monkeypatch):
+    base_url = f'http://127.0.0.1:{file_server.server_port}'
+    monkeypatch.setattr(Scraper, 'base_url', base_url)
+    monkeypatch.setattr(utils, 'get_credentials', lambda: {'cookies': {}, 'headers': {}})
+    # The command replaces the retry policy, this restores it afterwards
+    monkeypatch.setattr(retry, 'retry_policy', retry.retry_policy)
+    result = CliRunner().invoke(app, ['download', f'{base_url}/unavailable', str(tmp_path), '--max-attempts', '1', '--no-cache'])
+    assert result.exit_code == 1
+    # Neither the session nor the retry engine asked again
+    assert len(file_server.requests) == 1
+
+
+def test_batch_exits_on_scraping_errors(tmp_path: Path, monkeypatch):
+    def download_courses(*args, **kwargs):
+        raise ElementNotFoundError('lecture name')
+
+    monkeypatch.setattr(utils, 'get_credentials', lambda: {'cookies': {}, 'headers': {}})
+    monkeypatch.setattr(retry, 'retry_policy', retry.retry_policy)
+    monkeypatch.setattr(cli, 'download_courses', download_courses)
+    urls_file = tmp_path / 'courses.txt'
+    urls_file.write_text(f'{Scraper.base_url}/courses/1/lectures/1\n')
+    result = CliRunner().invoke(app, ['batch', str(urls_file), str(tmp_path), '--no-cache'])
+    assert result.exit_code == 1
+    # The error is shown as a message instead of a traceback
+    assert not isinstance(result.exception, ElementNotFoundError)
@@ -1,5 +1,15 @@
+from pathlib import Path
+from requests import Session
+from benchmarks.fake_site import FakeSite, SiteConfig
+from cwm_downloader import retry
+from cwm_downloader.retry import RetryPolicy
+from bs4 import BeautifulSoup
+from cwm_downloader.scraper import _scraper
+from cwm_downloader.scraper._scraper import PARSERS, compile_selector
 from cwm_downloader.scraper.course_scraper import Course
+from cwm_downloader.scraper.lecture_scraper import Lecture
 from cwm_downloader.exceptions import IncorrectUrlError
+from tests.conftest import read_fixture
 import pytest
 
 testing_urls = {
@@ -52,3 +62,85 @@ def test_get_lectures(course_obj: Course):
     sections_and_lectures = course_obj.get_all_sections()
     assert len(sections_and_lectures)
     assert all(len(section) for section in sections_and_lectures.values())
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_parse_page_keeps_course_details(parser: str):
+    course_obj = Course(f'{Course.base_url}/courses/783424/lectures/14779974', Session(), parser=parser)
+    course_obj.make_soup = lambda: course_obj.parse_page(read_fixture('video_lecture.html'))  # type: ignore
+    # Only the sidebar is parsed so the mainbar shouldn't be in the soup
+    assert course_obj.soup.select_one('#lecture_heading') is None
+    assert str(course_obj) == 'The Ultimate Redux Course'
+    sections_and_lectures = course_obj.get_all_sections()
+    assert list(sections_and_lectures.keys()) == ['1-Getting Started (9m)', '2-Functional Programming (1h)']
+    assert [lecture.url for lecture in sections_and_lectures['1-Getting Started (9m)']] == [
+        f'{Course.base_url}/courses/783424/lectures/14779988',
+        f'{Course.base_url}/courses/783424/lectures/14779974'
+    ]
+
+
+@pytest.mark.parametrize('failure_rate', [0, 0.2])
+def test_download_fake_course(tmp_path: Path, failure_rate: float, monkeypatch):
+    # The failures are injected on purpose so they are retried right away
+    monkeypatch.setattr(retry, 'retry_policy', RetryPolicy(max_attempts=10, base_delay=0, max_delay=0))
+    config = SiteConfig(sections=2, lectures_per_section=4, file_size=64 * 1024, failure_rate=failure_rate, seed=1)
+    with FakeSite(config) as site:
+        Course(site.course_url, Session()).download(tmp_path, workers=2, on_exists='overwrite')
+    course_dir = tmp_path / 'Fake Course'
+    videos = sorted(course_dir.rglob('*.mp4'))
+    # Every fourth lecture is a text lecture so each section has three videos
+    assert len(videos) == 6
+    assert all(video.read_bytes() == site.payload for video in videos)
+    assert len(list(course_dir.rglob('*.html'))) == 2
+    if failure_rate:
+        assert site.requests['failures']
+
+
+class CountingSelector:
+    """ A compiled selector that counts how many times it's used. """
+
+    def __init__(self, selector: str):
+        self.selector = compile_selector(selector)
+        self.calls = 0
+
+    def select(self, source):
+        self.calls += 1
+        return self.selector.select(source)
+
+
+def test_select_element_remembers_winning_selector(monkeypatch):
+    selectors = tuple(CountingSelector(selector) for selector in Course.element_selectors.lecture_anchor_tags.value)
+    monkeypatch.setattr(_scraper, 'get_compiled_selectors', lambda element: selectors)
+    course_obj = Course(f'{Course.base_url}/courses/1/lectures/1', Session())
+    # A layout that only the second selector matches
+    mainbar_soup = BeautifulSoup('<body><section><div class="course-mainbar"><div class="row"><div><ul><li><a href="/lectures/2">2</a></li></ul></div></div></div></section></body>', 'html.parser')
+    for _ in range(3):
+        assert [anchor['href'] for anchor in course_obj.select_element(Course.element_selectors.lecture_anchor_tags, mainbar_soup)] == ['/lectures/2']
+    # The first selector failed on the page so it isn't tried again
+    assert [selector.calls for selector in selectors] == [1, 3]
+    # The other selectors are still tried when the remembered one stops matching
+    sidebar_soup = BeautifulSoup('<div class="course-sidebar"><div class="row lecture-sidebar"><div class="course-section"><a class="item" href="/lectures/3">3</a></div></div></div>', 'html.parser')
+    assert [anchor['href'] for anchor in course_obj.select_element(Course.element_selectors.lecture_anchor_tags, sidebar_soup)] == ['/lectures/3']
+
+
+def test_prefetch_lectures(capsys):
+    with FakeSite(SiteConfig(sections=1, lectures_per_section=4)) as site:
+        course = Course(site.course_url, Session())
+        lectures = [lecture for lectures in course.get_all_sections().values() for lecture in lectures]
+        # A page that doesn't exist anymore is reported and left to be fetched again when it's downloaded
+        missing_lecture = Lecture(f'{site.url}/courses/1/lectures/missing', Session())
+        course.prefetch_lectures([*lectures, missing_lecture], 2)
+        pages = site.requests['pages']
+        assert [lecture.get_type() for lecture in lectures] == ['video', 'video', 'video', 'text']
+        # The details of the lectures were read from the prefetched pages
+        assert site.requests['pages'] == pages == 5
+    assert 'Failed to prefetch' in capsys.readouterr().out
+
+
+def test_prefetch_lectures_raises_bugs(monkeypatch):
+    def get_type(self):
+        raise TypeError('a bug')
+    monkeypatch.setattr(Lecture, 'get_type', get_type)
+    course = Course(f'{Course.base_url}/courses/1/lectures/1', Session())
+    with pytest.raises(TypeError):
+        course.prefetch_lectures([Lecture(f'{Course.base_url}/courses/1/lectures/2', Session())], 2)
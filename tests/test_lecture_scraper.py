@@ -1,6 +1,15 @@
 from typing import Any, Dict
-from cwm_downloader.scraper.lecture_scraper import Lecture, LectureType
+from requests import Session
+from cwm_downloader.scraper import _scraper
+from cwm_downloader.scraper._scraper import PARSERS
+from pathlib import Path
+from cwm_downloader.scraper.lecture_scraper import Lecture, LectureType, check_existing_file
+from cwm_downloader import transfer
+from cwm_downloader.transfer import get_partial_path
+from rich.progress import Progress
+from cwm_downloader.scraper.stream_extractor import extract_lecture_details
 from cwm_downloader.utils import sterialize_file_or_folder
+from tests.conftest import read_fixture
 import pytest
 
 
@@ -96,3 +105,151 @@ def test_get_type(lecture_obj: Lecture, expected: LectureType):
 ])
 def test_sterilize_filenames(filename: str, expected: str):
     assert sterialize_file_or_folder(filename) == expected
+
+
+offline_lectures: Dict[str, Dict[str, Any]] = {
+    'video_lecture.html': {
+        'downloadables': {
+            '5- Setting Up the Development Environment.mp4': 'https://cdn.fs.teachablecdn.com/vsdryTMASqYUgPm4nMRQ',
+            'Source Code.zip': 'https://cdn.fs.teachablecdn.com/wr9x3CGyQb2zk5nCObT5'
+        },
+        'name': '5- Setting Up the Development Environment',
+        'type': 'video'
+    },
+    'text_lecture.html': {
+        'downloadables': {'1- Getting Started with C++.pdf': 'https://cdn.fs.teachablecdn.com/vlVGa4CsQzKmJbDhgoUw'},
+        'name': '6- Summary',
+        'type': 'text'
+    }
+}
+
+
+def make_offline_lecture(fixture_name: str, parser: str) -> Lecture:
+    lecture = Lecture(f'{Lecture.base_url}/courses/1/lectures/1', Session(), parser=parser)
+    # Parse the recorded page the same way a requested page is parsed
+    lecture.make_soup = lambda: lecture.parse_page(read_fixture(fixture_name))  # type: ignore
+    return lecture
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+@pytest.mark.parametrize('fixture_name, expected', offline_lectures.items())
+def test_parse_page_keeps_lecture_details(fixture_name: str, expected: Dict[str, Any], parser: str):
+    lecture = make_offline_lecture(fixture_name, parser)
+    # Only the mainbar is parsed so the sidebar, header and footer shouldn't be in the soup
+    assert lecture.soup.select_one('div.course-sidebar') is None
+    assert lecture.get_name() == expected['name']
+    assert lecture.get_type() == expected['type']
+    assert lecture.get_download_names_and_urls() == expected['downloadables']
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_parse_page_falls_back_to_the_whole_page(parser: str):
+    lecture = Lecture(f'{Lecture.base_url}/courses/1/lectures/1', Session(), parser=parser)
+    soup = lecture.parse_page(b'<html><body><h2 id="lecture_heading">1- Welcome</h2></body></html>')
+    assert soup.select_one('#lecture_heading') is not None
+
+
+@pytest.mark.parametrize('page, expected', [
+    (read_fixture('video_lecture.html'), True),
+    (read_fixture('text_lecture.html'), True),
+    (b'<html><body><form class="sign-in"><input name="email"></form></body></html>', False)
+])
+def test_is_expected_page(page: bytes, expected: bool):
+    lecture = Lecture(f'{Lecture.base_url}/courses/1/lectures/1', Session())
+    assert lecture.is_expected_page(page) == expected
+
+
+@pytest.mark.parametrize('fixture_name', offline_lectures.keys())
+def test_stream_extractor_matches_soup_extractor(fixture_name: str):
+    page = read_fixture(fixture_name)
+    # Feed the page in small chunks like a slow response would
+    details, consumed_page = extract_lecture_details((page[start:start + 64] for start in range(0, len(page), 64)), Lecture.base_url)
+    lecture = make_offline_lecture(fixture_name, 'html.parser')
+    assert details.name == lecture.select_element(Lecture.element_selectors.lecture_name, single=True).get_text(strip=True)
+    assert details.icon == lecture.select_element(Lecture.element_selectors.lecture_icon, single=True).get('xlink:href')
+    assert details.downloads == lecture.get_download_names_and_urls()
+    # The footer comes after the main content so it should never be read
+    assert b'<footer' not in consumed_page
+
+
+@pytest.mark.parametrize('fixture_name, expected', offline_lectures.items())
+def test_stream_extractor_lecture(fixture_name: str, expected: Dict[str, Any], file_server, monkeypatch):
+    file_server.payload = read_fixture(fixture_name)
+    base_url = f'http://127.0.0.1:{file_server.server_port}'
+    monkeypatch.setattr(Lecture, 'base_url', base_url)
+    lecture = Lecture(f'{base_url}/courses/1/lectures/1', Session(), extractor='stream')
+    assert lecture.get_name() == expected['name']
+    assert lecture.get_type() == expected['type']
+    assert lecture.get_download_names_and_urls() == expected['downloadables']
+    # The soup is made from the streamed part of the page without requesting it again
+    assert 'lecture-completion-data' not in lecture.get_text_lecture()
+    assert len(file_server.requests) == 1
+
+
+@pytest.mark.parametrize('fixture_name, expected', offline_lectures.items())
+def test_metadata_is_extracted_once(fixture_name: str, expected: Dict[str, Any]):
+    lecture = make_offline_lecture(fixture_name, 'html.parser')
+    assert lecture.get_known_type() is None
+    assert lecture.get_type() == expected['type']
+    assert lecture.get_known_type() == expected['type']
+
+    def make_soup_again():
+        raise AssertionError('The page was parsed again')
+    # Everything below must come from the metadata since the soup was released
+    lecture.make_soup = make_soup_again  # type: ignore
+    assert str(lecture) == expected['name']
+    assert lecture.get_download_names_and_urls() == expected['downloadables']
+    assert lecture.get_lecture_number() == expected['name'].split('-')[0]
+    if expected['type'] == 'text':
+        assert 'lecture-completion-data' not in lecture.get_text_lecture()
+    with pytest.raises(AttributeError):
+        lecture.metadata.name = 'changed'  # type: ignore
+
+
+@pytest.mark.parametrize('low_memory', [True, False])
+def test_low_memory_decomposes_released_soup(low_memory: bool, monkeypatch):
+    monkeypatch.setattr(_scraper, 'low_memory', low_memory)
+    lecture = make_offline_lecture('video_lecture.html', 'html.parser')
+    name_element = lecture.select_element(Lecture.element_selectors.lecture_name, single=True)
+    assert lecture.metadata.name == offline_lectures['video_lecture.html']['name']
+    # A decomposed tag loses its children so nothing of the page is kept alive by it
+    assert name_element.decomposed == low_memory
+
+
+def test_interrupted_text_lecture_keeps_existing_file(tmp_path: Path, monkeypatch):
+    file_path = tmp_path / '6- Summary.html'
+    file_path.write_text('<html>the complete lecture</html>')
+    lecture = make_offline_lecture('text_lecture.html', 'html.parser')
+
+    def interrupt(temporary_path: Path, file_path: Path):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(transfer, 'finalize_file', interrupt)
+    with Progress(disable=True) as progress_bar, pytest.raises(KeyboardInterrupt):
+        lecture._Lecture__download_text(file_path, progress_bar, progress_bar.add_task('text', start=False))  # type: ignore
+    # The file from before is kept whole and the temporary file is removed
+    assert file_path.read_text() == '<html>the complete lecture</html>'
+    assert list(tmp_path.iterdir()) == [file_path]
+
+
+@pytest.mark.parametrize('on_exists, local_size, expected_action', [
+    ('skip', 256 * 1024, 'keep'),
+    ('skip', 1000, 'download'),
+    ('resume', 1000, 'download'),
+    ('overwrite', 256 * 1024, 'download'),
+    ('ask', 1000, 'skip')
+])
+def test_check_existing_file(file_server, file_url: str, tmp_path: Path, on_exists, local_size: int, expected_action: str):
+    file_path = tmp_path / 'lecture.mp4'
+    file_path.write_bytes(file_server.payload[:local_size])
+    assert check_existing_file(Session(), file_url, file_path, on_exists, False, 10) == expected_action
+    # Only resume continues the file that is cut short
+    assert get_partial_path(file_path).exists() == (on_exists == 'resume')
+
+
+def test_check_existing_file_trusts_known_size(file_server, file_url: str, tmp_path: Path):
+    file_path = tmp_path / 'lecture.mp4'
+    file_path.write_bytes(b'video')
+    assert check_existing_file(Session(), file_url, file_path, 'skip', False, 10, known_size=5) == 'keep'
+    assert check_existing_file(Session(), file_url, file_path, 'verify', False, 10, known_size=5, known_sha256='0' * 64) == 'download'
+    # The size was known so the server wasn't asked about it
+    assert file_server.requests == []
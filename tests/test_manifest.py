@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from cwm_downloader.manifest import Manifest, MANIFEST_NAME
+
+lecture_url = 'https://members.codewithmosh.com/courses/783424/lectures/14779988'
+
+
+def record_lecture(manifest: Manifest, file_path: Path, complete: bool = True):
+    file_path.parent.mkdir(exist_ok=True)
+    file_path.write_bytes(b'video')
+    manifest.record_file(lecture_url, file_path, 'https://cdn.fs.teachablecdn.com/video', 5, '"etag"')
+    manifest.record_lecture(lecture_url, '1- Welcome', 'video', complete)
+    manifest.save()
+
+
+def test_manifest_survives_reloading(tmp_path: Path):
+    record_lecture(Manifest(tmp_path), tmp_path / '1-Getting Started' / '1- Welcome.mp4')
+    manifest = Manifest.load(tmp_path)
+    assert manifest.is_complete(lecture_url)
+    assert manifest.lectures[lecture_url]['files']['1-Getting Started/1- Welcome.mp4']['etag'] == '"etag"'
+
+
+def test_manifest_detects_incomplete_lectures(tmp_path: Path):
+    manifest = Manifest(tmp_path)
+    assert not manifest.is_complete(lecture_url)
+    record_lecture(manifest, tmp_path / '1- Welcome.mp4', complete=False)
+    assert not manifest.is_complete(lecture_url)
+    record_lecture(manifest, tmp_path / '1- Welcome.mp4')
+    assert manifest.is_complete(lecture_url)
+    # A file that was changed or deleted after the sync makes the lecture incomplete again
+    (tmp_path / '1- Welcome.mp4').write_bytes(b'truncated video')
+    assert not manifest.is_complete(lecture_url)
+
+
+def test_manifest_ignores_unreadable_files(tmp_path: Path):
+    (tmp_path / MANIFEST_NAME).write_text('{not json')
+    assert Manifest.load(tmp_path).lectures == {}
+
+
+def test_manifest_saves_from_many_threads(tmp_path: Path):
+    manifest = Manifest(tmp_path)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        # A failed save raises its error here
+        list(executor.map(lambda _: manifest.save(), range(50)))
+    assert Manifest.load(tmp_path).lectures == {}
+    assert not (tmp_path / (MANIFEST_NAME + '.tmp')).exists()
@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+import pytest
+from requests import Session
+from cwm_downloader.exceptions import ElementNotFoundError, RequestFailedError
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.plan import Plan, PlanDownloader, PlannedFile, PlannedLecture, plan_lecture, select_lectures
+from cwm_downloader.scraper.lecture_scraper import Lecture
+
+all_sections = {
+    '1-Getting Started': ['lecture 1', 'lecture 2', 'lecture 3'],
+    '2-Basics': ['lecture 4', 'lecture 5'],
+    '3-Advanced': ['lecture 6']
+}
+
+
+@pytest.mark.parametrize('section_no, lecture_no, only, expected', [
+    (None, None, False, ['lecture 1', 'lecture 2', 'lecture 3', 'lecture 4', 'lecture 5', 'lecture 6']),
+    (1, None, False, ['lecture 4', 'lecture 5', 'lecture 6']),
+    (0, 2, False, ['lecture 3', 'lecture 4', 'lecture 5', 'lecture 6']),
+    (1, None, True, ['lecture 4', 'lecture 5']),
+    (1, 1, True, ['lecture 5']),
+    (None, 1, True, ['lecture 2'])
+])
+def test_select_lectures_like_download(section_no, lecture_no, only, expected):
+    selected = select_lectures(all_sections, section_no, lecture_no, only)
+    assert [lecture for _, lecture in selected] == expected
+
+
+def test_select_lectures_rejects_missing_lectures():
+    with pytest.raises(IndexError):
+        select_lectures(all_sections, 2, 3, True)
+
+
+@pytest.mark.parametrize('error', [RequestFailedError('timed out'), ElementNotFoundError('no lecture name')])
+def test_plan_lecture_records_failed_lectures(tmp_path: Path, monkeypatch, error: Exception):
+    def get_type(self):
+        raise error
+
+    monkeypatch.setattr(Lecture, 'get_type', get_type)
+    lecture = Lecture('https://members.codewithmosh.com/courses/1/lectures/1', Session())
+    planned_lecture = plan_lecture(lecture, '1-Getting Started', tmp_path / '1-Getting Started', tmp_path)
+    assert planned_lecture.error == str(error)
+    assert planned_lecture.files == []
+
+
+def make_plan(file_url: str = 'https://cdn.example.com/1.mp4', size: int | None = 1000):
+    return Plan('Course', 'https://codewithmosh.com/courses/1', '/downloads', [
+        PlannedLecture('1-Getting Started', 'lecture 1', 'https://codewithmosh.com/courses/1/lectures/1', 'video', [
+            PlannedFile(file_url, 'Course/1-Getting Started/lecture 1.mp4', size),
+            PlannedFile('https://cdn.example.com/1.zip', 'Course/1-Getting Started/01-resource_code.zip', None)
+        ]),
+        PlannedLecture('1-Getting Started', 'lecture 2', 'https://codewithmosh.com/courses/1/lectures/2', 'text', [
+            PlannedFile(None, 'Course/1-Getting Started/lecture 2.html')
+        ])
+    ])
+
+
+def test_plan_totals():
+    plan = make_plan()
+    plan_dict = json.loads(plan.to_json())
+    assert plan_dict['total_bytes'] == 1000
+    # Text lectures are made from their page so their unknown size doesn't count
+    assert plan_dict['unknown_sizes'] == 1
+    assert plan_dict['lectures'][1]['files'][0]['url'] is None
+
+
+def test_plan_round_trip():
+    plan = make_plan()
+    assert Plan.from_dict(json.loads(plan.to_json())) == plan
+    with pytest.raises(ValueError):
+        Plan.from_dict({**plan.to_dict(), 'version': 0})
+
+
+def test_plan_downloader(file_server, file_url: str, tmp_path: Path):
+    plan = make_plan(file_url, len(file_server.payload))
+    # Only the video lecture is downloaded, the text lecture needs the real site
+    video_lecture = plan.lectures[0]
+    video_lecture.files = video_lecture.files[:1]
+    manifest = Manifest(tmp_path / 'Course')
+    PlanDownloader(Session()).download_lecture(video_lecture, tmp_path, manifest=manifest)
+    assert (tmp_path / video_lecture.files[0].path).read_bytes() == file_server.payload
+    assert manifest.is_complete(video_lecture.url)
+
+    # Running the plan again doesn't download the file again
+    file_server.requests.clear()
+    PlanDownloader(Session()).download_lecture(video_lecture, tmp_path, manifest=manifest)
+    assert file_server.requests == []
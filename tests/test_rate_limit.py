@@ -0,0 +1,55 @@
+from pathlib import Path
+from time import monotonic
+import pytest
+from cwm_downloader import rate_limit
+from cwm_downloader.rate_limit import HostRateLimiter, TokenBucket, configure_rate_limits, parse_rate
+from tests.conftest import download
+
+
+@pytest.fixture
+def reset_rate_limits():
+    yield
+    configure_rate_limits(None, None)
+
+
+@pytest.mark.parametrize('rate, expected', [
+    ('500', 500),
+    ('64K', 64 * 1024),
+    ('5M', 5 * 1024 ** 2),
+    ('1.5g', int(1.5 * 1024 ** 3))
+])
+def test_parse_rate(rate: str, expected: int):
+    assert parse_rate(rate) == expected
+
+
+@pytest.mark.parametrize('rate', ['', 'fast', '0', '5X', '-1M'])
+def test_parse_rate_rejects_invalid_rates(rate: str):
+    with pytest.raises(ValueError):
+        parse_rate(rate)
+
+
+def test_token_bucket_waits_for_debt():
+    bucket = TokenBucket(rate=1000, capacity=100)
+    # The saved up tokens are used first and the rest is borrowed from the future
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(500) == pytest.approx(0.5, abs=0.05)
+
+
+def test_host_rate_limiter_spaces_requests_per_host():
+    limiter = HostRateLimiter(requests_per_second=20)
+    started = monotonic()
+    for _ in range(3):
+        limiter.wait('https://members.codewithmosh.com/courses/1')
+    # Another host has its own limit and isn't slowed down by the first one
+    limiter.wait('https://cdn.example.com/video.mp4')
+    assert 0.09 < monotonic() - started < 0.5
+
+
+def test_download_file_respects_bandwidth_limit(reset_rate_limits, file_server, file_url: str, tmp_path: Path):
+    # 256KB at 512KB/s with a 128KB burst allowance takes at least a quarter of a second
+    configure_rate_limits(512 * 1024, None)
+    assert rate_limit.bandwidth_limiter is not None
+    started = monotonic()
+    download(file_url, tmp_path / 'lecture.mp4')
+    assert monotonic() - started > 0.2
+    assert (tmp_path / 'lecture.mp4').read_bytes() == file_server.payload
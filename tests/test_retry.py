@@ -0,0 +1,121 @@
+import errno
+import pytest
+from requests import Response, exceptions as rqexceptions
+from cwm_downloader.exceptions import IncompleteDownloadError, InvalidCredentialsError, RequestFailedError
+from cwm_downloader import retry
+from cwm_downloader.retry import RetryPolicy, configure_retries, current_attempt, get_retry_after, handle_network_errors, is_retryable, raise_for_page_status, retry_stats
+
+
+def make_http_error(status_code: int, retry_after: str | None = None):
+    response = Response()
+    response.status_code = status_code
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return rqexceptions.HTTPError(response=response)
+
+
+@pytest.fixture
+def fast_retries():
+    old_policy = retry.retry_policy
+    configure_retries(RetryPolicy(max_attempts=3, base_delay=0, max_delay=0))
+    retry_stats.reset()
+    yield
+    configure_retries(old_policy)
+    retry_stats.reset()
+
+
+@pytest.mark.parametrize('status_code, retryable', [(403, False), (404, False), (429, True), (503, True)])
+def test_is_retryable_http_errors(status_code, retryable):
+    assert is_retryable(make_http_error(status_code)) is retryable
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (rqexceptions.ConnectionError('connection reset'), True),
+    (IncompleteDownloadError('cut short'), True),
+    (TypeError('a bug'), False),
+    (OSError(errno.ENOSPC, 'No space left on device'), False)
+])
+def test_is_retryable_errors(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+@pytest.mark.parametrize('error', [TypeError('a bug'), OSError(errno.ENOSPC, 'No space left on device')])
+def test_raises_errors_that_are_not_network_errors(fast_retries, error):
+    calls = []
+
+    @handle_network_errors
+    def broken():
+        calls.append(1)
+        raise error
+
+    with pytest.raises(type(error)):
+        broken()
+    assert len(calls) == 1
+    assert retry_stats.retries == 0 and retry_stats.failures == 0
+
+
+@pytest.mark.parametrize('error, expected', [
+    (make_http_error(429, '3'), 3),
+    (make_http_error(503, 'Wed, 21 Oct 2015 07:28:00 GMT'), None),
+    (make_http_error(503), None),
+    (rqexceptions.ConnectionError('connection reset'), None)
+])
+def test_get_retry_after(error, expected):
+    assert get_retry_after(error) == expected
+
+
+def test_retries_until_success(fast_retries):
+    attempts = []
+
+    @handle_network_errors
+    def flaky():
+        attempts.append(current_attempt())
+        if len(attempts) < 3:
+            raise rqexceptions.ConnectionError('connection reset')
+        return 'done'
+
+    assert flaky() == 'done'
+    assert attempts == [1, 2, 3]
+    assert retry_stats.retries == 2 and retry_stats.failures == 0
+
+
+def test_gives_up_after_max_attempts(fast_retries):
+    calls = []
+
+    @handle_network_errors
+    def always_failing():
+        calls.append(1)
+        raise rqexceptions.Timeout('timed out')
+
+    with pytest.raises(RequestFailedError):
+        always_failing()
+    assert len(calls) == 3
+    assert retry_stats.failures == 1
+
+
+def test_does_not_retry_forbidden(fast_retries):
+    calls = []
+
+    @handle_network_errors
+    def forbidden():
+        calls.append(1)
+        raise make_http_error(403)
+
+    with pytest.raises(RequestFailedError):
+        forbidden()
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('status_code, expected_error', [
+    (200, None), (404, None), (401, InvalidCredentialsError), (403, InvalidCredentialsError),
+    (429, rqexceptions.HTTPError), (503, rqexceptions.HTTPError)
+])
+def test_raise_for_page_status(status_code, expected_error):
+    response = Response()
+    response.status_code = status_code
+    response.url = 'https://members.codewithmosh.com/courses/1/lectures/1'
+    if expected_error is not None:
+        with pytest.raises(expected_error):
+            raise_for_page_status(response)
+    else:
+        raise_for_page_status(response)
@@ -0,0 +1,112 @@
+import json
+import pstats
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Thread
+from cwm_downloader import telemetry as telemetry_module
+from benchmarks.fake_site import FakeSite
+from cwm_downloader import retry
+from cwm_downloader.retry import RetryPolicy
+from cwm_downloader.scraper.course_scraper import Course
+from cwm_downloader.scraper.lecture_scraper import Lecture, LectureExtractor
+from cwm_downloader.telemetry import Telemetry, get_percentile, measured, profiled, telemetry
+from requests import ConnectionError, Session
+import pytest
+
+
+class FakeScraper:
+    url = 'https://members.codewithmosh.com/courses/783424/lectures/14779988'
+
+    @measured('fetch', len)
+    def fetch_page(self, fail: bool = False) -> bytes:
+        if fail:
+            raise ConnectionError('connection lost')
+        return b'<html></html>'
+
+
+@pytest.fixture
+def enabled_telemetry(tmp_path: Path):
+    telemetry.configure(True, tmp_path / 'metrics.jsonl')
+    yield telemetry
+    telemetry.configure(False)
+
+
+@pytest.mark.parametrize('percentile, expected', [(50, 5), (95, 10), (100, 10), (0, 1)])
+def test_get_percentile(percentile: float, expected: float):
+    assert get_percentile([float(duration) for duration in range(1, 11)], percentile) == expected
+
+
+def test_measured_does_nothing_when_disabled():
+    assert not telemetry.enabled
+    FakeScraper().fetch_page()
+    assert telemetry.measurements == []
+
+
+def test_measured_records_sizes_and_errors(enabled_telemetry: Telemetry, tmp_path: Path):
+    FakeScraper().fetch_page()
+    with pytest.raises(ConnectionError):
+        FakeScraper().fetch_page(fail=True)
+    summary = enabled_telemetry.get_summary()
+    assert summary['fetch']['count'] == 2
+    assert summary['fetch']['size'] == len(b'<html></html>')
+    assert summary['fetch']['errors'] == 1
+
+    enabled_telemetry.close()
+    lines = [json.loads(line) for line in (tmp_path / 'metrics.jsonl').read_text().splitlines()]
+    assert [line['error'] for line in lines] == [None, 'Connection error']
+
+
+class FlakySession(Session):
+    """ A session whose first request fails. """
+
+    def __init__(self):
+        super().__init__()
+        self.failed = False
+
+    def get(self, *args, **kwargs):  # type: ignore
+        if not self.failed:
+            self.failed = True
+            raise ConnectionError('connection reset')
+        return super().get(*args, **kwargs)
+
+
+@pytest.mark.parametrize('extractor', ['soup', 'stream'])
+def test_retried_fetch_is_measured_once(enabled_telemetry: Telemetry, extractor: LectureExtractor, monkeypatch):
+    monkeypatch.setattr(retry, 'retry_policy', RetryPolicy(max_attempts=3, base_delay=0, max_delay=0))
+    with FakeSite() as site:
+        course = Course(site.course_url, FlakySession())
+        course.soup
+        lecture = Lecture(site.course_url, FlakySession(), extractor=extractor)
+        lecture.get_name()
+    summary = enabled_telemetry.get_summary()
+    # Both pages failed once and were fetched on the retry
+    assert summary['fetch']['count'] == 2
+    assert summary['fetch']['retries'] == 2
+    assert summary['fetch']['errors'] == 0
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason='Threads are only profiled before python 3.12')
+def test_profiled_includes_threads(tmp_path: Path):
+    profile_path = tmp_path / 'run.pstats'
+    with profiled(profile_path):
+        thread = Thread(target=FakeScraper().fetch_page)
+        thread.start()
+        thread.join()
+    profiled_functions = {function_name for _, _, function_name in pstats.Stats(str(profile_path)).stats}  # type: ignore
+    # The call made in the thread is profiled along with the calls of the main thread
+    assert 'fetch_page' in profiled_functions
+
+
+@pytest.mark.parametrize('profile_threads', [True, False] if sys.version_info < (3, 12) else [False])
+def test_profiled_with_thread_pool(tmp_path: Path, profile_threads: bool, monkeypatch):
+    monkeypatch.setattr(telemetry_module, 'PROFILE_THREADS', profile_threads)
+    profile_path = tmp_path / 'run.pstats'
+    with profiled(profile_path), ThreadPoolExecutor(max_workers=4) as executor:
+        # Like the workers of a download, which used to hang on python 3.12 and later
+        pages = list(executor.map(lambda _: FakeScraper().fetch_page(), range(8)))
+    assert pages == [b'<html></html>'] * 8
+    profiled_functions = {function_name for _, _, function_name in pstats.Stats(str(profile_path)).stats}  # type: ignore
+    # The main thread is always profiled
+    assert 'submit' in profiled_functions
+    assert ('fetch_page' in profiled_functions) == profile_threads
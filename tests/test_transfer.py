@@ -0,0 +1,139 @@
+import hashlib
+from pathlib import Path
+from requests import Session
+from rich.progress import Progress
+from cwm_downloader import transfer
+from cwm_downloader.exceptions import IncompleteDownloadError
+from cwm_downloader.transfer import (
+    MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, TARGET_READ_TIME, ProgressThrottle,
+    adapt_chunk_size, check_received, get_partial_path, iter_chunks, split_segments,
+    sweep_temporary_files, write_file
+)
+from tests.conftest import download
+import pytest
+
+
+def test_download_file(file_server, file_url: str, tmp_path: Path):
+    file_path = tmp_path / 'lecture.mp4'
+    download(file_url, file_path)
+    assert file_path.read_bytes() == file_server.payload
+    assert not get_partial_path(file_path).exists()
+
+
+@pytest.mark.parametrize('file_server, expected_status', [
+    (True, 206),  # Only the rest of the file is sent
+    (False, 200)  # The whole file is sent again and the download restarts from zero
+], indirect=['file_server'])
+def test_download_file_resumes_partial_file(file_server, file_url: str, tmp_path: Path, expected_status: int):
+    file_path = tmp_path / 'lecture.mp4'
+    get_partial_path(file_path).write_bytes(file_server.payload[:1000])
+    download(file_url, file_path)
+    assert file_server.requests[0]['Range'] == 'bytes=1000-'
+    assert file_server.responses == [expected_status]
+    # Whether the server supports ranges or not the final file must be complete
+    assert file_path.read_bytes() == file_server.payload
+
+
+@pytest.mark.parametrize('size, segments, expected', [
+    (10 * 1024 * 1024, 4, 4),
+    (10 * 1024 * 1024, 100, 10),
+    (1024, 4, 1)
+])
+def test_split_segments(size: int, segments: int, expected: int):
+    file_segments = split_segments(size, segments)
+    assert len(file_segments) == expected
+    assert file_segments[0].start == 0 and file_segments[-1].end == size - 1
+    # The segments must cover the file without gaps or overlaps
+    assert all(previous.end + 1 == current.start for previous, current in zip(file_segments, file_segments[1:]))
+
+
+@pytest.mark.parametrize('file_server, expected_requests', [
+    (True, 5),  # A HEAD request and 4 segments
+    (False, 2)  # A HEAD request and a single download
+], indirect=['file_server'])
+def test_download_file_segmented(file_server, file_url: str, tmp_path: Path, monkeypatch, expected_requests: int):
+    monkeypatch.setattr(transfer, 'MIN_SEGMENT_SIZE', 16 * 1024)
+    file_path = tmp_path / 'lecture.mp4'
+    download(file_url, file_path, segments=4)
+    assert file_path.read_bytes() == file_server.payload
+    assert len(file_server.requests) == expected_requests
+
+
+@pytest.mark.parametrize('chunk_size, elapsed, expected', [
+    (MIN_CHUNK_SIZE, 0, 2 * MIN_CHUNK_SIZE),
+    (MAX_CHUNK_SIZE, 0, MAX_CHUNK_SIZE),
+    (4 * MIN_CHUNK_SIZE, TARGET_READ_TIME, 4 * MIN_CHUNK_SIZE),
+    (4 * MIN_CHUNK_SIZE, 10 * TARGET_READ_TIME, 2 * MIN_CHUNK_SIZE),
+    (MIN_CHUNK_SIZE, 10 * TARGET_READ_TIME, MIN_CHUNK_SIZE)
+])
+def test_adapt_chunk_size(chunk_size: int, elapsed: float, expected: int):
+    assert adapt_chunk_size(chunk_size, elapsed) == expected
+
+
+def test_iter_chunks_grows_on_fast_connections(file_server, file_url: str):
+    response = Session().get(file_url, stream=True)
+    chunk_sizes = [len(chunk) for chunk in iter_chunks(response, 4096)]
+    assert sum(chunk_sizes) == len(file_server.payload)
+    # The chunk size starts at the minimum and doubles since the local server is fast
+    assert chunk_sizes[:2] == [MIN_CHUNK_SIZE, 2 * MIN_CHUNK_SIZE]
+
+
+def test_progress_throttle_batches_updates():
+    with Progress(disable=True) as progress_bar:
+        task_id = progress_bar.add_task('download', total=300)
+        with ProgressThrottle(progress_bar, task_id, interval=60) as progress:
+            for _ in range(3):
+                progress.advance(100)
+            # Nothing is shown until the interval passes or the download stops
+            assert progress_bar.tasks[0].completed == 0
+        assert progress_bar.tasks[0].completed == 300
+
+
+@pytest.mark.parametrize('segments, partial_size', [(1, 0), (1, 1000), (4, 0)])
+def test_download_file_calculates_checksum(file_server, file_url: str, tmp_path: Path, segments: int, partial_size: int):
+    file_path = tmp_path / 'lecture.mp4'
+    if partial_size:
+        get_partial_path(file_path).write_bytes(file_server.payload[:partial_size])
+    transfer_result = download(file_url, file_path, segments, checksum=True)
+    assert transfer_result.sha256 == hashlib.sha256(file_server.payload).hexdigest()
+
+
+@pytest.mark.parametrize('received, headers, incomplete', [
+    (100, {'content-length': '100'}, False),
+    (60, {'content-length': '100'}, True),
+    (60, {}, False),
+    # The Content-Length of a compressed response is not the number of bytes received
+    (300, {'content-length': '100', 'content-encoding': 'gzip'}, False)
+])
+def test_check_received(received: int, headers: dict, incomplete: bool):
+    if incomplete:
+        with pytest.raises(IncompleteDownloadError):
+            check_received('https://example.com/file.mp4', received, headers)
+    else:
+        check_received('https://example.com/file.mp4', received, headers)
+
+
+@pytest.mark.parametrize('fsync', [False, True])
+def test_write_file_keeps_old_file_when_interrupted(tmp_path: Path, monkeypatch, fsync: bool):
+    monkeypatch.setattr(transfer, 'fsync_files', fsync)
+    file_path = tmp_path / 'lecture.html'
+    write_file(file_path, 'old lecture')
+    assert file_path.read_text() == 'old lecture'
+
+    def interrupted_replace(*_):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(transfer.os, 'replace', interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        write_file(file_path, 'new lecture')
+    assert file_path.read_text() == 'old lecture'
+    assert [path.name for path in tmp_path.iterdir()] == ['lecture.html']
+
+
+def test_sweep_temporary_files_keeps_resumable_files(tmp_path: Path):
+    section_dir = tmp_path / '1-Getting Started'
+    section_dir.mkdir()
+    for name in ('1- Welcome.mp4.part', '2- Setup.mp4.segments.part', '3- Notes.html.tmp', '4- Intro.mp4'):
+        (section_dir / name).write_bytes(b'video')
+    (tmp_path / '.cwm-manifest.json.tmp').write_text('{}')
+    sweep_temporary_files(tmp_path)
+    assert sorted(path.name for path in tmp_path.rglob('*') if path.is_file()) == ['1- Welcome.mp4.part', '4- Intro.mp4']
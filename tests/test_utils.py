@@ -0,0 +1,42 @@
+from functools import partial
+import pytest
+from cwm_downloader.utils import download_cancelled, get_course_progress_bar, get_progress_bar, initialize_session, run_lecture_jobs
+
+
+def test_initialize_session_mounts_tuned_adapter():
+    session = initialize_session(pool_size=32, http_retries=5)
+    http_adapter = session.get_adapter('https://members.codewithmosh.com')
+    assert http_adapter._pool_maxsize == 32  # type: ignore
+    assert http_adapter.max_retries.connect == 5  # type: ignore
+    # Everything but opening connections is retried by handle_network_errors
+    assert http_adapter.max_retries.read == 0 and http_adapter.max_retries.status == 0  # type: ignore
+    assert 'POST' not in http_adapter.max_retries.allowed_methods  # type: ignore
+
+
+def test_run_lecture_jobs_advances_each_course():
+    course_progress_bar = get_course_progress_bar()
+    course_task_ids = [course_progress_bar.add_task('course', filename=f'course {index}', total=2) for index in range(2)]
+    downloaded = []
+
+    def download(name: str, progress_bar):
+        downloaded.append(name)
+
+    jobs = [(partial(download, f'lecture {index}'), course_task_ids[index % 2]) for index in range(4)]
+    run_lecture_jobs(jobs, 2, course_progress_bar, get_progress_bar())
+    assert sorted(downloaded) == ['lecture 0', 'lecture 1', 'lecture 2', 'lecture 3']
+    assert [course_progress_bar.tasks[task_id].completed for task_id in course_task_ids] == [2, 2]
+    assert not download_cancelled.is_set()
+
+
+def test_run_lecture_jobs_cancels_the_rest_on_error():
+    course_progress_bar = get_course_progress_bar()
+    course_task_id = course_progress_bar.add_task('course', filename='course', total=3)
+
+    def download(progress_bar):
+        raise ValueError('bug')
+
+    with pytest.raises(ValueError):
+        run_lecture_jobs([(download, course_task_id)] * 3, 1, course_progress_bar, get_progress_bar())
+    # The running downloads are told to stop
+    assert download_cancelled.is_set()
+    download_cancelled.clear()
@@ -0,0 +1,35 @@
+import hashlib
+from pathlib import Path
+from cwm_downloader.manifest import Manifest
+from cwm_downloader.verify import verify_course
+
+lecture_url = 'https://members.codewithmosh.com/courses/783424/lectures/14779988'
+
+
+def record_video(course_dir: Path, content: bytes) -> Path:
+    file_path = course_dir / '1-Getting Started' / '1- Welcome.mp4'
+    file_path.parent.mkdir()
+    file_path.write_bytes(content)
+    manifest = Manifest(course_dir)
+    manifest.record_file(lecture_url, file_path, 'https://cdn.fs.teachablecdn.com/video', len(content), sha256=hashlib.sha256(content).hexdigest())
+    manifest.record_lecture(lecture_url, '1- Welcome', 'video', True)
+    manifest.save()
+    return file_path
+
+
+def test_verify_course_accepts_complete_files(tmp_path: Path):
+    record_video(tmp_path, b'video')
+    assert verify_course(tmp_path, checksum=True) == []
+    assert Manifest.load(tmp_path).is_complete(lecture_url)
+
+
+def test_verify_course_marks_damaged_files_incomplete(tmp_path: Path):
+    file_path = record_video(tmp_path, b'video')
+    # The same size with different content is only caught by the checksum
+    file_path.write_bytes(b'vidoe')
+    assert verify_course(tmp_path) == []
+    assert verify_course(tmp_path, checksum=True) == [('1-Getting Started/1- Welcome.mp4', 'checksum mismatch')]
+    assert not Manifest.load(tmp_path).is_complete(lecture_url)
+    # The lecture stays incomplete even after the file is fixed, until it's synced again
+    file_path.write_bytes(b'video')
+    assert not Manifest.load(tmp_path).is_complete(lecture_url)